@@ -0,0 +1,355 @@
+"""
+Name statistics, for one name or for whole lists of names.
+
+analyze_name and generate_fun_facts back the ?name= page. analyze_names
+computes the same stats for a batch of names at once: with NumPy
+installed the batch becomes one array of code points, and every count is a
+table lookup plus a cumulative sum per name; without NumPy each name goes
+through analyze_name. Both give identical results.
+
+iter_names and iter_output read and write CSV or NDJSON chunk by chunk,
+so lists of any size are processed in bounded memory. The same code backs
+POST /api/analyze/bulk and the command line:
+
+    python name_stats.py customers.csv --output stats.ndjson
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from collections import Counter
+
+try:
+    import numpy as np  # optional, vectorizes analyze_names
+except ImportError:
+    np = None
+
+VOWELS = frozenset('aeiou')
+CHUNK_SIZE = 10000
+FORMATS = ('csv', 'ndjson')
+# Columns of a bulk result row, in CSV order
+RESULT_FIELDS = (
+    'name', 'total_chars', 'letters_only', 'vowels', 'consonants', 'words',
+    'ascii_sum', 'is_palindrome', 'most_common', 'most_common_count'
+)
+
+
+def normalize_name(name):
+    """Trim surrounding whitespace, as the page always did
+
+    No Unicode normalization: NFC would merge decomposed characters
+    (e + combining accent) and change total_chars and the counts.
+    """
+    return name.strip()
+
+
+def analyze_name(name):
+    """Cool function to analyze name statistics, in a single pass over the name"""
+    vowels = consonants = letters = words = ascii_sum = 0
+    char_freq = {}
+    clean_chars = []
+    unique_chars = set()
+    in_word = False
+
+    for char in name:
+        if char.isalpha():
+            letters += 1
+            ascii_sum += ord(char)
+
+        lower = char.lower()
+        for part in lower:  # lower() can expand a character (İ -> i + dot)
+            if part in VOWELS:
+                vowels += 1
+            elif part.isalpha():
+                consonants += 1
+            if part != ' ':
+                char_freq[part] = char_freq.get(part, 0) + 1
+
+        if char.isspace():
+            in_word = False
+            continue
+        if not in_word:
+            words += 1
+            in_word = True
+        clean_chars.append(lower)
+        unique_chars.update(char.upper())
+
+    # First letter to reach the top count wins ties, like Counter.most_common
+    most_common = max(char_freq.items(), key=lambda item: item[1]) if char_freq else None
+    clean_name = ''.join(clean_chars)
+
+    return {
+        'total_chars': len(name),
+        'letters_only': letters,
+        'vowels': vowels,
+        'consonants': consonants,
+        'words': words,
+        'most_common': most_common,
+        'ascii_sum': ascii_sum,
+        'is_palindrome': len(clean_name) > 1 and clean_name == clean_name[::-1],
+        'unique_chars': sorted(unique_chars)
+    }
+
+
+def generate_fun_facts(name, stats):
+    """Generate fun facts about the name"""
+    facts = []
+
+    # Character frequency analysis
+    if stats['most_common']:
+        char, count = stats['most_common']
+        facts.append(f"The letter '{char.upper()}' appears most frequently ({count} time{'s' if count > 1 else ''})!")
+
+    # Vowel to consonant ratio
+    if stats['consonants'] > 0:
+        ratio = round(stats['vowels'] / stats['consonants'], 2)
+        facts.append(f"Your vowel-to-consonant ratio is {ratio}, {'very melodious' if ratio > 0.8 else 'nicely balanced'}!")
+
+    # Name length analysis
+    if stats['letters_only'] <= 4:
+        facts.append("Short and sweet! Studies show shorter names are easier to remember.")
+    elif stats['letters_only'] <= 8:
+        facts.append("Perfect length! Your name is memorable and easy to pronounce.")
+    else:
+        facts.append("Majestic and distinguished! Longer names are often associated with elegance.")
+
+    # ASCII value fun
+    facts.append(f"The ASCII value sum of your name is {stats['ascii_sum']} - that's unique!")
+
+    # Palindrome check
+    if stats['is_palindrome']:
+        facts.append("🎊 WOW! Your name is a palindrome - it reads the same forwards and backwards!")
+
+    return facts
+
+
+# ==================== BATCHES ====================
+
+_tables = None
+TABLE_SIZE = 0x10000  # the Basic Multilingual Plane; rarer code points take the scalar path
+
+
+def character_tables():
+    """Per code point: is alpha, is space, vowels and consonants in its lower()"""
+    global _tables
+    if _tables is None:
+        is_alpha = np.zeros(TABLE_SIZE, dtype=bool)
+        is_space = np.zeros(TABLE_SIZE, dtype=bool)
+        vowels = np.zeros(TABLE_SIZE, dtype=np.int8)
+        consonants = np.zeros(TABLE_SIZE, dtype=np.int8)
+        for code in range(TABLE_SIZE):
+            char = chr(code)
+            is_alpha[code] = char.isalpha()
+            is_space[code] = char.isspace()
+            for part in char.lower():
+                if part in VOWELS:
+                    vowels[code] += 1
+                elif part.isalpha():
+                    consonants[code] += 1
+        _tables = is_alpha, is_space, vowels, consonants
+    return _tables
+
+
+def analyze_names(names, vectorized=None):
+    """analyze_name for a list of names, without unique_chars
+
+    vectorized=None uses NumPy when it is installed; True requires it.
+    """
+    if vectorized is None:
+        vectorized = np is not None
+    if not vectorized or not names:
+        return [_without_unique_chars(analyze_name(name)) for name in names]
+    if np is None:
+        raise RuntimeError('NumPy is not installed')
+
+    is_alpha, is_space, vowel_table, consonant_table = character_tables()
+    lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    codes = np.frombuffer(''.join(names).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    beyond_table = codes >= TABLE_SIZE
+    lookup = np.where(beyond_table, 0, codes)
+
+    alpha = is_alpha[lookup]
+    space = is_space[lookup]
+    # A word starts at a non-space whose predecessor is a space or the start of the name
+    after_space = np.empty_like(space)
+    after_space[1:] = space[:-1]
+    after_space[bounds[:-1][lengths > 0]] = True
+
+    letters = _segment_sums(alpha, bounds)
+    ascii_sums = _segment_sums(np.where(alpha, codes, 0), bounds)
+    vowels = _segment_sums(vowel_table[lookup], bounds)
+    consonants = _segment_sums(consonant_table[lookup], bounds)
+    words = _segment_sums(~space & after_space, bounds)
+    scalar = _segment_sums(beyond_table, bounds) > 0
+
+    results = []
+    for position, name in enumerate(names):
+        if scalar[position]:
+            results.append(_without_unique_chars(analyze_name(name)))
+            continue
+        lower = name.lower()
+        clean_name = ''.join(lower.split())
+        frequencies = Counter(lower.replace(' ', ''))
+        results.append({
+            'total_chars': len(name),
+            'letters_only': int(letters[position]),
+            'vowels': int(vowels[position]),
+            'consonants': int(consonants[position]),
+            'words': int(words[position]),
+            'most_common': frequencies.most_common(1)[0] if frequencies else None,
+            'ascii_sum': int(ascii_sums[position]),
+            'is_palindrome': len(clean_name) > 1 and clean_name == clean_name[::-1]
+        })
+    return results
+
+
+def _segment_sums(values, bounds):
+    """Sum of values[bounds[i]:bounds[i + 1]] for every i (empty segments give 0)"""
+    totals = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    return totals[bounds[1:]] - totals[bounds[:-1]]
+
+
+def _without_unique_chars(stats):
+    del stats['unique_chars']
+    return stats
+
+
+# ==================== INPUT AND OUTPUT ====================
+
+def detect_format(filename=None, mimetype=None, default='csv'):
+    """csv or ndjson from a file name or a MIME type"""
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension in ('ndjson', 'jsonl', 'json'):
+            return 'ndjson'
+        if extension in ('csv', 'txt'):
+            return 'csv'
+    if mimetype:
+        if 'json' in mimetype:
+            return 'ndjson'
+        if mimetype in ('text/csv', 'text/plain'):
+            return 'csv'
+    return default
+
+
+def iter_names(stream, input_format, column='name'):
+    """Trimmed, non-blank names from a text stream of CSV or NDJSON
+
+    CSV: if the first row contains `column` it is a header and that column
+    is read, otherwise every row's first cell is a name. NDJSON: each line
+    is a JSON string or an object with a `column` key. Raises ValueError
+    for malformed input.
+    """
+    if input_format == 'csv':
+        reader = csv.reader(stream)
+        index = 0
+        for row in reader:
+            if reader.line_num == 1 and column in row:
+                index = row.index(column)
+                continue
+            if len(row) > index:
+                name = normalize_name(row[index])
+                if name:
+                    yield name
+    elif input_format == 'ndjson':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError(f'line {line_number} is not valid JSON')
+            if isinstance(record, dict):
+                record = record.get(column)
+            if not isinstance(record, str):
+                raise ValueError(f'line {line_number} has no "{column}" string')
+            name = normalize_name(record)
+            if name:
+                yield name
+    else:
+        raise ValueError(f'unknown format {input_format!r}, expected one of {", ".join(FORMATS)}')
+
+
+def iter_chunks(names, chunk_size=CHUNK_SIZE):
+    chunk = []
+    for name in names:
+        chunk.append(name)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_results(names, chunk_size=CHUNK_SIZE, facts=False, vectorized=None):
+    """Lists of result rows, one list per chunk of names"""
+    for chunk in iter_chunks(names, chunk_size):
+        rows = []
+        for name, stats in zip(chunk, analyze_names(chunk, vectorized)):
+            row = {'name': name}
+            row.update(stats)
+            if facts:
+                row['fun_facts'] = generate_fun_facts(name, stats)
+            most_common = row.pop('most_common')
+            row['most_common'], row['most_common_count'] = most_common or (None, 0)
+            rows.append(row)
+        yield rows
+
+
+def iter_output(results, output_format, facts=False):
+    """Text chunks of CSV (with a header) or NDJSON, one per chunk of results"""
+    if output_format == 'ndjson':
+        for rows in results:
+            yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+    elif output_format == 'csv':
+        fields = RESULT_FIELDS + (('fun_facts',) if facts else ())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for rows in results:
+            for row in rows:
+                if facts:
+                    row['fun_facts'] = ' | '.join(row['fun_facts'])
+                writer.writerow([row[field] for field in fields])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()  # header only: the input had no names
+    else:
+        raise ValueError(f'unknown format {output_format!r}, expected one of {", ".join(FORMATS)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Name Transformer statistics for a list of names')
+    parser.add_argument('input', help='CSV or NDJSON file of names, - for stdin')
+    parser.add_argument('--output', '-o', help='write here instead of stdout')
+    parser.add_argument('--input-format', choices=FORMATS, help='default: from the file extension, else csv')
+    parser.add_argument('--output-format', choices=FORMATS, default='ndjson')
+    parser.add_argument('--column', default='name', help='CSV header or NDJSON key holding the name')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--facts', action='store_true', help='include the fun facts for every name')
+    parser.add_argument('--no-numpy', action='store_true', help='analyze name by name even if NumPy is installed')
+    args = parser.parse_args()
+
+    input_format = args.input_format or detect_format(None if args.input == '-' else args.input)
+    source = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    target = sys.stdout if args.output is None else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        names = iter_names(source, input_format, args.column)
+        results = iter_results(names, args.chunk_size, args.facts, vectorized=False if args.no_numpy else None)
+        for text in iter_output(results, args.output_format, args.facts):
+            target.write(text)
+    except ValueError as e:
+        parser.exit(1, f'error: {e}\n')
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,27 @@
-from flask import Flask, request, render_template_string
-import random
-from collections import Counter
+from flask import Flask, request, render_template, Response, jsonify, stream_with_context
+import io
+import json
+from functools import lru_cache
+from response_cache import init_response_cache
+from name_stats import (
+    analyze_name, generate_fun_facts, normalize_name,
+    detect_format, iter_names, iter_results, iter_output, FORMATS
+)
 
 app = Flask(__name__)
+app.config['NAME_CACHE_SIZE'] = 1024  # analyzed names kept in memory
+app.config['BULK_CHUNK_SIZE'] = 10000  # names analyzed (and streamed back) at a time
+app.config['MAX_CONTENT_LENGTH'] = 256 * 1024 * 1024  # bulk uploads
+
+# Rendered pages and static files, stored pre-compressed (gzip, brotli if installed)
+app.config['RESPONSE_CACHE_SIZE'] = 256
+app.config['RESPONSE_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
+
+response_cache = init_response_cache(
+    app,
+    max_entries=app.config['RESPONSE_CACHE_SIZE'],
+    max_bytes=app.config['RESPONSE_CACHE_MAX_BYTES']
+)
 
 # HTML Template with cool styling
 HTML_TEMPLATE = """
@@ -12,223 +31,7 @@ HTML_TEMPLATE = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>✨ Name Transformer Pro ✨</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-            animation: gradientShift 15s ease infinite;
-        }
-
-        @keyframes gradientShift {
-            0%, 100% { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); }
-            50% { background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); }
-        }
-
-        .container {
-            max-width: 900px;
-            margin: 40px auto;
-            background: white;
-            border-radius: 20px;
-            padding: 40px;
-            box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-            animation: slideUp 0.5s ease;
-        }
-
-        @keyframes slideUp {
-            from { opacity: 0; transform: translateY(30px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-
-        h1 {
-            text-align: center;
-            color: #667eea;
-            margin-bottom: 10px;
-            font-size: 2.5em;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-        }
-
-        .subtitle {
-            text-align: center;
-            color: #666;
-            margin-bottom: 30px;
-            font-style: italic;
-        }
-
-        .result-box {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 30px;
-            border-radius: 15px;
-            margin: 30px 0;
-            text-align: center;
-            animation: pulse 0.5s ease;
-        }
-
-        @keyframes pulse {
-            0% { transform: scale(0.95); }
-            50% { transform: scale(1.02); }
-            100% { transform: scale(1); }
-        }
-
-        .uppercase-name {
-            font-size: 3em;
-            font-weight: bold;
-            letter-spacing: 5px;
-            margin: 20px 0;
-            text-shadow: 3px 3px 6px rgba(0,0,0,0.2);
-        }
-
-        .feature-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-            gap: 20px;
-            margin: 30px 0;
-        }
-
-        .feature-card {
-            background: #f8f9fa;
-            padding: 20px;
-            border-radius: 12px;
-            border-left: 4px solid #667eea;
-            transition: transform 0.3s ease, box-shadow 0.3s ease;
-        }
-
-        .feature-card:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 10px 25px rgba(0,0,0,0.1);
-        }
-
-        .feature-title {
-            color: #667eea;
-            font-weight: bold;
-            font-size: 1.1em;
-            margin-bottom: 10px;
-            display: flex;
-            align-items: center;
-        }
-
-        .feature-content {
-            color: #333;
-            font-size: 1.3em;
-            font-weight: 600;
-        }
-
-        .fun-facts {
-            background: #fff3cd;
-            border: 2px dashed #ffc107;
-            border-radius: 12px;
-            padding: 20px;
-            margin: 20px 0;
-        }
-
-        .fun-facts h3 {
-            color: #ff6b6b;
-            margin-bottom: 15px;
-        }
-
-        .fun-facts ul {
-            list-style: none;
-            padding: 0;
-        }
-
-        .fun-facts li {
-            padding: 8px 0;
-            color: #555;
-            position: relative;
-            padding-left: 25px;
-        }
-
-        .fun-facts li:before {
-            content: "🎯";
-            position: absolute;
-            left: 0;
-        }
-
-        .try-form {
-            background: #e9ecef;
-            padding: 25px;
-            border-radius: 12px;
-            margin-top: 30px;
-        }
-
-        .try-form h3 {
-            color: #667eea;
-            margin-bottom: 15px;
-        }
-
-        .try-form input {
-            width: 70%;
-            padding: 12px;
-            border: 2px solid #ddd;
-            border-radius: 8px;
-            font-size: 1em;
-            margin-right: 10px;
-        }
-
-        .try-form button {
-            padding: 12px 30px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            border-radius: 8px;
-            font-size: 1em;
-            cursor: pointer;
-            transition: transform 0.2s;
-        }
-
-        .try-form button:hover {
-            transform: scale(1.05);
-        }
-
-        .char-badges {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 10px;
-            justify-content: center;
-            margin: 20px 0;
-        }
-
-        .badge {
-            background: rgba(255,255,255,0.3);
-            padding: 8px 15px;
-            border-radius: 20px;
-            font-weight: bold;
-            animation: fadeIn 0.5s ease;
-        }
-
-        @keyframes fadeIn {
-            from { opacity: 0; transform: scale(0.8); }
-            to { opacity: 1; transform: scale(1); }
-        }
-
-        .no-name {
-            text-align: center;
-            color: #666;
-            padding: 60px 20px;
-        }
-
-        .no-name h2 {
-            color: #667eea;
-            margin-bottom: 15px;
-        }
-
-        .example {
-            background: #e3f2fd;
-            padding: 15px;
-            border-radius: 8px;
-            margin-top: 20px;
-            color: #1976d2;
-            font-family: monospace;
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset_url('css/style.css') }}">
 </head>
 <body>
     <div class="container">
@@ -305,75 +108,79 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def analyze_name(name):
-    """Cool function to analyze name statistics"""
-    vowels = sum(1 for char in name.lower() if char in 'aeiou')
-    consonants = sum(1 for char in name.lower() if char.isalpha() and char not in 'aeiou')
-
+# Parsed and compiled once; render_template_string would re-parse it on every request
+PAGE_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+@lru_cache(maxsize=app.config['NAME_CACHE_SIZE'])
+def transform_name(name):
+    """
+    Everything the result page shows for a trimmed name.
+    
+    Analysis is deterministic, so repeated names are served from an LRU
+    cache. The result is shared between requests and must not be mutated.
+    """
+    stats = analyze_name(name)
     return {
-        'total_chars': len(name),
-        'letters_only': sum(1 for char in name if char.isalpha()),
-        'vowels': vowels,
-        'consonants': consonants,
-        'words': len(name.split())
+        'name': name,
+        'uppercase_name': name.upper(),
+        'stats': stats,
+        'reversed_name': name[::-1],
+        'unique_chars': stats['unique_chars'],
+        'fun_facts': generate_fun_facts(name, stats)
     }
 
-def generate_fun_facts(name, stats):
-    """Generate fun facts about the name"""
-    facts = []
-
-    # Character frequency analysis
-    char_freq = Counter(name.lower().replace(' ', ''))
-    if char_freq:
-        most_common = char_freq.most_common(1)[0]
-        facts.append(f"The letter '{most_common[0].upper()}' appears most frequently ({most_common[1]} time{'s' if most_common[1] > 1 else ''})!")
-
-    # Vowel to consonant ratio
-    if stats['consonants'] > 0:
-        ratio = round(stats['vowels'] / stats['consonants'], 2)
-        facts.append(f"Your vowel-to-consonant ratio is {ratio}, {'very melodious' if ratio > 0.8 else 'nicely balanced'}!")
-
-    # Name length analysis
-    if stats['letters_only'] <= 4:
-        facts.append("Short and sweet! Studies show shorter names are easier to remember.")
-    elif stats['letters_only'] <= 8:
-        facts.append("Perfect length! Your name is memorable and easy to pronounce.")
-    else:
-        facts.append("Majestic and distinguished! Longer names are often associated with elegance.")
-
-    # ASCII value fun
-    ascii_sum = sum(ord(char) for char in name if char.isalpha())
-    facts.append(f"The ASCII value sum of your name is {ascii_sum} - that's unique!")
-
-    # Palindrome check
-    clean_name = ''.join(name.lower().split())
-    if clean_name == clean_name[::-1] and len(clean_name) > 1:
-        facts.append("🎊 WOW! Your name is a palindrome - it reads the same forwards and backwards!")
-
-    return facts
-
 @app.route('/')
+@response_cache.cached()
 def index():
-    name = request.args.get('name', '').strip()
+    name = normalize_name(request.args.get('name', ''))
 
     if name:
-        uppercase_name = name.upper()
-        stats = analyze_name(name)
-        reversed_name = name[::-1]
-        unique_chars = sorted(set(char for char in uppercase_name if char.strip()))
-        fun_facts = generate_fun_facts(name, stats)
-
-        return render_template_string(
-            HTML_TEMPLATE,
-            name=name,
-            uppercase_name=uppercase_name,
-            stats=stats,
-            reversed_name=reversed_name,
-            unique_chars=unique_chars,
-            fun_facts=fun_facts
-        )
+        return render_template(PAGE_TEMPLATE, **transform_name(name))
+    else:
+        return render_template(PAGE_TEMPLATE, name=None)
+
+@app.route('/api/analyze/bulk', methods=['POST'])
+def analyze_bulk():
+    """
+    Stats for a whole list of names, streamed back as they are computed.
+    
+    Send the list as a multipart upload named `file` or as the raw request
+    body, in CSV (a `name` header column, or one name per line) or NDJSON
+    (strings or {"name": ...} objects); the format comes from ?input=, the
+    file name or the Content-Type. ?format=csv returns CSV instead of
+    NDJSON, ?facts=1 adds the fun facts and ?column= names the input column.
+    Blank names are skipped; results keep the input order.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        input_format = request.args.get('input') or detect_format(upload.filename, upload.mimetype)
+        raw = upload.stream
     else:
-        return render_template_string(HTML_TEMPLATE, name=None)
+        input_format = request.args.get('input') or detect_format(mimetype=request.mimetype)
+        raw = request.stream
+    output_format = request.args.get('format', 'ndjson')
+    if input_format not in FORMATS or output_format not in FORMATS:
+        return jsonify({'error': f'Formats must be one of: {", ".join(FORMATS)}'}), 400
+    facts = request.args.get('facts') in ('1', 'true')
+    column = request.args.get('column', 'name')
+    
+    def generate():
+        source = io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline='')
+        names = iter_names(source, input_format, column)
+        results = iter_results(names, app.config['BULK_CHUNK_SIZE'], facts)
+        try:
+            yield from iter_output(results, output_format, facts)
+        except ValueError as e:
+            # The status line is already sent; end the stream with an error record
+            if output_format == 'ndjson':
+                yield json.dumps({'error': str(e)}) + '\n'
+            else:
+                yield f'# error: {e}\n'
+    
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a reverse proxy buffer the stream
+    return response
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
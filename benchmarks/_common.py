@@ -0,0 +1,49 @@
+"""
+Helpers shared by the benchmark scripts in this folder.
+
+Every script prints a JSON report so results from two commits can be
+compared with a plain diff (or saved with --output).
+"""
+import json
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_app_path(app_dir):
+    """Make an app folder importable; the apps import their sibling modules by name"""
+    path = os.path.join(REPO_ROOT, app_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return path
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (ms) for a list of latencies in seconds"""
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'throughput_per_s': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0
+    }
+
+
+def emit(report, output=None):
+    """Print the report as JSON and optionally write it to a file"""
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
@@ -0,0 +1,101 @@
+"""
+Click recording throughput for url_shortener_with_login.
+
+Seeds --rows mappings, then records clicks on Zipf-distributed codes
+through the app's ClickAggregator for --seconds, either as fast as one
+thread can (--rate 0) or paced at --rate clicks per second. Every flush
+writes click_count, the click_event log and the hourly and daily rollups;
+the report gives the flush latencies and busy_fraction, the share of wall
+time spent flushing. A busy_fraction well under 1 at the target rate means
+the rollups keep up. The rollup totals are checked against the clicks
+recorded.
+
+Usage:
+    python benchmarks/click_rollup.py --rows 100000 --rate 5000
+    python benchmarks/click_rollup.py --rate 0 --seconds 20
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from _common import emit, summarize
+from shortener_load import ZipfCodes, load_app, seed
+
+APP = 'url_shortener_with_login'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Click log and rollup throughput')
+    parser.add_argument('--rows', type=int, default=100000, help='mappings to seed')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rate', type=float, default=5000, help='clicks per second, 0 for unpaced')
+    parser.add_argument('--zipf-s', type=float, default=1.1)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='click-rollup-')
+    db_path = os.path.join(workdir, 'bench.db')
+    try:
+        app_module = load_app(APP, db_path)
+        seed(app_module, db_path, args.rows, args.users)
+        zipf = ZipfCodes(args.rows, args.zipf_s)
+
+        flush_latencies = []
+        flush_clicks = app_module.flush_clicks
+
+        def timed_flush(batch):
+            start = time.perf_counter()
+            flush_clicks(batch)
+            flush_latencies.append(time.perf_counter() - start)
+
+        aggregator = app_module.click_aggregator
+        aggregator.flush_fn = timed_flush
+        rng = random.Random(1)
+        codes = [zipf.draw(rng) for _ in range(100000)]
+
+        recorded = 0
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if args.rate and recorded >= (now - started) * args.rate:
+                time.sleep(0.0005)
+                continue
+            aggregator.record(codes[recorded % len(codes)])
+            recorded += 1
+        elapsed = time.perf_counter() - started
+        aggregator.stop()
+
+        conn = sqlite3.connect(db_path)
+        event_rows, event_clicks = conn.execute('SELECT count(*), sum(clicks) FROM click_event').fetchone()
+        rollups = dict(conn.execute(
+            'SELECT resolution, sum(clicks) FROM click_rollup GROUP BY resolution'
+        ).fetchall())
+        rollup_rows = conn.execute('SELECT count(*) FROM click_rollup').fetchone()[0]
+        conn.close()
+
+        report = {
+            'config': vars(args),
+            'cpus': os.cpu_count(),
+            'clicks_recorded': recorded,
+            'clicks_per_s': round(recorded / elapsed, 1),
+            'flush': summarize(flush_latencies, elapsed),
+            'busy_fraction': round(sum(flush_latencies) / elapsed, 4),
+            'click_event_rows': event_rows,
+            'click_rollup_rows': rollup_rows,
+            'consistent': event_clicks == recorded and all(total == recorded for total in rollups.values())
+        }
+    finally:
+        shutil.rmtree(workdir)
+    emit(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Redirect latency during a login storm on url_shortener_with_login.
+
+Serves the app on a local threaded server and measures GET /s/<code>
+latency for --seconds with redirect clients alone, then for another
+--seconds while --storm clients send POST /api/login as fast as they can.
+With hashing on the bounded PasswordHasher pool the redirect percentiles
+should barely move and surplus logins come back as 503; compare with
+--hash-workers set to --storm (effectively unbounded) to see the old
+behaviour.
+
+Usage:
+    python benchmarks/login_storm.py --rows 100000 --clients 4 --storm 32
+    python benchmarks/login_storm.py --storm 32 --hash-workers 32 --hash-queue 0
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from _common import emit, summarize
+from shortener_load import BENCH_PASSWORD, HttpTransport, ZipfCodes, load_app, seed
+
+APP = 'url_shortener_with_login'
+
+
+def serve(db_path, hash_workers, hash_queue, port_queue):
+    """Child process: the app on a threaded Werkzeug server, optionally with another hasher"""
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app_module = load_app(APP, db_path)
+    if hash_workers:
+        app_module.password_hasher = app_module.PasswordHasher(
+            size=hash_workers,
+            max_queue=hash_queue,
+            method=app_module.app.config['PASSWORD_HASH_METHOD']
+        )
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def redirect_client(port, zipf, deadline, results, seed_value):
+    transport = HttpTransport(port)
+    rng = random.Random(seed_value)
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        status, _ = transport.request('GET', f'/s/{zipf.draw(rng)}')
+        latencies.append(time.perf_counter() - start)
+        errors += status != 302
+    results.append((latencies, {'errors': errors}))
+
+
+def login_client(port, users, deadline, results, seed_value):
+    transport = HttpTransport(port)
+    rng = random.Random(seed_value)
+    latencies, statuses = [], {}
+    while time.time() < deadline:
+        start = time.perf_counter()
+        status, _ = transport.request('POST', '/api/login', {
+            'username': f'bench{rng.randrange(users):04d}',
+            'password': BENCH_PASSWORD
+        })
+        latencies.append(time.perf_counter() - start)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    results.append((latencies, statuses))
+
+
+def merge(results, elapsed):
+    report = summarize([value for latencies, _ in results for value in latencies], elapsed)
+    for _, counts in results:
+        for key, count in counts.items():
+            report[key] = report.get(key, 0) + count
+    return report
+
+
+def run_phase(port, args, zipf, storm):
+    redirects, logins = [], []
+    deadline = time.time() + args.seconds
+    threads = [
+        threading.Thread(target=redirect_client, args=(port, zipf, deadline, redirects, number))
+        for number in range(args.clients)
+    ]
+    if storm:
+        threads += [
+            threading.Thread(target=login_client, args=(port, args.users, deadline, logins, number))
+            for number in range(args.storm)
+        ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = {'redirect': merge(redirects, elapsed)}
+    if storm:
+        report['login'] = merge(logins, elapsed)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Redirect latency during a login storm')
+    parser.add_argument('--rows', type=int, default=100000, help='mappings to seed')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=10, help='length of each phase')
+    parser.add_argument('--clients', type=int, default=4, help='threads sending redirects')
+    parser.add_argument('--storm', type=int, default=32, help='threads sending logins')
+    parser.add_argument('--hash-workers', type=int, help='override PASSWORD_HASH_WORKERS')
+    parser.add_argument('--hash-queue', type=int, default=8, help='with --hash-workers')
+    parser.add_argument('--zipf-s', type=float, default=1.1)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='login-storm-')
+    db_path = os.path.join(workdir, 'bench.db')
+    app_module = load_app(APP, db_path)
+    seed(app_module, db_path, args.rows, args.users)
+    zipf = ZipfCodes(args.rows, args.zipf_s)
+
+    # spawn: a forked child would inherit the parent's app state but not its threads
+    context = multiprocessing.get_context('spawn')
+    port_queue = context.Queue()
+    server = context.Process(
+        target=serve, args=(db_path, args.hash_workers, args.hash_queue, port_queue), daemon=True
+    )
+    server.start()
+    port = port_queue.get(timeout=60)
+    try:
+        report = {
+            'config': vars(args),
+            'cpus': os.cpu_count(),
+            'baseline': run_phase(port, args, zipf, storm=False),
+            'during_storm': run_phase(port, args, zipf, storm=True)
+        }
+    finally:
+        server.terminate()
+        server.join()
+        shutil.rmtree(workdir)
+    emit(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Bulk name analysis: batched (and NumPy) stats against the per-name loop.
+
+Generates --names synthetic customer names and times
+    loop       analyze_name for one name at a time, as the ?name= page does
+    batched    analyze_names over --chunk-size chunks without NumPy
+    numpy      the same with NumPy (skipped when it is not installed)
+then runs the command line (name_stats.py) over a CSV of the names in a
+child process, for end-to-end throughput and its peak memory, which
+should stay flat as --names grows because the file is streamed in chunks.
+
+Usage:
+    python benchmarks/name_bulk.py --names 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import add_app_path, emit
+
+APP_DIR = 'Name Transformer Flask App'
+FIRST = ['Rahul', 'Priya', 'Anna', 'Mohammed', 'José', 'Zoë', 'Wei', 'Olga', 'Aarav', 'Siobhán', 'Otto', 'Hannah']
+LAST = ['Sharma', 'Smith', 'García', 'Müller', 'Nguyen', 'Kowalski', 'Okafor', 'Ivanova', 'Tanaka', 'Rossi']
+
+
+def make_names(count, rng):
+    names = []
+    for _ in range(count):
+        parts = [rng.choice(FIRST)]
+        if rng.random() < 0.3:
+            parts.append(rng.choice(FIRST))
+        parts.append(rng.choice(LAST))
+        names.append(' '.join(parts))
+    return names
+
+
+def timed(function):
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def rate(count, seconds):
+    return {'seconds': round(seconds, 3), 'names_per_s': round(count / seconds) if seconds else 0}
+
+
+# ru_maxrss of a child forked from this (large) process would count our own
+# pages, so a small intermediate interpreter starts the CLI and reports it
+MEASURE_CHILD = (
+    'import resource, subprocess, sys; '
+    'subprocess.run(sys.argv[1:], check=True); '
+    'print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)'
+)
+
+
+def run_cli(app_path, csv_path):
+    """Seconds and peak RSS (MiB) of name_stats.py over the CSV, output discarded"""
+    command = [sys.executable, os.path.join(app_path, 'name_stats.py'), csv_path, '--output', os.devnull]
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', MEASURE_CHILD] + command,
+                            check=True, capture_output=True, text=True).stdout
+    seconds = time.perf_counter() - started
+    return seconds, round(int(output) / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk name analysis throughput')
+    parser.add_argument('--names', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    app_path = add_app_path(APP_DIR)
+    import name_stats
+
+    names = make_names(args.names, random.Random(42))
+    chunks = [names[start:start + args.chunk_size] for start in range(0, len(names), args.chunk_size)]
+    report = {'config': vars(args), 'numpy': name_stats.np is not None}
+
+    report['loop'] = rate(args.names, timed(lambda: [name_stats.analyze_name(name) for name in names]))
+    report['batched'] = rate(args.names, timed(
+        lambda: [name_stats.analyze_names(chunk, vectorized=False) for chunk in chunks]
+    ))
+    if name_stats.np is not None:
+        name_stats.character_tables()  # built once per process; not part of the per-batch cost
+        report['numpy'] = rate(args.names, timed(
+            lambda: [name_stats.analyze_names(chunk, vectorized=True) for chunk in chunks]
+        ))
+
+    fd, csv_path = tempfile.mkstemp(prefix='names-bench-', suffix='.csv')
+    with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name'])
+        writer.writerows([name] for name in names)
+    del names, chunks
+    try:
+        seconds, peak_mib = run_cli(app_path, csv_path)
+        report['cli'] = rate(args.names, seconds)
+        report['cli']['peak_rss_mib'] = peak_mib
+        report['csv_mib'] = round(os.path.getsize(csv_path) / 1024 / 1024, 1)
+    finally:
+        os.remove(csv_path)
+    emit(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Search latency for the notes app at a realistic size.
+
+Seeds a throwaway notes database with --notes synthetic notes (inserted
+with sqlite3 so the FTS triggers index them exactly as the app would),
+then times NoteStore.search() for several query shapes against the
+LIKE scan used when SQLite has no FTS5, and prints the report as JSON.
+
+Query shapes:
+    common   one frequent word (many matches, bm25 decides the top 20)
+    multi    two words that must both appear
+    prefix   a two or three letter prefix (served by the prefix indexes)
+    rare     a word present in only a handful of notes
+
+The scan is unranked and stops at the first --limit newest matches, so it
+is only quick when matches are everywhere; rare words make it read the
+whole table.
+
+Usage:
+    python benchmarks/notes_search.py --notes 100000 --queries 200
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from _common import add_app_path, emit, summarize
+
+WORDS = (
+    'meeting project budget review draft email call client design sprint '
+    'release deploy bug fix report invoice travel lunch dinner gym book read '
+    'idea plan week month quarter goal team notes agenda follow update '
+    'café résumé naïve schedule launch feedback roadmap hiring interview'
+).split()
+RARE_WORDS = ['zephyr', 'quokka', 'marzipan', 'obsidian', 'kumquat']
+# Long tail of filler words with Zipf-like frequencies, like real prose
+FILLER = [f'w{number}' for number in range(5000)]
+FILLER_WEIGHTS = [1.0 / rank for rank in range(1, len(FILLER) + 1)]
+
+QUERIES = {
+    'common': lambda rng: rng.choice(WORDS[:10]),
+    'multi': lambda rng: ' '.join(rng.sample(WORDS, 2)),
+    'prefix': lambda rng: rng.choice(WORDS)[:rng.choice((2, 3))] + '*',
+    'rare': lambda rng: rng.choice(RARE_WORDS)
+}
+
+
+def seed(db_path, notes, rng):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        batch = []
+        for number in range(notes):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(2, 6))]
+            words += rng.choices(FILLER, FILLER_WEIGHTS, k=rng.randint(2, 24))
+            rng.shuffle(words)
+            body = ' '.join(words)
+            if number % 20000 == 0:
+                body += ' ' + rng.choice(RARE_WORDS)
+            batch.append((body,))
+            if len(batch) == 50000:
+                conn.executemany('INSERT INTO notes (body) VALUES (?)', batch)
+                batch = []
+        if batch:
+            conn.executemany('INSERT INTO notes (body) VALUES (?)', batch)
+        conn.execute("UPDATE meta SET value = (SELECT COUNT(*) FROM notes) WHERE key = 'count'")
+    conn.close()
+
+
+def time_queries(search, shape, queries, rng):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(queries):
+        query = QUERIES[shape](rng)
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Notes full-text search latency')
+    parser.add_argument('--notes', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200, help='queries per shape')
+    parser.add_argument('--limit', type=int, default=20, help='results per query')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    add_app_path('notes-app')
+    from storage import NoteStore, parse_query
+
+    workdir = tempfile.mkdtemp(prefix='notes-bench-')
+    db_path = os.path.join(workdir, 'notes.db')
+    store = NoteStore(db_path)
+    rng = random.Random(42)
+
+    seed_started = time.perf_counter()
+    seed(db_path, args.notes, rng)
+    report = {
+        'config': vars(args),
+        'fts5': store.has_fts,
+        'seed_seconds': round(time.perf_counter() - seed_started, 2),
+        'fts': {},
+        'scan': {}
+    }
+
+    conn = store._connect()
+    for shape in QUERIES:
+        if store.has_fts:
+            report['fts'][shape] = time_queries(
+                lambda query: store.search(query, args.limit), shape, args.queries, random.Random(shape)
+            )
+        report['scan'][shape] = time_queries(
+            lambda query: store._scan(conn, parse_query(query), args.limit), shape, args.queries, random.Random(shape)
+        )
+
+    store.close()
+    emit(report, args.output)
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
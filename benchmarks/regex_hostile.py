@@ -0,0 +1,114 @@
+"""
+Regex tester throughput while catastrophic patterns are being submitted.
+
+Normal clients send ordinary patterns to /test-regex for --seconds with no
+hostile traffic, then for another --seconds while --hostile clients keep
+submitting (a+)+$ style patterns that backtrack far past REGEX_TIMEOUT.
+With matching isolated in the worker pool the normal clients' throughput
+should only drop by the share of workers the hostile jobs occupy, and
+every hostile request should come back as a timeout instead of hanging.
+
+Usage:
+    python benchmarks/regex_hostile.py --seconds 10 --clients 8 --hostile 2
+"""
+import argparse
+import random
+import threading
+import time
+
+from _common import add_app_path, emit, summarize
+
+NORMAL_JOBS = [
+    (r'\d+', 'There are 123 apples and 456 oranges', ''),
+    (r'(?P<user>\w+)@(?P<host>[\w.]+)', 'mail alice@example.com or bob@test.org', ''),
+    (r'^\w+', 'first line\nsecond line\nthird line', 'm'),
+    (r'colou?r', 'Color and colour ' * 50, 'i'),
+    (r'\b\w{5}\b', 'lorem ipsum dolor sit amet consectetur adipiscing elit ' * 20, '')
+]
+HOSTILE_JOBS = [
+    (r'(a+)+$', 'a' * 40 + 'b', ''),
+    (r'(a|aa)+$', 'a' * 60 + 'b', ''),
+    (r'(\w+\s?)+$', 'word ' * 30 + '!', '')
+]
+
+
+def client(app_module, jobs, deadline, results, seed_value):
+    test_client = app_module.app.test_client()
+    rng = random.Random(seed_value)
+    latencies, statuses = [], {}
+    while time.time() < deadline:
+        pattern, test_string, flags = rng.choice(jobs)
+        start = time.perf_counter()
+        response = test_client.post('/test-regex', json={
+            'pattern': pattern, 'test_string': test_string, 'flags': flags
+        })
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    results.append((latencies, statuses))
+
+
+def run_phase(app_module, args, hostile):
+    normal_results, hostile_results = [], []
+    deadline = time.time() + args.seconds
+    threads = [
+        threading.Thread(target=client, args=(app_module, NORMAL_JOBS, deadline, normal_results, number))
+        for number in range(args.clients)
+    ]
+    if hostile:
+        threads += [
+            threading.Thread(target=client, args=(app_module, HOSTILE_JOBS, deadline, hostile_results, number))
+            for number in range(args.hostile)
+        ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = {'normal': merge(normal_results, elapsed)}
+    if hostile:
+        report['hostile'] = merge(hostile_results, elapsed)
+    return report
+
+
+def merge(results, elapsed):
+    latencies = [value for values, _ in results for value in values]
+    statuses = {}
+    for _, counts in results:
+        for status, count in counts.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    report = summarize(latencies, elapsed)
+    report['statuses'] = statuses
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regex tester throughput under hostile patterns')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=8, help='threads sending normal patterns')
+    parser.add_argument('--hostile', type=int, default=2, help='threads sending backtracking patterns')
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=1.0, help='REGEX_TIMEOUT for the run')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    add_app_path('regex-tester')
+    import app as app_module
+    pool = app_module.regex_pool
+    pool.size = args.pool_size
+    pool.timeout = args.timeout
+    pool.start()
+
+    report = {
+        'config': vars(args),
+        'baseline': run_phase(app_module, args, hostile=False),
+        'under_attack': run_phase(app_module, args, hostile=True),
+        'pool': pool.stats()
+    }
+    pool.close()
+    emit(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
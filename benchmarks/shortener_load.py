@@ -0,0 +1,309 @@
+"""
+Load test for the two URL shortener apps.
+
+Seeds a throwaway database with --rows mappings (spread over --users
+synthetic accounts for url_shortener_with_login), then drives the
+endpoints through Flask's test client and/or a real local HTTP server and
+prints p50/p95/p99 latency and throughput per scenario as JSON.
+
+Scenarios:
+    shorten   POST /api/shorten with a new URL each time
+    redirect  GET /s/<code>, codes drawn from a Zipf distribution (hot keys)
+    history   GET /api/history, first page plus one cursor page
+    auth      POST /api/login + GET /api/check-auth (login app only)
+
+Usage:
+    python benchmarks/shortener_load.py --app url-shortener --rows 1000000
+    python benchmarks/shortener_load.py --app url_shortener_with_login --rows 1000000 \\
+        --users 1000 --target server --concurrency 16 --output before.json
+"""
+import argparse
+import bisect
+import hashlib
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+
+from _common import REPO_ROOT, add_app_path, emit, summarize
+
+APPS = ('url-shortener', 'url_shortener_with_login')
+BENCH_PASSWORD = 'benchpass1'
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def load_app(app_dir, db_path):
+    """Import the app against the benchmark database (DATABASE_URL is read at import)"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    add_app_path(app_dir)
+    import app as app_module
+    return app_module
+
+
+def seed_code(number):
+    """8-character codes, disjoint from the 6-character codes the allocator hands out"""
+    chars = []
+    for _ in range(7):
+        number, remainder = divmod(number, 62)
+        chars.append(ALPHABET[remainder])
+    return 'b' + ''.join(reversed(chars))
+
+
+def seed(app_module, db_path, rows, users):
+    """Create the schema through the app, then bulk insert rows with sqlite3"""
+    with app_module.app.app_context():
+        app_module.init_db()
+        password_hash = None
+        if users:
+            user = app_module.User(username='seedhash')
+            user.set_password(BENCH_PASSWORD)
+            password_hash = user.password
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        if users:
+            conn.executemany(
+                'INSERT INTO user (username, password, created_at) VALUES (?, ?, CURRENT_TIMESTAMP)',
+                ((f'bench{number:04d}', password_hash) for number in range(users))
+            )
+        columns = 'original_url, shortened_url, url_hash, created_at, click_count'
+        values = '?, ?, ?, CURRENT_TIMESTAMP, 0'
+        if users:
+            columns = 'user_id, ' + columns
+            values = '?, ' + values
+        batch = []
+        for number in range(rows):
+            url = f'https://example.com/page/{number}'
+            row = (url, seed_code(number), hashlib.sha256(app_module.normalize_url(url).encode()).hexdigest())
+            if users:
+                row = (number % users + 1,) + row
+            batch.append(row)
+            if len(batch) == 50000:
+                conn.executemany(f'INSERT INTO url_mapping ({columns}) VALUES ({values})', batch)
+                batch = []
+        if batch:
+            conn.executemany(f'INSERT INTO url_mapping ({columns}) VALUES ({values})', batch)
+    conn.close()
+
+
+class ZipfCodes:
+    """Draws seeded codes with P(rank k) proportional to 1 / k**s"""
+
+    def __init__(self, rows, s, seed_value=42):
+        total = 0.0
+        self.cumulative = []
+        for rank in range(1, rows + 1):
+            total += 1.0 / rank ** s
+            self.cumulative.append(total)
+        self.total = total
+        # Scatter the hot ranks over the table instead of the first ids
+        self.rank_to_number = list(range(rows))
+        random.Random(seed_value).shuffle(self.rank_to_number)
+
+    def draw(self, rng):
+        rank = bisect.bisect_left(self.cumulative, rng.random() * self.total)
+        return seed_code(self.rank_to_number[min(rank, len(self.rank_to_number) - 1)])
+
+
+# ==================== TRANSPORTS ====================
+
+class TestClientTransport:
+    def __init__(self, app_module):
+        self.client = app_module.app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpTransport:
+    """Keep-alive http.client connection that carries the session cookie"""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.conn.request(method, path, body=payload, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        if response.getheader('Content-Type', '').startswith('application/json'):
+            return response.status, json.loads(data)
+        return response.status, None
+
+
+def serve_app(app_dir, db_path, port_queue):
+    """Child process: run the app on a threaded Werkzeug server"""
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no per-request access log
+    app_module = load_app(app_dir, db_path)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+# ==================== SCENARIOS ====================
+
+def login(transport, user_number):
+    status, _ = transport.request('POST', '/api/login', {
+        'username': f'bench{user_number:04d}',
+        'password': BENCH_PASSWORD
+    })
+    if status != 200:
+        raise RuntimeError(f'benchmark login failed with HTTP {status}')
+
+
+def scenario_shorten(transport, rng, state):
+    return transport.request('POST', '/api/shorten', {'url': f'https://bench.example/{rng.getrandbits(64):x}'})[0]
+
+
+def scenario_redirect(transport, rng, state):
+    return transport.request('GET', f'/s/{state["zipf"].draw(rng)}')[0]
+
+
+def scenario_history(transport, rng, state):
+    status, data = transport.request('GET', '/api/history?limit=50')
+    if status == 200 and data and data.get('next_cursor'):
+        status, _ = transport.request('GET', f'/api/history?limit=50&cursor={data["next_cursor"]}')
+    return status
+
+
+def scenario_auth(transport, rng, state):
+    status, _ = transport.request('POST', '/api/login', {
+        'username': f'bench{rng.randrange(state["users"]):04d}',
+        'password': BENCH_PASSWORD
+    })
+    if status == 200:
+        status, _ = transport.request('GET', '/api/check-auth')
+    return status
+
+
+SCENARIOS = {
+    'shorten': scenario_shorten,
+    'redirect': scenario_redirect,
+    'history': scenario_history,
+    'auth': scenario_auth
+}
+OK_STATUSES = {'shorten': {200}, 'redirect': {302}, 'history': {200}, 'auth': {200}}
+
+
+def run_scenario(name, make_transport, requests, concurrency, state):
+    per_thread = max(1, requests // concurrency)
+    latencies, errors, lock = [], [0], threading.Lock()
+    transports = [make_transport() for _ in range(concurrency)]
+    if state['users']:
+        for number, transport in enumerate(transports):
+            login(transport, number % state['users'])
+
+    def worker(transport, seed_value):
+        rng = random.Random(seed_value)
+        local, failed = [], 0
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            status = SCENARIOS[name](transport, rng, state)
+            local.append(time.perf_counter() - start)
+            if status not in OK_STATUSES[name]:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(transport, number)) for number, transport in enumerate(transports)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = summarize(latencies, time.perf_counter() - started)
+    report['errors'] = errors[0]
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for the URL shortener apps')
+    parser.add_argument('--app', choices=APPS, default='url-shortener')
+    parser.add_argument('--rows', type=int, default=100000, help='mappings to seed')
+    parser.add_argument('--users', type=int, default=100, help='synthetic users (login app only)')
+    parser.add_argument('--target', choices=('test-client', 'server', 'both'), default='both')
+    parser.add_argument('--scenarios', default='shorten,redirect,history,auth')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--zipf-s', type=float, default=1.1, help='Zipf exponent for redirect keys')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    users = args.users if args.app == 'url_shortener_with_login' else 0
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    if not users and 'auth' in scenarios:
+        scenarios.remove('auth')
+
+    workdir = tempfile.mkdtemp(prefix='shortener-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    app_module = load_app(args.app, db_path)
+
+    seed_started = time.perf_counter()
+    seed(app_module, db_path, args.rows, users)
+    report = {
+        'config': vars(args),
+        'git_revision': git_revision(),
+        'seed_seconds': round(time.perf_counter() - seed_started, 2),
+        'results': {}
+    }
+    state = {'zipf': ZipfCodes(args.rows, args.zipf_s), 'users': users}
+
+    targets = ['test-client', 'server'] if args.target == 'both' else [args.target]
+    for target in targets:
+        server = None
+        if target == 'test-client':
+            def make_transport():
+                return TestClientTransport(app_module)
+        else:
+            # spawn: a forked child would inherit the parent's app state but not its threads
+            context = multiprocessing.get_context('spawn')
+            port_queue = context.Queue()
+            server = context.Process(target=serve_app, args=(args.app, db_path, port_queue), daemon=True)
+            server.start()
+            port = port_queue.get(timeout=60)
+
+            def make_transport():
+                return HttpTransport(port)
+
+        report['results'][target] = {
+            name: run_scenario(name, make_transport, args.requests, args.concurrency, state)
+            for name in scenarios
+        }
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    emit(report, args.output)
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
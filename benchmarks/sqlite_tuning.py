@@ -0,0 +1,152 @@
+"""
+Concurrent reader/writer throughput of the shortener database, with the
+stock SQLite setup versus url-shortener/sqlite_tuning.py.
+
+Reader processes do redirect-style point lookups by short code; writer
+processes insert new mappings and bump click counts, committing each
+operation. Each mode runs against its own freshly seeded database file.
+
+Usage:
+    python benchmarks/sqlite_tuning.py --rows 100000 --readers 4 --writers 2 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import string
+import tempfile
+import time
+
+from _common import add_app_path, emit, summarize
+
+add_app_path('url-shortener')
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlite_tuning import DEFAULT_PRAGMAS, apply_pragmas, engine_options, make_read_engine  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE url_mapping (
+    id INTEGER PRIMARY KEY,
+    original_url VARCHAR(2048) NOT NULL,
+    shortened_url VARCHAR(10) NOT NULL UNIQUE,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    click_count INTEGER DEFAULT 0
+)
+"""
+
+
+def make_code(number):
+    return f'b{number:09d}'
+
+
+def seed(path, rows):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA))
+        batch = []
+        for number in range(rows):
+            batch.append({'url': f'https://example.com/{number}', 'code': make_code(number)})
+            if len(batch) == 10000:
+                conn.execute(text('INSERT INTO url_mapping (original_url, shortened_url) VALUES (:url, :code)'), batch)
+                batch = []
+        if batch:
+            conn.execute(text('INSERT INTO url_mapping (original_url, shortened_url) VALUES (:url, :code)'), batch)
+    engine.dispose()
+
+
+def make_engines(path, mode):
+    url = f'sqlite:///{path}'
+    if mode == 'default':
+        engine = create_engine(url)
+        return engine, engine
+    engine = create_engine(url, **engine_options())
+    apply_pragmas(engine, DEFAULT_PRAGMAS)
+    return engine, make_read_engine(engine, DEFAULT_PRAGMAS)
+
+
+def reader(path, mode, rows, deadline, results):
+    _, read_engine = make_engines(path, mode)
+    latencies, errors = [], 0
+    query = text('SELECT original_url FROM url_mapping WHERE shortened_url = :code')
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            with read_engine.connect() as conn:
+                conn.execute(query, {'code': make_code(random.randrange(rows))}).scalar()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors += 1
+    results.put(('read', latencies, errors))
+
+
+def writer(path, mode, rows, deadline, results):
+    engine, _ = make_engines(path, mode)
+    latencies, errors = [], 0
+    insert = text('INSERT INTO url_mapping (original_url, shortened_url) VALUES (:url, :code)')
+    update = text('UPDATE url_mapping SET click_count = click_count + 1 WHERE shortened_url = :code')
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                if random.random() < 0.5:
+                    code = ''.join(random.choices(string.ascii_letters, k=10))
+                    conn.execute(insert, {'url': f'https://example.org/{code}', 'code': code})
+                else:
+                    conn.execute(update, {'code': make_code(random.randrange(rows))})
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors += 1
+    results.put(('write', latencies, errors))
+
+
+def run_mode(mode, args, workdir):
+    path = os.path.join(workdir, f'{mode}.db')
+    seed(path, args.rows)
+    if mode == 'tuned':
+        # Switch the file to WAL once, like the app's first connection does
+        engine, _ = make_engines(path, mode)
+        engine.connect().close()
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + args.seconds
+    processes = [
+        multiprocessing.Process(target=reader, args=(path, mode, args.rows, deadline, results))
+        for _ in range(args.readers)
+    ] + [
+        multiprocessing.Process(target=writer, args=(path, mode, args.rows, deadline, results))
+        for _ in range(args.writers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    report = {}
+    for role in ('read', 'write'):
+        latencies = [value for kind, values, _ in collected if kind == role for value in values]
+        report[role] = summarize(latencies, args.seconds)
+        report[role]['errors'] = sum(errors for kind, _, errors in collected if kind == role)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = {
+            'config': vars(args),
+            'default': run_mode('default', args, workdir),
+            'tuned': run_mode('tuned', args, workdir)
+        }
+    emit(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
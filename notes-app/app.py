@@ -1,10 +1,37 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, make_response, jsonify
+from markupsafe import Markup, escape
+import os
+import time
+from instrumentation import init_instrumentation, record_query
+from storage import NoteStore, Note, HIGHLIGHT_START, HIGHLIGHT_END
 
 # Initialize Flask app with templates folder specification
 app = Flask(__name__, template_folder='templates')
 
-# In-memory list to store notes (resets on app restart)
-notes = []
+# Notes are stored in SQLite (WAL mode) so they survive restarts and can be
+# shared by several worker processes
+app.config['NOTES_DB'] = os.environ.get('NOTES_DB', os.path.join(app.instance_path, 'notes.db'))
+app.config['NOTES_PER_PAGE'] = 50
+app.config['SEARCH_RESULTS'] = 20
+
+# Instrumentation: /metrics and slow request logging, off unless APP_METRICS=1
+app.config['METRICS_ENABLED'] = os.environ.get('APP_METRICS') == '1'
+app.config['SLOW_REQUEST_MS'] = 500
+if app.config['METRICS_ENABLED']:
+    init_instrumentation(app, slow_request_ms=app.config['SLOW_REQUEST_MS'])
+
+os.makedirs(os.path.dirname(os.path.abspath(app.config['NOTES_DB'])), exist_ok=True)
+notes = NoteStore(
+    app.config['NOTES_DB'],
+    on_query=record_query if app.config['METRICS_ENABLED'] else None
+)
+
+# Part of the ETag, so a changed template is not answered with a stale 304
+TEMPLATE_VERSION = int(os.path.getmtime(os.path.join(app.root_path, 'templates', 'home.html')))
+
+def page_args():
+    """The after/before note id of the page being viewed, if any"""
+    return {name: request.args[name] for name in ('after', 'before') if request.args.get(name, '').isdigit()}
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -20,33 +47,95 @@ def index():
         
         # Validation: Only append if note is not empty
         if note:
-            notes.append(note)
+            notes.add(note)
         
         # Redirect to prevent form resubmission on page refresh
         return redirect(url_for('index'))
     
-    # GET request: Display the form and existing notes
-    return render_template('home.html', notes=notes)
+    # GET request: unchanged notes since the client's copy -> 304, no rendering.
+    # The version is read before the page, so an ETag never claims newer data
+    etag = f'{notes.version()}-{TEMPLATE_VERSION}'
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        args = page_args()
+        page, has_previous, has_next = notes.page(
+            app.config['NOTES_PER_PAGE'],
+            after=int(args['after']) if 'after' in args else None,
+            before=int(args['before']) if 'before' in args else None
+        )
+        response = make_response(render_template(
+            'home.html',
+            notes=page,
+            total=notes.count(),
+            has_previous=has_previous,
+            has_next=has_next,
+            page_args=args
+        ))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # always revalidate
+    return response
 
-@app.route('/delete/<int:index>', methods=['POST'])
-def delete_note(index):
+@app.route('/delete/<int:note_id>', methods=['POST'])
+def delete_note(note_id):
     """
-    Delete a note by its index.
+    Delete a note by its id.
     
     Args:
-        index: The position of the note to delete
+        note_id: The stable id of the note to delete (not its position,
+            which shifts when other users delete notes)
     """
-    try:
-        if 0 <= index < len(notes):
-            notes.pop(index)
-    except (ValueError, IndexError):
-        pass
+    notes.delete(note_id)
     
-    return redirect(url_for('index'))
+    # Back to the page the note was deleted from
+    return redirect(url_for('index', **page_args()))
+
+def highlight(snippet):
+    """Escape a search snippet and wrap its matched terms in <mark>"""
+    return Markup(
+        str(escape(snippet)).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    )
+
+@app.route('/search')
+def search():
+    """
+    Full-text search over all notes, best match first.
+    
+    Query args: q (words to find; a trailing * matches a prefix), limit,
+    and format=json for a JSON response instead of the page.
+    """
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', app.config['SEARCH_RESULTS'], type=int), 100))
+    
+    started = time.perf_counter()
+    hits = notes.search(query, limit) if query else []
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'query': query,
+            'took_ms': took_ms,
+            'results': [
+                {'id': hit.id, 'body': hit.body, 'snippet': str(highlight(hit.snippet)), 'score': hit.score}
+                for hit in hits
+            ]
+        })
+    
+    if not query:
+        return redirect(url_for('index'))
+    return render_template(
+        'home.html',
+        notes=[Note(hit.id, highlight(hit.snippet), None) for hit in hits],
+        total=notes.count(),
+        query=query,
+        has_previous=False,
+        has_next=False,
+        page_args={}
+    )
 
 @app.route('/clear', methods=['POST'])
 def clear_notes():
-    """Clear all notes from the list."""
+    """Clear all notes."""
     notes.clear()
     return redirect(url_for('index'))
 
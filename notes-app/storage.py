@@ -0,0 +1,303 @@
+"""
+SQLite storage for notes.
+
+Notes live in one SQLite file in WAL mode, so several gunicorn workers can
+share it: readers never block, writers queue on the database lock
+(busy_timeout) instead of failing, and every change is a single
+transaction, so concurrent adds and deletes are never lost. Nothing is
+loaded into memory at startup; opening the store only creates the schema
+if it is missing.
+
+Notes are keyed by their id (the rowid B-tree, which is also insertion
+order), so deleting a note is a single key lookup and pages are read with
+keyset ranges instead of OFFSET. A version counter in the meta table is
+bumped in the same transaction as every change; the app uses it as an
+ETag so unchanged pages are answered with 304.
+
+Search goes through an FTS5 index over the note bodies (an external
+content table, kept in sync by triggers on add, delete and clear), ranked
+with bm25. SQLite builds without FTS5 fall back to a LIKE scan.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        body TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)",
+    # Databases created before the meta table existed start from a real count
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('count', (SELECT COUNT(*) FROM notes))"
+)
+
+# Indexes notes.body without storing a second copy of it. prefix='2 3'
+# adds prefix indexes so short prefix queries (no*, not*) stay fast
+FTS_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE notes_fts USING fts5(
+        body,
+        content='notes',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts (rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts (notes_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF body ON notes BEGIN
+        INSERT INTO notes_fts (notes_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO notes_fts (rowid, body) VALUES (new.id, new.body);
+    END
+    """
+)
+
+# snippet() markers; the app escapes the text and then turns them into <mark>
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+Note = namedtuple('Note', 'id body created_at')
+SearchHit = namedtuple('SearchHit', 'id body snippet score')
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # durable across application crashes under WAL
+    'busy_timeout': 5000      # milliseconds a writer waits for the lock
+}
+
+
+class NoteStore:
+    """Notes in insertion order, backed by a SQLite database file
+
+    Connections are per thread (sqlite3 connections must not be shared
+    across threads) and opened lazily. on_query(statement, seconds) is
+    called after every statement, for instrumentation.
+    """
+
+    def __init__(self, path, on_query=None):
+        self.path = path
+        self.on_query = on_query
+        self._local = threading.local()
+        with self._transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self.has_fts = self._create_fts(conn)
+
+    @staticmethod
+    def _create_fts(conn):
+        """Create the search index if missing (building it from existing notes)"""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'").fetchone():
+            return True
+        try:
+            for statement in FTS_SCHEMA:
+                conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            if 'fts5' not in str(e):
+                raise
+            return False  # this SQLite has no FTS5; search() scans instead
+        conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+        return True
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly below
+            conn = sqlite3.connect(self.path, timeout=PRAGMAS['busy_timeout'] / 1000, isolation_level=None)
+            for name, value in PRAGMAS.items():
+                conn.execute(f'PRAGMA {name}={value}')
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, conn, statement, parameters=()):
+        started = time.perf_counter()
+        cursor = conn.execute(statement, parameters)
+        if self.on_query is not None:
+            self.on_query(statement, time.perf_counter() - started)
+        return cursor
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def version(self):
+        """Counter bumped by every change; equal versions mean equal contents"""
+        return self._meta('version')
+
+    def count(self):
+        return self._meta('count')
+
+    def _meta(self, key):
+        conn = self._connect()
+        return self._execute(conn, 'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()[0]
+
+    def page(self, limit, after=None, before=None):
+        """Up to limit notes in id order, after or before a note id
+
+        Returns (notes, has_previous, has_next). Without after/before this
+        is the first page. Reads run in one transaction so the page and its
+        neighbours come from the same snapshot.
+        """
+        conn = self._connect()
+        self._execute(conn, 'BEGIN')
+        try:
+            if before is not None:
+                rows = self._execute(
+                    conn,
+                    'SELECT id, body, created_at FROM notes WHERE id < ? ORDER BY id DESC LIMIT ?',
+                    (before, limit + 1)
+                ).fetchall()
+                has_previous = len(rows) > limit
+                notes = [Note(*row) for row in reversed(rows[:limit])]
+                has_next = bool(notes) and self._exists(conn, 'id > ?', notes[-1].id)
+            else:
+                rows = self._execute(
+                    conn,
+                    'SELECT id, body, created_at FROM notes WHERE id > ? ORDER BY id LIMIT ?',
+                    (after or 0, limit + 1)
+                ).fetchall()
+                has_next = len(rows) > limit
+                notes = [Note(*row) for row in rows[:limit]]
+                has_previous = bool(notes) and self._exists(conn, 'id < ?', notes[0].id)
+        finally:
+            self._execute(conn, 'COMMIT')
+        return notes, has_previous, has_next
+
+    def _exists(self, conn, condition, value):
+        return self._execute(conn, f'SELECT EXISTS (SELECT 1 FROM notes WHERE {condition})', (value,)).fetchone()[0]
+
+    def search(self, query, limit=20):
+        """Notes matching every term of query, best match first
+
+        Terms are matched as whole tokens; a term ending in * matches as a
+        prefix (meet* finds meeting). Returns a list of SearchHit whose
+        snippet marks the matched terms with HIGHLIGHT_START/END.
+        """
+        terms = parse_query(query)
+        if not terms:
+            return []
+        conn = self._connect()
+        if not self.has_fts:
+            return self._scan(conn, terms, limit)
+
+        match = ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+        # Rank first, then build snippets for the winners only: a broad
+        # query can match a large share of the notes, and snippet() costs
+        # far more per row than bm25()
+        ranked = self._execute(
+            conn,
+            'SELECT rowid, bm25(notes_fts) AS score FROM notes_fts '
+            'WHERE notes_fts MATCH ? ORDER BY score LIMIT ?',
+            (match, limit)
+        ).fetchall()
+        if not ranked:
+            return []
+        scores = dict(ranked)
+        rows = self._execute(
+            conn,
+            'SELECT notes.id, notes.body, '
+            f"snippet(notes_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '...', 16) "
+            'FROM notes_fts JOIN notes ON notes.id = notes_fts.rowid '
+            f"WHERE notes_fts MATCH ? AND notes_fts.rowid IN ({', '.join('?' * len(scores))})",
+            (match, *scores)
+        ).fetchall()
+        hits = [SearchHit(note_id, body, snippet, scores[note_id]) for note_id, body, snippet in rows]
+        return sorted(hits, key=lambda hit: hit.score)
+
+    def _scan(self, conn, terms, limit):
+        """Fallback without FTS5: substring match, newest first, no ranking"""
+        where = ' AND '.join('body LIKE ?' for _ in terms)
+        rows = self._execute(
+            conn,
+            f'SELECT id, body FROM notes WHERE {where} ORDER BY id DESC LIMIT ?',
+            [f'%{term}%' for term, _ in terms] + [limit]
+        ).fetchall()
+        return [SearchHit(note_id, body, body, 0.0) for note_id, body in rows]
+
+    def add(self, body):
+        """Store a note and return its id"""
+        with self._transaction() as conn:
+            note_id = self._execute(conn, 'INSERT INTO notes (body) VALUES (?)', (body,)).lastrowid
+            self._bump(conn, 1)
+        return note_id
+
+    def delete(self, note_id):
+        """Delete a note by id; False if it no longer exists"""
+        with self._transaction() as conn:
+            deleted = self._execute(conn, 'DELETE FROM notes WHERE id = ?', (note_id,)).rowcount
+            if deleted:
+                self._bump(conn, -deleted)
+        return deleted > 0
+
+    def clear(self):
+        with self._transaction() as conn:
+            deleted = self._execute(conn, 'DELETE FROM notes').rowcount
+            self._bump(conn, -deleted)
+
+    def _bump(self, conn, count_delta):
+        """Advance the version and adjust the cached count, inside the write"""
+        self._execute(conn, "UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        if count_delta:
+            self._execute(conn, "UPDATE meta SET value = value + ? WHERE key = 'count'", (count_delta,))
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def parse_query(query):
+    """Split a user query into (term, is_prefix) pairs
+
+    Only word characters survive, so FTS5 query syntax (quotes, NEAR, -,
+    column filters) in user input can never produce a syntax error.
+    """
+    terms = []
+    for raw in query.split():
+        words = re.findall(r'\w+', raw)
+        for position, word in enumerate(words):
+            is_last = position == len(words) - 1
+            terms.append((word, is_last and raw.endswith('*')))
+    return terms
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error
+
+    IMMEDIATE takes the write lock up front, so two workers never both read
+    and then fail to upgrade to a write lock (SQLITE_BUSY mid-transaction).
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
@@ -1,9 +1,100 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+import os
 import re
+import json
+import tempfile
+from functools import lru_cache
+from instrumentation import init_instrumentation
+from response_cache import init_response_cache
+from regex_worker import RegexPool, RegexTimeout, RegexMemoryError, PoolBusy
 
 app = Flask(__name__)
 
+# Compiled pattern cache and response limits
+app.config['PATTERN_CACHE_SIZE'] = 256
+app.config['MAX_MATCHES'] = 1000  # matches returned per request
+app.config['MAX_MATCH_OUTPUT_CHARS'] = 1000000  # matched text + groups per response
+
+# Matching runs in worker processes so a backtracking pattern can be killed
+app.config['REGEX_POOL_SIZE'] = 4
+app.config['REGEX_TIMEOUT'] = 2.0  # seconds per job
+app.config['REGEX_MEMORY_LIMIT'] = 512 * 1024 * 1024  # bytes of address space per worker
+app.config['REGEX_QUEUE_TIMEOUT'] = 5.0  # seconds to wait for a free worker
+
+# Streaming mode (/test-regex/stream) for large test strings and uploads
+app.config['STREAM_MAX_MATCHES'] = 100000
+app.config['STREAM_MAX_OUTPUT_CHARS'] = 50000000
+app.config['STREAM_BATCH_SIZE'] = 500  # matches per message from the worker
+app.config['STREAM_TIMEOUT'] = 60.0  # seconds for the whole job
+app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # largest accepted upload
+
+# Batch mode (/test-regex/batch): many patterns against many strings
+app.config['BATCH_MAX_PATTERNS'] = 1000
+app.config['BATCH_MAX_STRINGS'] = 10000
+app.config['BATCH_MAX_CELLS'] = 2000000  # patterns x strings
+app.config['BATCH_TIMEOUT'] = 30.0  # seconds for the whole batch
+
+# Instrumentation: /metrics and slow request logging, off unless APP_METRICS=1
+app.config['METRICS_ENABLED'] = os.environ.get('APP_METRICS') == '1'
+app.config['SLOW_REQUEST_MS'] = 500
+if app.config['METRICS_ENABLED']:
+    init_instrumentation(app, slow_request_ms=app.config['SLOW_REQUEST_MS'])
+
+# Rendered pages and static files, stored pre-compressed (gzip, brotli if installed)
+app.config['RESPONSE_CACHE_SIZE'] = 256
+app.config['RESPONSE_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
+response_cache = init_response_cache(
+    app,
+    max_entries=app.config['RESPONSE_CACHE_SIZE'],
+    max_bytes=app.config['RESPONSE_CACHE_MAX_BYTES']
+)
+
+@lru_cache(maxsize=app.config['PATTERN_CACHE_SIZE'])
+def compile_pattern(pattern, flags):
+    """re.compile with an LRU cache keyed on (pattern, flags)
+
+    The UI re-submits the same pattern on every keystroke in the test string,
+    so most requests are a cache hit. Invalid patterns raise re.error and are
+    not cached.
+    """
+    return re.compile(pattern, flags)
+
+# Workers start on first use (or from __main__), never at import: the
+# forkserver/spawn start methods re-import the main module in each worker
+regex_pool = RegexPool(
+    size=app.config['REGEX_POOL_SIZE'],
+    timeout=app.config['REGEX_TIMEOUT'],
+    memory_limit=app.config['REGEX_MEMORY_LIMIT'],
+    queue_timeout=app.config['REGEX_QUEUE_TIMEOUT']
+)
+
+def parse_flags(flags_str):
+    """Turn the 'imsx' flag letters from the UI into re flags"""
+    flags = 0
+    if 'i' in flags_str:
+        flags |= re.IGNORECASE
+    if 'm' in flags_str:
+        flags |= re.MULTILINE
+    if 's' in flags_str:
+        flags |= re.DOTALL
+    if 'x' in flags_str:
+        flags |= re.VERBOSE
+    return flags
+
+def format_event(kind, payload, sse):
+    """One streamed record as an NDJSON line or a Server-Sent Event"""
+    if sse:
+        return f'event: {kind}\ndata: {json.dumps(payload)}\n\n'
+    return json.dumps(dict(payload, type=kind)) + '\n'
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 @app.route('/')
+@response_cache.cached()
 def index():
     return render_template('index.html')
 
@@ -16,36 +107,37 @@ def test_regex():
         flags_str = data.get('flags', '')
         
         # Parse flags
-        flags = 0
-        if 'i' in flags_str:
-            flags |= re.IGNORECASE
-        if 'm' in flags_str:
-            flags |= re.MULTILINE
-        if 's' in flags_str:
-            flags |= re.DOTALL
-        if 'x' in flags_str:
-            flags |= re.VERBOSE
+        flags = parse_flags(flags_str)
         
         # Compile regex
         try:
-            regex = re.compile(pattern, flags)
+            regex = compile_pattern(pattern, flags)
         except re.error as e:
             return jsonify({
                 'success': False,
                 'error': f'Invalid regex: {str(e)}'
             }), 400
         
-        # Find all matches
-        matches = []
-        for match in regex.finditer(test_string):
-            match_info = {
-                'full_match': match.group(0),
-                'start': match.start(),
-                'end': match.end(),
-                'groups': match.groups(),
-                'named_groups': match.groupdict()
-            }
-            matches.append(match_info)
+        # Find matches, up to the configured limits, in a worker process
+        try:
+            matches, truncated = regex_pool.run(
+                regex.pattern,
+                regex.flags,
+                test_string,
+                app.config['MAX_MATCHES'],
+                app.config['MAX_MATCH_OUTPUT_CHARS']
+            )
+        except (RegexTimeout, RegexMemoryError) as e:
+            return jsonify({
+                'success': False,
+                'timed_out': isinstance(e, RegexTimeout),
+                'error': f'{e}. The pattern probably backtracks catastrophically on this input.'
+            }), 422
+        except PoolBusy as e:
+            return jsonify({
+                'success': False,
+                'error': f'Server busy: {e}, try again'
+            }), 503
         
         # Get match count and overall info
         total_matches = len(matches)
@@ -53,6 +145,7 @@ def test_regex():
         return jsonify({
             'success': True,
             'total_matches': total_matches,
+            'truncated': truncated,
             'matches': matches,
             'pattern': pattern,
             'flags': flags_str
@@ -64,5 +157,208 @@ def test_regex():
             'error': str(e)
         }), 500
 
+@app.route('/test-regex/stream', methods=['POST'])
+def test_regex_stream():
+    """Stream matches as they are found, as NDJSON or Server-Sent Events
+
+    Takes the same JSON body as /test-regex, or a multipart form with
+    pattern, flags and the test string uploaded as `file`. Uploads are
+    read as UTF-8 through an mmap of the saved file and matched like a test
+    string, with offsets in characters. Each record is a match, then one done record
+    with total_matches and truncated (or an error record). Send
+    ?format=sse or Accept: text/event-stream for SSE framing.
+    """
+    upload_path = None
+    try:
+        if request.mimetype == 'multipart/form-data':
+            pattern = request.form.get('pattern', '')
+            flags_str = request.form.get('flags', '')
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+            fd, upload_path = tempfile.mkstemp(prefix='regex-upload-')
+            os.close(fd)
+            upload.save(upload_path)
+            test_string = None
+        else:
+            data = request.get_json(silent=True) or {}
+            pattern = data.get('pattern', '')
+            test_string = data.get('test_string', '')
+            flags_str = data.get('flags', '')
+        
+        flags = parse_flags(flags_str)
+        try:
+            compile_pattern(pattern, flags)
+        except re.error as e:
+            if upload_path:
+                remove_file(upload_path)
+            return jsonify({
+                'success': False,
+                'error': f'Invalid regex: {str(e)}'
+            }), 400
+        
+        stream = regex_pool.open(
+            pattern,
+            flags,
+            text=test_string,
+            path=upload_path,
+            max_matches=app.config['STREAM_MAX_MATCHES'],
+            max_output_chars=app.config['STREAM_MAX_OUTPUT_CHARS'],
+            batch_size=app.config['STREAM_BATCH_SIZE'],
+            max_seconds=app.config['STREAM_TIMEOUT']
+        )
+    except PoolBusy as e:
+        if upload_path:
+            remove_file(upload_path)
+        return jsonify({
+            'success': False,
+            'error': f'Server busy: {e}, try again'
+        }), 503
+    except Exception as e:
+        if upload_path:
+            remove_file(upload_path)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    
+    sse = request.args.get('format') == 'sse' or request.accept_mimetypes.best == 'text/event-stream'
+    
+    def generate():
+        total = 0
+        try:
+            for batch in stream:
+                chunk = []
+                for match in batch:
+                    match['index'] = total
+                    chunk.append(format_event('match', match, sse))
+                    total += 1
+                yield ''.join(chunk)
+            yield format_event('done', {'total_matches': total, 'truncated': stream.truncated}, sse)
+        except (RegexTimeout, RegexMemoryError) as e:
+            yield format_event('error', {
+                'timed_out': isinstance(e, RegexTimeout),
+                'total_matches': total,
+                'error': f'{e}. The pattern probably backtracks catastrophically on this input.'
+            }, sse)
+        except (re.error, RuntimeError) as e:
+            yield format_event('error', {'total_matches': total, 'error': str(e)}, sse)
+        finally:
+            cleanup()
+    
+    def cleanup():
+        stream.close()
+        if upload_path:
+            remove_file(upload_path)
+    
+    response = Response(generate(), mimetype='text/event-stream' if sse else 'application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a reverse proxy buffer the stream
+    # Also runs if the client disconnects before the stream is started
+    response.call_on_close(cleanup)
+    return response
+
+@app.route('/test-regex/batch', methods=['POST'])
+def test_regex_batch():
+    """Evaluate N patterns against M strings in one request
+    
+    Body: {"patterns": [...], "strings": [...], "flags": "i", "mode": "count",
+    "prefilter": true}. A pattern is a string or {"pattern": ..., "flags": ...}.
+    mode "count" gives match counts, "first" the [start, end] of the first
+    match or null. The result is a matrix with one row per pattern.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    
+    raw_patterns = data.get('patterns')
+    strings = data.get('strings')
+    mode = data.get('mode', 'count')
+    default_flags = data.get('flags', '')
+    if not isinstance(raw_patterns, list) or not raw_patterns:
+        return jsonify({'success': False, 'error': 'patterns must be a non-empty list'}), 400
+    if not isinstance(strings, list) or not all(isinstance(string, str) for string in strings):
+        return jsonify({'success': False, 'error': 'strings must be a list of strings'}), 400
+    if mode not in ('count', 'first'):
+        return jsonify({'success': False, 'error': "mode must be 'count' or 'first'"}), 400
+    if (len(raw_patterns) > app.config['BATCH_MAX_PATTERNS']
+            or len(strings) > app.config['BATCH_MAX_STRINGS']
+            or len(raw_patterns) * len(strings) > app.config['BATCH_MAX_CELLS']):
+        return jsonify({
+            'success': False,
+            'error': (f"At most {app.config['BATCH_MAX_PATTERNS']} patterns, "
+                      f"{app.config['BATCH_MAX_STRINGS']} strings and "
+                      f"{app.config['BATCH_MAX_CELLS']} pattern/string pairs per batch")
+        }), 400
+    
+    # Compile each pattern once up front; invalid ones get an error instead of a row
+    patterns = []
+    positions = []
+    errors = []
+    for position, item in enumerate(raw_patterns):
+        if isinstance(item, dict):
+            pattern, flags_str = item.get('pattern'), item.get('flags', default_flags)
+        else:
+            pattern, flags_str = item, default_flags
+        if not isinstance(pattern, str) or not isinstance(flags_str, str):
+            errors.append({'index': position, 'error': 'Pattern and flags must be strings'})
+            continue
+        try:
+            regex = compile_pattern(pattern, parse_flags(flags_str))
+        except re.error as e:
+            errors.append({'index': position, 'error': f'Invalid regex: {str(e)}'})
+            continue
+        patterns.append((regex.pattern, regex.flags))
+        positions.append(position)
+    
+    try:
+        rows, timed_out, incomplete, prefilter_stats = regex_pool.run_batch(
+            patterns,
+            strings,
+            mode=mode,
+            prefilter=bool(data.get('prefilter', True)),
+            max_seconds=app.config['BATCH_TIMEOUT']
+        ) if patterns else ([], [], [], {'patterns_with_prefix': 0, 'cells_skipped': 0, 'stopped_early': False})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    
+    matrix = [None] * len(raw_patterns)
+    for position, row in zip(positions, rows):
+        matrix[position] = row
+    
+    return jsonify({
+        'success': True,
+        'mode': mode,
+        'matrix': matrix,
+        'errors': errors,
+        'timed_out': [positions[index] for index in timed_out],
+        'incomplete': [positions[index] for index in incomplete],
+        'prefilter': prefilter_stats
+    })
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the pattern and page caches, and regex worker pool stats"""
+    info = compile_pattern.cache_info()
+    lookups = info.hits + info.misses
+    return jsonify({
+        'success': True,
+        'pattern_cache': {
+            'size': info.currsize,
+            'max_size': info.maxsize,
+            'hits': info.hits,
+            'misses': info.misses,
+            'hit_rate': round(info.hits / lookups, 4) if lookups else 0.0
+        },
+        'regex_pool': regex_pool.stats(),
+        'response_cache': response_cache.stats()
+    })
+
 if __name__ == '__main__':
+    # Warm the pool in the serving process (not the debug reloader's parent)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        regex_pool.start()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,594 @@
+"""
+Time-boxed regex evaluation in a pool of worker processes.
+
+Python's re module cannot be interrupted, so a pattern like (a+)+$ against
+'aaaa...b' backtracks for hours in whatever thread runs it. RegexPool keeps
+a set of warm worker processes; each job goes to an idle worker and the
+caller waits at most `timeout` seconds for the answer. A worker that runs
+past the deadline (or hits its memory limit, or dies) is killed and a fresh
+one is started in the background, so the pool never shrinks: a replacement
+that fails to start is retried with exponential backoff until one does.
+
+Jobs can also be streamed: the worker sends matches in batches as finditer
+produces them, and uploaded files are mapped with mmap and decoded a
+window at a time instead of being read into one string. run_batch() evaluates a whole
+patterns x strings matrix, spread over the workers in chunks of patterns;
+whatever is not done when its time is up comes back marked incomplete.
+"""
+import atexit
+import codecs
+import mmap
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+
+BATCH_INTERVAL = 0.1  # seconds; streamed batches are sent at least this often
+RESPAWN_BACKOFF = 0.5  # seconds before the first retry of a failed worker start
+RESPAWN_MAX_BACKOFF = 30.0
+PREFILTER_SHARE = 0.2  # of a batch's max_seconds, for the prefilter in the calling process
+DECODE_WINDOW = 1 << 20  # characters of an uploaded file searched at a time
+DECODE_OVERLAP = 1 << 16  # characters of context kept on both sides of a window
+
+
+class RegexTimeout(Exception):
+    """The job ran longer than the pool's timeout and its worker was killed"""
+
+
+class RegexMemoryError(Exception):
+    """The job exceeded the worker's memory limit"""
+
+
+class PoolBusy(Exception):
+    """No worker became free within queue_timeout"""
+
+
+def iter_matches(regex, subject, max_matches, max_output_chars):
+    """Yield match_info dicts until either limit is hit; returns truncated
+
+    Iteration stops at the limit, so a pattern like '' or '.' on a huge
+    input never builds millions of dicts. A bytes subject (an uploaded file
+    mapped with mmap) is read as UTF-8; offsets are in characters either way.
+    """
+    if isinstance(subject, str):
+        found = ((match, 0) for match in regex.finditer(subject))
+    else:
+        found = _finditer_decoded(regex, subject)
+    count = 0
+    output_chars = 0
+    for match, offset in found:
+        if count >= max_matches:
+            return True
+
+        groups = match.groups()
+        size = len(match.group(0)) + sum(len(group) for group in groups if group)
+        if count and output_chars + size > max_output_chars:
+            return True
+        output_chars += size
+        count += 1
+
+        yield {
+            'full_match': match.group(0),
+            'start': offset + match.start(),
+            'end': offset + match.end(),
+            'groups': list(groups),
+            'named_groups': match.groupdict()
+        }
+    return False
+
+
+def collect_matches(regex, subject, max_matches, max_output_chars):
+    """Returns (matches, truncated) for iter_matches"""
+    matches = []
+    iterator = iter_matches(regex, subject, max_matches, max_output_chars)
+    while True:
+        try:
+            matches.append(next(iterator))
+        except StopIteration as stop:
+            return matches, stop.value
+
+
+def _finditer_decoded(regex, data):
+    """finditer over UTF-8 bytes, decoded a window at a time; yields (match, offset)
+
+    Matches are the ones finditer would give on the whole decoded text, as
+    long as lookarounds reach no further than DECODE_OVERLAP characters.
+    Each search sees DECODE_OVERLAP characters on either side of the part
+    whose matches it keeps. A match that runs into the end of the decoded
+    text may be cut short, so it is searched again with a larger window.
+    offset is the position of the match's string in the whole text.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    text = ''  # decoded text from character `base` on
+    base = 0
+    read = 0  # bytes decoded so far
+    pos = 0  # where the next search starts, in text
+    empty_at = None  # an empty match here was already yielded
+    window = DECODE_WINDOW
+    while True:
+        while len(text) - pos < window + DECODE_OVERLAP and read < len(data):
+            text += decoder.decode(data[read:read + window])
+            read += window
+        final = read >= len(data)
+        if final:
+            text += decoder.decode(b'', True)
+        boundary = len(text) if final else len(text) - DECODE_OVERLAP
+
+        searched_from = pos
+        resume = boundary
+        for match in regex.finditer(text, pos):
+            if not final and (match.start() >= boundary or match.end() >= len(text)):
+                resume = min(match.start(), boundary)
+                break
+            if match.start() == match.end() == empty_at:
+                continue  # finditer moved past it before the window ended
+            yield match, base
+            pos = match.end()
+            empty_at = pos if match.start() == match.end() else None
+        else:
+            if final:
+                return
+
+        if resume <= searched_from:
+            window *= 2  # a match as long as the window; search it again with more text
+        else:
+            window = DECODE_WINDOW
+            if resume > pos:
+                pos = resume
+                empty_at = None
+        drop = max(0, pos - DECODE_OVERLAP)
+        text = text[drop:]
+        base += drop
+        pos -= drop
+        if empty_at is not None:
+            empty_at -= drop
+
+
+@lru_cache(maxsize=256)
+def _compile(pattern, flags):
+    return re.compile(pattern, flags)
+
+
+def _open_subject(text, path):
+    """The test string, or the uploaded file mapped read-only into memory"""
+    if path is None:
+        return text, None
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return '', None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mapped, mapped
+
+
+def literal_prefix(pattern, flags):
+    """Literal text every match of pattern starts with, or '' if none is known
+
+    Read off the parsed pattern: leading literals, skipping zero-width
+    assertions like ^ and \\b. Case-insensitive patterns get no prefix.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (re.error, RecursionError):
+        return ''
+    if parsed.state.flags & re.IGNORECASE:
+        return ''
+
+    chars = []
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            chars.append(chr(av))
+        elif op == sre_parse.AT:
+            continue
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, _, item = av
+            if low >= 1 and len(item) == 1 and item[0][0] == sre_parse.LITERAL:
+                chars.append(chr(item[0][1]))
+            break
+        else:
+            break
+    return ''.join(chars)
+
+
+def run_matrix_job(conn, job):
+    """Evaluate patterns against strings, sending one ('batch', row) per pattern
+
+    Each entry is (pattern, flags, candidates); candidates lists the string
+    indices that passed the prefilter (None for all). Rows hold match counts
+    (mode 'count') or the first match span (mode 'first'), and 0 / None for
+    strings that were skipped.
+    """
+    _, entries, strings, mode = job
+    try:
+        for pattern, flags, candidates in entries:
+            regex = _compile(pattern, flags)
+            if mode == 'first':
+                row = [None] * len(strings)
+                for index in (range(len(strings)) if candidates is None else candidates):
+                    match = regex.search(strings[index])
+                    if match is not None:
+                        row[index] = [match.start(), match.end()]
+            else:
+                row = [0] * len(strings)
+                for index in (range(len(strings)) if candidates is None else candidates):
+                    row[index] = sum(1 for _ in regex.finditer(strings[index]))
+            conn.send(('batch', row))
+        conn.send(('done', False))
+    except MemoryError:
+        conn.send(('memory', None))
+    except re.error as e:
+        conn.send(('error', str(e)))
+
+
+def run_job(conn, job):
+    """Evaluate one job, sending ('batch', [...]) messages then ('done', truncated)"""
+    if job[0] == 'matrix':
+        run_matrix_job(conn, job)
+        return
+    _, pattern, flags, text, path, max_matches, max_output_chars, batch_size = job
+    mapped = None
+    try:
+        subject, mapped = _open_subject(text, path)
+        iterator = iter_matches(_compile(pattern, flags), subject, max_matches, max_output_chars)
+
+        batch = []
+        flushed_at = time.monotonic()
+        while True:
+            try:
+                batch.append(next(iterator))
+            except StopIteration as stop:
+                truncated = stop.value
+                break
+            if batch_size and (len(batch) >= batch_size or time.monotonic() - flushed_at >= BATCH_INTERVAL):
+                conn.send(('batch', batch))
+                batch = []
+                flushed_at = time.monotonic()
+        if batch or not batch_size:
+            conn.send(('batch', batch))
+        conn.send(('done', truncated))
+    except MemoryError:
+        conn.send(('memory', None))
+    except re.error as e:
+        conn.send(('error', str(e)))
+    except OSError as e:
+        conn.send(('error', f'cannot read uploaded file: {e}'))
+    finally:
+        if mapped is not None:
+            mapped.close()
+
+
+def worker_main(conn, memory_limit):
+    """Worker process loop: receive a job, run it, repeat"""
+    if resource is not None and memory_limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ValueError, OSError):
+            pass  # not enforceable here (e.g. macOS); the timeout still applies
+    conn.send('ready')
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        run_job(conn, job)
+
+
+class _Worker:
+    def __init__(self, context, memory_limit):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout) or self.conn.recv() != 'ready':
+            raise RuntimeError('regex worker did not start')
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class MatchStream:
+    """Match batches of one job as they arrive from its worker
+
+    Each batch must arrive within the pool timeout (a backtracking pattern
+    produces nothing) and the whole job must finish by `deadline`. close()
+    hands the worker back, or replaces it if the job did not run to the end.
+    """
+
+    def __init__(self, pool, worker, deadline):
+        self.pool = pool
+        self.worker = worker
+        self.deadline = deadline
+        self.truncated = False
+        self.finished = False
+        self.healthy = False
+
+    def __iter__(self):
+        while True:
+            wait = min(self.pool.timeout, self.deadline - time.monotonic())
+            try:
+                if wait <= 0 or not self.worker.conn.poll(wait):
+                    self.pool._count('timeouts')
+                    raise RegexTimeout(f'regex evaluation timed out after {self.pool.timeout:g} s')
+                status, payload = self.worker.conn.recv()
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f'regex worker died: {e}') from e
+
+            if status == 'batch':
+                yield payload
+                continue
+            if status == 'memory':
+                self.pool._count('memory_errors')
+                raise RegexMemoryError('regex evaluation exceeded the worker memory limit')
+
+            # Job over and the worker is ready for the next one
+            self.healthy = True
+            self.finished = True
+            self.pool._count('jobs')
+            if status == 'error':
+                raise re.error(payload)
+            self.truncated = payload
+            return
+
+    def close(self):
+        if self.worker is None:
+            return
+        worker, self.worker = self.worker, None
+        if self.healthy:
+            self.pool._idle.put(worker)
+        else:
+            self.pool._replace(worker)
+
+
+class RegexPool:
+    """Fixed-size pool of regex worker processes with per-job timeout"""
+
+    def __init__(self, size=4, timeout=2.0, memory_limit=512 * 1024 * 1024, queue_timeout=5.0,
+                 start_method=None):
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.queue_timeout = queue_timeout
+        if start_method is None:
+            # forkserver makes replacements cheap; spawn is the portable fallback.
+            # Never plain fork: the app is multi-threaded by the time workers start
+            methods = multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if 'forkserver' in methods else 'spawn'
+        self._context = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self._generation = 0  # bumped by close(), so pending replacements give up
+        self.jobs = 0
+        self.timeouts = 0
+        self.memory_errors = 0
+        self.restarts = 0
+        self.failed_restarts = 0
+
+    def start(self):
+        """Start all workers and wait until they are ready (idempotent)"""
+        with self._lock:
+            if self._started:
+                return
+            workers = [_Worker(self._context, self.memory_limit) for _ in range(self.size)]
+            for worker in workers:
+                worker.wait_ready(timeout=60)
+                self._workers.add(worker)
+                self._idle.put(worker)
+            self._started = True
+        atexit.register(self.close)
+
+    def open(self, pattern, flags, text=None, path=None, max_matches=1000, max_output_chars=1000000,
+             batch_size=None, max_seconds=None):
+        """Start a job on an idle worker and return its MatchStream
+
+        Exactly one of text and path is given; path is a file the worker maps
+        with mmap. batch_size=None sends all matches in one batch at the end.
+        The caller must close() the stream. Raises PoolBusy.
+        """
+        return self._submit(
+            ('find', pattern, flags, text, path, max_matches, max_output_chars, batch_size),
+            time.monotonic() + (max_seconds or self.timeout)
+        )
+
+    def _submit(self, job, deadline, queue_timeout=None):
+        self.start()
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout if queue_timeout is None else queue_timeout)
+        except queue.Empty:
+            raise PoolBusy(f'all {self.size} regex workers are busy') from None
+
+        stream = MatchStream(self, worker, deadline)
+        try:
+            worker.conn.send(job)
+        except (EOFError, OSError) as e:
+            stream.close()
+            raise RuntimeError(f'regex worker died: {e}') from e
+        return stream
+
+    def run(self, pattern, flags, test_string, max_matches, max_output_chars):
+        """Evaluate the pattern in a worker; returns (matches, truncated)
+
+        Raises RegexTimeout, RegexMemoryError, PoolBusy, or re.error for an
+        invalid pattern.
+        """
+        stream = self.open(pattern, flags, text=test_string, max_matches=max_matches,
+                           max_output_chars=max_output_chars)
+        try:
+            matches = [match for batch in stream for match in batch]
+            return matches, stream.truncated
+        finally:
+            stream.close()
+
+    def run_batch(self, patterns, strings, mode='count', prefilter=True, max_seconds=30.0):
+        """Evaluate every (pattern, flags) in patterns against every string
+
+        Returns (matrix, timed_out, incomplete, prefilter_stats): one row per
+        pattern, the indices of patterns that hit the per-job timeout or ran
+        out of memory, and the indices of patterns not evaluated before
+        max_seconds ran out (waiting for a worker counts). Both kinds get a
+        None row; every other row is complete. Patterns are split into chunks
+        that run on separate workers; a pattern that times out loses only its
+        own row, the rest of its chunk is retried on a fresh worker.
+        """
+        started = time.monotonic()
+        deadline = started + max_seconds
+        candidates = [None] * len(patterns)
+        prefilter_stats = {'patterns_with_prefix': 0, 'cells_skipped': 0, 'stopped_early': False}
+        if prefilter:
+            # One substring scan per distinct prefix, shared by every pattern
+            # with it. This runs in the calling process, so it gets a share of
+            # the time; patterns it doesn't get to are matched against every string
+            prefilter_deadline = started + max_seconds * PREFILTER_SHARE
+            by_prefix = {}
+            for position, (pattern, flags) in enumerate(patterns):
+                if time.monotonic() >= prefilter_deadline:
+                    prefilter_stats['stopped_early'] = True
+                    break
+                prefix = literal_prefix(pattern, flags)
+                if prefix:
+                    by_prefix.setdefault(prefix, []).append(position)
+            for prefix, positions in by_prefix.items():
+                if time.monotonic() >= prefilter_deadline:
+                    prefilter_stats['stopped_early'] = True
+                    break
+                matching = [index for index, string in enumerate(strings) if prefix in string]
+                for position in positions:
+                    candidates[position] = matching
+                prefilter_stats['patterns_with_prefix'] += len(positions)
+                prefilter_stats['cells_skipped'] += len(positions) * (len(strings) - len(matching))
+
+        entries = [(position, (pattern, flags, candidates[position]))
+                   for position, (pattern, flags) in enumerate(patterns)]
+        chunk_count = max(1, min(len(entries), self.size * 2))
+        chunks = [entries[start::chunk_count] for start in range(chunk_count)]
+
+        matrix = [None] * len(patterns)
+        timed_out = []
+        incomplete = []
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            for rows, chunk_timed_out, chunk_incomplete in executor.map(
+                lambda chunk: self._run_matrix_chunk(chunk, strings, mode, deadline), chunks
+            ):
+                for position, row in rows.items():
+                    matrix[position] = row
+                timed_out.extend(chunk_timed_out)
+                incomplete.extend(chunk_incomplete)
+        return matrix, sorted(timed_out), sorted(incomplete), prefilter_stats
+
+    def _run_matrix_chunk(self, pending, strings, mode, deadline):
+        """Returns (rows by position, timed out positions, incomplete positions)"""
+        rows = {}
+        timed_out = []
+        while pending:
+            # Other chunks of the batch may hold the workers for a while, so
+            # wait as long as the batch has left rather than queue_timeout
+            try:
+                stream = self._submit(
+                    ('matrix', [entry for _, entry in pending], strings, mode),
+                    deadline,
+                    queue_timeout=max(0.0, deadline - time.monotonic())
+                )
+            except PoolBusy:
+                break
+            received = 0
+            try:
+                for row in stream:
+                    rows[pending[received][0]] = row
+                    received += 1
+                pending = []
+            except (RegexTimeout, RegexMemoryError):
+                if time.monotonic() >= deadline:
+                    pending = pending[received:]
+                    break
+                # Rows arrive in order, so the pattern being evaluated is the culprit
+                timed_out.append(pending[received][0])
+                pending = pending[received + 1:]
+            finally:
+                stream.close()
+        return rows, timed_out, [position for position, _ in pending]
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _replace(self, worker):
+        """Kill a worker and start its replacement without blocking the caller"""
+        with self._lock:
+            self._workers.discard(worker)
+            self.restarts += 1
+            generation = self._generation
+
+        def replace():
+            worker.kill()
+            backoff = RESPAWN_BACKOFF
+            while True:
+                replacement = None
+                try:
+                    replacement = _Worker(self._context, self.memory_limit)
+                    replacement.wait_ready(timeout=60)
+                except (RuntimeError, EOFError, OSError):
+                    # e.g. out of memory or processes; keep the slot and try again
+                    if replacement is not None:
+                        replacement.kill()
+                    self._count('failed_restarts')
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, RESPAWN_MAX_BACKOFF)
+                    if self._generation != generation:
+                        return
+                    continue
+                with self._lock:
+                    if self._generation != generation:
+                        break  # the pool was closed meanwhile
+                    self._workers.add(replacement)
+                    self._idle.put(replacement)
+                    return
+            replacement.kill()
+
+        threading.Thread(target=replace, daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = list(self._workers), set()
+            self._idle = queue.Queue()
+            self._started = False
+            self._generation += 1
+        for worker in workers:
+            worker.kill()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'alive': len(self._workers),
+                'idle': self._idle.qsize(),
+                'timeout_seconds': self.timeout,
+                'memory_limit_bytes': self.memory_limit,
+                'jobs': self.jobs,
+                'timeouts': self.timeouts,
+                'memory_errors': self.memory_errors,
+                'restarts': self.restarts,
+                'failed_restarts': self.failed_restarts
+            }
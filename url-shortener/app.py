@@ -1,17 +1,88 @@
 from flask import Flask, render_template, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
-import string
-import random
-from urllib.parse import urlparse
+import os
+import hashlib
+import json
+import base64
+from urllib.parse import urlparse, urlsplit, urlunsplit
 import requests
+from redirect_cache import RedirectCache
+from mmap_table import RedirectTable
+from code_filter import ABSENT, CodeFilter
+from click_buffer import ClickAggregator
+from code_allocator import make_code_allocator
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable
+from sqlite_tuning import DEFAULT_PRAGMAS, engine_options, apply_pragmas, make_read_engine
+from instrumentation import init_instrumentation
+from response_cache import init_response_cache
 
 app = Flask(__name__)
 
 # Database Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///url_shortener.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///url_shortener.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_PRAGMAS'] = DEFAULT_PRAGMAS
+app.config['READ_POOL_SIZE'] = 10  # query_only connections used by redirects
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        pool_size=5,
+        max_overflow=10,
+        busy_timeout=DEFAULT_PRAGMAS['busy_timeout']
+    )
+
+# Redirect cache configuration
+app.config['REDIRECT_CACHE_SIZE'] = 10000
+app.config['REDIRECT_CACHE_TTL'] = 300  # seconds
+app.config['REDIRECT_TABLE'] = True  # mmap'd code -> URL file shared by all workers, next to the database
+app.config['REDIRECT_TABLE_REBUILD_INTERVAL'] = 3600.0  # seconds before the file is rebuilt from the database
+app.config['CODE_FILTER'] = True  # Bloom filter answering 404s for unknown codes without a query
+app.config['CODE_FILTER_CAPACITY'] = 100000  # codes; grows when the table outgrows it
+app.config['CODE_FILTER_ERROR_RATE'] = 0.01
+app.config['CODE_FILTER_CATCH_UP_INTERVAL'] = 5.0  # seconds between scans for other workers' codes
+app.config['CODE_FILTER_REBUILD_INTERVAL'] = 300.0  # seconds between full rebuilds
+app.config['CLICK_FLUSH_INTERVAL'] = 2.0  # seconds
+app.config['CLICK_FLUSH_MAX_PENDING'] = 500  # buffered clicks that trigger a flush before the interval is up
+app.config['CLICK_BUFFER_MAX'] = 5000  # clicks buffered at most (all a crash can lose); more are dropped while flushes fail
+
+# Short code allocation
+app.config['SHORT_CODE_ALLOCATOR'] = 'feistel'  # 'feistel', 'sequence' or 'random'
+app.config['SHORT_CODE_LENGTH'] = 6
+app.config['SHORT_CODE_BLOCK_SIZE'] = 1000
+app.config['SHORT_CODE_KEY'] = 'change-this-short-code-key'
+
+# Instrumentation: /metrics and slow request logging, off unless APP_METRICS=1
+app.config['METRICS_ENABLED'] = os.environ.get('APP_METRICS') == '1'
+app.config['SLOW_REQUEST_MS'] = 500
+
+# Rendered pages and static files, stored pre-compressed (gzip, brotli if installed)
+app.config['RESPONSE_CACHE_SIZE'] = 256
+app.config['RESPONSE_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
 
 db = SQLAlchemy(app)
+with app.app_context():
+    apply_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+    read_engine = make_read_engine(
+        db.engine,
+        app.config['SQLITE_PRAGMAS'],
+        pool_size=app.config['READ_POOL_SIZE']
+    )
+    database_file = db.engine.url.database if db.engine.url.get_backend_name() == 'sqlite' else None
+    if app.config['METRICS_ENABLED']:
+        init_instrumentation(
+            app,
+            engines=(db.engine, read_engine),
+            slow_request_ms=app.config['SLOW_REQUEST_MS']
+        )
+response_cache = init_response_cache(
+    app,
+    max_entries=app.config['RESPONSE_CACHE_SIZE'],
+    max_bytes=app.config['RESPONSE_CACHE_MAX_BYTES']
+)
+redirect_cache = RedirectCache(
+    max_size=app.config['REDIRECT_CACHE_SIZE'],
+    ttl=app.config['REDIRECT_CACHE_TTL']
+)
 
 # Database Model
 class URLMapping(db.Model):
@@ -20,6 +91,14 @@ class URLMapping(db.Model):
     shortened_url = db.Column(db.String(10), unique=True, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     click_count = db.Column(db.Integer, default=0)
+    # SHA-256 of the normalized URL; dedup is a probe on this unique index
+    url_hash = db.Column(db.String(64), unique=True, index=True)
+
+    __table_args__ = (
+        db.Index('ix_url_mapping_created_at_id', 'created_at', 'id'),
+        # Ids are never reused, so the code filter can catch up by id
+        {'sqlite_autoincrement': True},
+    )
 
     def to_dict(self):
         return {
@@ -30,11 +109,124 @@ class URLMapping(db.Model):
             'click_count': self.click_count
         }
 
+class CodeSequence(db.Model):
+    """Counter that short code blocks are reserved from"""
+    name = db.Column(db.String(32), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=0)
+
 # Helper Functions
-def generate_short_code(length=6):
-    """Generate a random short code"""
-    characters = string.ascii_letters + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def flush_click_counts(batch):
+    """Apply buffered clicks as one batched UPDATE ... SET click_count = click_count + ?"""
+    table = URLMapping.__table__
+    stmt = (
+        table.update()
+        .where(table.c.shortened_url == db.bindparam('code'))
+        .values(click_count=table.c.click_count + db.bindparam('clicks'))
+    )
+    with app.app_context():
+        db.session.execute(stmt, [{'code': code, 'clicks': clicks} for code, clicks in batch])
+        db.session.commit()
+
+click_aggregator = ClickAggregator(
+    flush_click_counts,
+    flush_interval=app.config['CLICK_FLUSH_INTERVAL'],
+    max_pending=app.config['CLICK_FLUSH_MAX_PENDING'],
+    max_buffered=app.config['CLICK_BUFFER_MAX']
+)
+
+def load_redirect_rows():
+    """(code, url) for every mapping, to build the redirect table from"""
+    with read_engine.connect() as conn:
+        yield from conn.execution_options(yield_per=10000).execute(
+            db.select(URLMapping.shortened_url, URLMapping.original_url)
+        )
+
+def count_redirect_rows():
+    with read_engine.connect() as conn:
+        return conn.execute(db.select(db.func.count()).select_from(URLMapping)).scalar()
+
+# In-memory databases can't be shared between processes, so they get no table
+redirect_table = None
+if app.config['REDIRECT_TABLE'] and database_file not in (None, '', ':memory:'):
+    redirect_table = RedirectTable(
+        database_file + '.redirects',
+        load_redirect_rows,
+        count_redirect_rows,
+        rebuild_interval=app.config['REDIRECT_TABLE_REBUILD_INTERVAL']
+    )
+
+def load_filter_codes(after_id):
+    """(id, code) for every mapping with a larger id, to fill the code filter from"""
+    with read_engine.connect() as conn:
+        yield from conn.execution_options(yield_per=10000).execute(
+            db.select(URLMapping.id, URLMapping.shortened_url)
+            .where(URLMapping.id > after_id)
+            .order_by(URLMapping.id)
+        )
+
+def last_assigned_mapping_id():
+    """Largest mapping id ever assigned; url_mapping is AUTOINCREMENT, so SQLite keeps it in sqlite_sequence"""
+    with read_engine.connect() as conn:
+        return conn.execute(
+            db.text("SELECT seq FROM sqlite_sequence WHERE name = 'url_mapping'")
+        ).scalar()
+
+code_filter = None
+if app.config['CODE_FILTER']:
+    code_filter = CodeFilter(
+        load_filter_codes,
+        last_assigned_mapping_id,
+        capacity=app.config['CODE_FILTER_CAPACITY'],
+        error_rate=app.config['CODE_FILTER_ERROR_RATE'],
+        catch_up_interval=app.config['CODE_FILTER_CATCH_UP_INTERVAL'],
+        rebuild_interval=app.config['CODE_FILTER_REBUILD_INTERVAL']
+    )
+
+_not_found_page = None
+
+def not_found_page():
+    """404.html, rendered once; it has no per-request content"""
+    global _not_found_page
+    if _not_found_page is None:
+        _not_found_page = render_template('404.html')
+    return _not_found_page
+
+def reserve_code_block(size):
+    """Atomically reserve [start, start + size) from the persisted code sequence"""
+    table = CodeSequence.__table__
+    with app.app_context():
+        for _ in range(3):
+            try:
+                # The UPDATE takes SQLite's write lock, so the read below sees
+                # our own reservation and no other process can interleave
+                result = db.session.execute(
+                    table.update()
+                    .where(table.c.name == 'short_code')
+                    .values(next_value=table.c.next_value + size)
+                )
+                if result.rowcount == 0:
+                    db.session.execute(table.insert().values(name='short_code', next_value=size))
+                    start = 0
+                else:
+                    start = db.session.execute(
+                        db.select(table.c.next_value).where(table.c.name == 'short_code')
+                    ).scalar_one() - size
+                db.session.commit()
+                return start
+            except IntegrityError:
+                # Another process created the sequence row first
+                db.session.rollback()
+    raise RuntimeError('Could not reserve a block of short codes')
+
+code_allocator = make_code_allocator(
+    app.config['SHORT_CODE_ALLOCATOR'],
+    reserve_code_block,
+    length=app.config['SHORT_CODE_LENGTH'],
+    block_size=app.config['SHORT_CODE_BLOCK_SIZE'],
+    key=app.config['SHORT_CODE_KEY']
+)
 
 def is_valid_url(url):
     """Validate if the URL is properly formatted and accessible"""
@@ -64,33 +256,241 @@ def is_valid_url(url):
     except Exception as e:
         return False, str(e)
 
+def normalize_url(url):
+    """Canonical form of a URL used for dedup (lowercase scheme/host, no default port)"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    try:
+        host = parts.hostname or ''
+        if ':' in host:
+            host = f'[{host}]'  # IPv6 literal
+        if parts.port and DEFAULT_PORTS.get(scheme) != parts.port:
+            host = f'{host}:{parts.port}'
+        userinfo = parts.netloc.rpartition('@')[0]
+        netloc = f'{userinfo}@{host}' if userinfo else host
+    except ValueError:
+        pass  # malformed port, keep the lowercased netloc
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, parts.fragment))
+
+def url_hash(url):
+    """Fixed-width digest of the normalized URL, backed by a unique index"""
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+def find_short_code(digest):
+    """Index probe for an existing mapping with the given url_hash"""
+    row = db.session.query(URLMapping.shortened_url).filter_by(url_hash=digest).first()
+    return row.shortened_url if row else None
+
+HISTORY_FIELDS = ('id', 'original_url', 'shortened_url', 'created_at', 'click_count')
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
+
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor for the (created_at, id) of the last row on a page"""
+    return base64.urlsafe_b64encode(f'{created_at}|{row_id}'.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return created_at, int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def parse_history_args(args):
+    """Validate the limit, cursor and fields query arguments of /api/history"""
+    try:
+        limit = int(args.get('limit', HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= HISTORY_MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {HISTORY_MAX_LIMIT}')
+    
+    cursor = args.get('cursor')
+    cursor = decode_cursor(cursor) if cursor else None
+    
+    fields = args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = set(fields) - set(HISTORY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    else:
+        fields = list(HISTORY_FIELDS)
+    return limit, cursor, fields
+
+def fetch_history_page(limit, cursor, fields, *criteria):
+    """Keyset-paginated history, newest first, selecting only the requested columns
+
+    Rows come back as plain tuples, so no URLMapping objects are hydrated.
+    created_at is compared in its stored text form so the cursor matches
+    rows exactly and the (created_at, id) index serves the range scan.
+    """
+    created_raw = db.type_coerce(URLMapping.created_at, db.String)
+    columns = [URLMapping.id, created_raw.label('cursor_created_at')]
+    columns += [getattr(URLMapping, field) for field in fields if field != 'id']
+    
+    query = db.session.query(*columns).filter(*criteria)
+    if cursor:
+        query = query.filter(db.tuple_(created_raw, URLMapping.id) < cursor)
+    rows = query.order_by(created_raw.desc(), URLMapping.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].cursor_created_at, rows[-1].id)
+    
+    data = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            value = getattr(row, field)
+            if field == 'created_at' and value is not None:
+                value = value.strftime('%Y-%m-%d %H:%M:%S')
+            item[field] = value
+        data.append(item)
+    return data, next_cursor
+
 def get_or_create_short_url(original_url):
     """Get existing shortened URL or create a new one"""
     # Check if URL already exists
-    existing = URLMapping.query.filter_by(original_url=original_url).first()
+    digest = url_hash(original_url)
+    existing = find_short_code(digest)
     if existing:
-        return existing.shortened_url, False  # False = not newly created
+        return existing, False  # False = not newly created
     
-    # Generate unique short code
-    while True:
-        short_code = generate_short_code()
-        if not URLMapping.query.filter_by(shortened_url=short_code).first():
+    # Allocate a code without probing the table. The unique index still
+    # rejects codes left over from the old random generator, so retry then.
+    for _ in range(5):
+        short_code = code_allocator.allocate()
+        new_mapping = URLMapping(original_url=original_url, shortened_url=short_code, url_hash=digest)
+        db.session.add(new_mapping)
+        try:
+            db.session.commit()
+            if redirect_table is not None:
+                redirect_table.put(short_code, original_url)
+            if code_filter is not None:
+                code_filter.add(short_code)
+            return short_code, True  # True = newly created
+        except IntegrityError:
+            db.session.rollback()
+            # A concurrent request may have shortened the same URL first
+            existing = find_short_code(digest)
+            if existing:
+                return existing, False
+    
+    raise RuntimeError('Could not allocate a unique short code')
+
+BATCH_MAX_URLS = 50000
+IN_QUERY_CHUNK = 900  # stays under SQLite's bound-parameter limit
+
+def read_batch_urls():
+    """Parse a batch body: a JSON array or NDJSON, each item a URL or {"url": ...}"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValueError('Expected a JSON array of URLs')
+    
+    if len(items) > BATCH_MAX_URLS:
+        raise ValueError(f'A batch can contain at most {BATCH_MAX_URLS} URLs')
+    return [item.get('url', '') if isinstance(item, dict) else item for item in items]
+
+def find_short_codes(digests):
+    """Map url_hash -> shortened_url for the digests that already exist"""
+    found = {}
+    for start in range(0, len(digests), IN_QUERY_CHUNK):
+        chunk = digests[start:start + IN_QUERY_CHUNK]
+        found.update(
+            db.session.query(URLMapping.url_hash, URLMapping.shortened_url)
+            .filter(URLMapping.url_hash.in_(chunk))
+        )
+    return found
+
+def shorten_many(urls):
+    """Shorten a list of URLs in a single transaction; returns one result per input
+
+    Existing mappings are resolved with IN queries, new codes come from one
+    allocator call and all new rows go in with a single executemany INSERT.
+    """
+    results = [None] * len(urls)
+    pending = {}  # url_hash -> (processed_url, [input positions])
+    for position, raw_url in enumerate(urls):
+        if not isinstance(raw_url, str):
+            results[position] = {'success': False, 'error': 'URL must be a string'}
+            continue
+        
+        original_url = raw_url.strip()
+        if not original_url:
+            results[position] = {'success': False, 'error': 'URL cannot be empty'}
+            continue
+        
+        is_valid, processed_url = is_valid_url(original_url)
+        if not is_valid:
+            results[position] = {'success': False, 'error': processed_url}
+            continue
+        
+        digest = url_hash(processed_url)
+        if digest in pending:
+            pending[digest][1].append(position)
+        else:
+            pending[digest] = (processed_url, [position])
+    
+    table = URLMapping.__table__
+    for _ in range(3):
+        existing = find_short_codes(list(pending))
+        new_digests = [digest for digest in pending if digest not in existing]
+        created = dict(zip(new_digests, code_allocator.allocate_many(len(new_digests))))
+        rows = [
+            {'original_url': pending[digest][0], 'shortened_url': short_code, 'url_hash': digest}
+            for digest, short_code in created.items()
+        ]
+        try:
+            if rows:
+                db.session.execute(table.insert(), rows)
+            db.session.commit()
             break
+        except IntegrityError:
+            # A leftover random code or a concurrent shorten of the same URL;
+            # re-resolve and retry with fresh codes
+            db.session.rollback()
+    else:
+        raise RuntimeError('Could not allocate unique short codes for the batch')
+    
+    if redirect_table is not None:
+        redirect_table.put_many((short_code, pending[digest][0]) for digest, short_code in created.items())
+    if code_filter is not None:
+        code_filter.add_many(created.values())
     
-    # Create new mapping
-    new_mapping = URLMapping(original_url=original_url, shortened_url=short_code)
-    db.session.add(new_mapping)
-    db.session.commit()
+    for digest, (processed_url, positions) in pending.items():
+        short_code = created.get(digest) or existing[digest]
+        for number, position in enumerate(positions):
+            results[position] = {
+                'success': True,
+                'short_code': short_code,
+                'shortened_url': f"http://localhost:5000/s/{short_code}",
+                'created': digest in created and number == 0
+            }
     
-    return short_code, True  # True = newly created
+    for position, result in enumerate(results):
+        result['url'] = urls[position]
+    return results
 
 # Routes
 @app.route('/')
+@response_cache.cached()
 def home():
     """Home page"""
     return render_template('index.html')
 
 @app.route('/history')
+@response_cache.cached()
 def history():
     """History page"""
     return render_template('history.html')
@@ -128,14 +528,45 @@ def shorten_url():
     except Exception as e:
         return jsonify({'success': False, 'error': f'Error: {str(e)}'}), 500
 
+@app.route('/api/shorten/batch', methods=['POST'])
+def shorten_batch():
+    """API endpoint to shorten many URLs (JSON array or NDJSON body) at once"""
+    try:
+        urls = read_batch_urls()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        results = shorten_many(urls)
+        return jsonify({
+            'success': True,
+            'created': sum(1 for result in results if result.get('created')),
+            'failed': sum(1 for result in results if not result['success']),
+            'results': results
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Error: {str(e)}'}), 500
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    """API endpoint to get all shortened URLs"""
+    """API endpoint to get shortened URLs, newest first, one page at a time
+    
+    Query args: limit (default 50), cursor (next_cursor of the previous page)
+    and fields (comma separated subset of HISTORY_FIELDS).
+    """
+    try:
+        limit, cursor, fields = parse_history_args(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     try:
-        urls = URLMapping.query.order_by(URLMapping.created_at.desc()).all()
+        data, next_cursor = fetch_history_page(limit, cursor, fields)
         return jsonify({
             'success': True,
-            'data': [url.to_dict() for url in urls]
+            'data': data,
+            'next_cursor': next_cursor
         }), 200
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -144,18 +575,33 @@ def get_history():
 def redirect_to_original(short_code):
     """Redirect to original URL"""
     try:
-        mapping = URLMapping.query.filter_by(shortened_url=short_code).first()
+        # Shared table first, then this process's cache, then the database
+        original_url = redirect_table.get(short_code) if redirect_table is not None else None
+        if original_url is None:
+            original_url = redirect_cache.get(short_code)
+        if original_url is None:
+            # Codes the filter has never seen are answered without a query
+            answer = code_filter.lookup(short_code) if code_filter is not None else None
+            if answer == ABSENT:
+                return not_found_page(), 404
+            with read_engine.connect() as conn:
+                original_url = conn.execute(
+                    db.select(URLMapping.original_url).where(URLMapping.shortened_url == short_code)
+                ).scalar()
+            
+            if original_url is None:
+                if code_filter is not None:
+                    code_filter.missed(answer)
+                return not_found_page(), 404
+            
+            redirect_cache.put(short_code, original_url)
         
-        if not mapping:
-            return render_template('404.html'), 404
-        
-        # Increment click count
-        mapping.click_count += 1
-        db.session.commit()
+        # Buffer the click; it is written to the database in the next batch
+        click_aggregator.record(short_code)
         
         # Redirect to original URL
         from flask import redirect
-        return redirect(mapping.original_url, code=302)
+        return redirect(original_url, code=302)
     
     except Exception as e:
         return render_template('error.html', error=str(e)), 500
@@ -164,13 +610,22 @@ def redirect_to_original(short_code):
 def delete_url(url_id):
     """Delete a shortened URL from history"""
     try:
+        # Read before the row: a scan after this point may or may not have seen it
+        filter_generation = code_filter.generation if code_filter is not None else None
         url_mapping = URLMapping.query.get(url_id)
         
         if not url_mapping:
             return jsonify({'success': False, 'error': 'URL not found'}), 404
         
+        row_id, short_code = url_mapping.id, url_mapping.shortened_url
         db.session.delete(url_mapping)
         db.session.commit()
+        if redirect_table is not None:
+            redirect_table.remove(short_code)
+        if code_filter is not None:
+            code_filter.remove(row_id, short_code, filter_generation)
+        redirect_cache.invalidate(short_code)
+        click_aggregator.discard([short_code])
         
         return jsonify({'success': True, 'message': 'URL deleted successfully'}), 200
     
@@ -183,13 +638,113 @@ def clear_all_history():
     try:
         URLMapping.query.delete()
         db.session.commit()
+        if redirect_table is not None:
+            redirect_table.clear()
+        if code_filter is not None:
+            code_filter.clear()
+        redirect_cache.clear()
+        click_aggregator.discard_all()
         
         return jsonify({'success': True, 'message': 'All history cleared'}), 200
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters for the redirect, page caches and click buffer"""
+    return jsonify({
+        'success': True,
+        'redirect_cache': redirect_cache.stats(),
+        'click_buffer': click_aggregator.stats(),
+        'redirect_table': redirect_table.stats() if redirect_table is not None else None,
+        'code_filter': code_filter.stats() if code_filter is not None else None,
+        'response_cache': response_cache.stats()
+    }), 200
+
+# Database setup
+def backfill_url_hashes():
+    """Add and backfill url_hash on databases created before it existed"""
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('url_mapping')}
+    if 'url_hash' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE url_mapping ADD COLUMN url_hash VARCHAR(64)'))
+    
+    # Backfill in id order, one batch per transaction
+    table = URLMapping.__table__
+    last_id = 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                db.select(table.c.id, table.c.original_url)
+                .where(table.c.url_hash.is_(None), table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(1000)
+            ).all()
+            if not rows:
+                break
+            conn.execute(
+                table.update().where(table.c.id == db.bindparam('row_id')).values(url_hash=db.bindparam('digest')),
+                [{'row_id': row.id, 'digest': url_hash(row.original_url)} for row in rows]
+            )
+            last_id = rows[-1].id
+    
+    with db.engine.begin() as conn:
+        # Rows that only differ after normalization keep their history but
+        # only the oldest one stays a dedup target
+        conn.execute(db.text(
+            'UPDATE url_mapping SET url_hash = NULL WHERE url_hash IS NOT NULL AND id NOT IN '
+            '(SELECT MIN(id) FROM url_mapping WHERE url_hash IS NOT NULL GROUP BY url_hash)'
+        ))
+
+def has_autoincrement(table_name):
+    """Whether SQLite created the table with AUTOINCREMENT"""
+    with db.engine.connect() as conn:
+        sql = conn.execute(
+            db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': table_name}
+        ).scalar()
+    return sql is not None and 'AUTOINCREMENT' in sql.upper()
+
+def rebuild_table(table):
+    """Recreate a table with its current definition, keeping its rows
+    
+    SQLite can't add AUTOINCREMENT to an existing table, so create a copy
+    with the current definition, move the rows over, drop the old table and
+    rename the copy. Indexes are recreated by migrate_db afterwards.
+    """
+    rebuilt = table.to_metadata(db.MetaData(), name=f'{table.name}_rebuild')
+    columns = ', '.join(column.name for column in table.columns)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{rebuilt.name}"')  # left by an interrupted run
+        conn.execute(CreateTable(rebuilt))
+        conn.exec_driver_sql(f'INSERT INTO "{rebuilt.name}" ({columns}) SELECT {columns} FROM "{table.name}"')
+        conn.exec_driver_sql(f'DROP TABLE "{table.name}"')
+        conn.exec_driver_sql(f'ALTER TABLE "{rebuilt.name}" RENAME TO "{table.name}"')
+
+def migrate_db():
+    """Bring databases created by older versions up to the current schema"""
+    existing = {index['name'] for index in db.inspect(db.engine).get_indexes('url_mapping')}
+    if 'ix_url_mapping_url_hash' not in existing:
+        backfill_url_hashes()
+    
+    if db.engine.dialect.name == 'sqlite' and not has_autoincrement('url_mapping'):
+        rebuild_table(URLMapping.__table__)
+    
+    # Indexes are created last so the unique url_hash index sees deduplicated rows
+    for index in URLMapping.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+def init_db():
+    """Create missing tables and migrate existing ones"""
+    db.create_all()
+    migrate_db()
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
+        if redirect_table is not None:
+            redirect_table.open()
+        if code_filter is not None:
+            code_filter.build()
     app.run(debug=True, port=5000)
\ No newline at end of file
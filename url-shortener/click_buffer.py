@@ -0,0 +1,170 @@
+"""
+Write-behind click counter.
+
+Redirects record clicks in memory; a background thread applies them to the
+database as one batched UPDATE per flush. A flush happens every
+`flush_interval` seconds, as soon as `max_pending` clicks are buffered, and
+once more at interpreter shutdown. Recording never writes: reaching
+`max_pending` only wakes the flusher thread, so a request thread (or an
+event loop) is never stuck behind the database, and a failed flush is
+retried one `flush_interval` later instead of on every following click.
+
+Clicks keep arriving while a flush runs or the database is failing, so
+`max_pending` is not a limit. `max_buffered` is: clicks past it are
+dropped and counted, which bounds both the memory used and the clicks a
+crash can lose.
+
+With `bucket_seconds` set, clicks are also kept apart by when they
+happened (per code and per bucket of that many seconds), so the flush can
+record click times and not just totals.
+"""
+import atexit
+import threading
+import time
+
+
+class ClickAggregator:
+    """Collects per-code click increments and flushes them in batches"""
+
+    def __init__(self, flush_fn, flush_interval=2.0, max_pending=500, bucket_seconds=None,
+                 max_buffered=None):
+        # flush_fn receives a list of (short_code, clicks) tuples, or of
+        # (short_code, bucket_start, clicks) tuples when bucket_seconds is set
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_buffered = max_buffered or 10 * max_pending
+        self.bucket_seconds = bucket_seconds
+        self._pending = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()  # set once max_pending is reached
+        self._thread = None
+        self.flushes = 0
+        self.flushed_clicks = 0
+        self.failed_flushes = 0
+        self.dropped_clicks = 0
+
+    def record(self, short_code, clicks=1):
+        """Buffer a click; wakes the flusher once max_pending is reached
+
+        Dropped (and counted) if max_buffered clicks are already waiting.
+        """
+        key = short_code
+        if self.bucket_seconds:
+            now = int(time.time())
+            key = (short_code, now - now % self.bucket_seconds)
+        with self._lock:
+            if self._pending_total + clicks > self.max_buffered:
+                self.dropped_clicks += clicks
+                return
+            self._pending[key] = self._pending.get(key, 0) + clicks
+            self._pending_total += clicks
+            if self._pending_total >= self.max_pending:
+                self._wake.set()
+            if self._thread is None:
+                self._start()
+
+    def pending_for(self, short_code):
+        """Clicks recorded for short_code but not yet written"""
+        with self._lock:
+            if not self.bucket_seconds:
+                return self._pending.get(short_code, 0)
+            return sum(clicks for key, clicks in self._pending.items() if key[0] == short_code)
+
+    def discard(self, short_codes):
+        """Forget buffered clicks for codes that were deleted"""
+        with self._lock:
+            if self.bucket_seconds:
+                codes = set(short_codes)
+                short_codes = [key for key in self._pending if key[0] in codes]
+            for key in short_codes:
+                self._pending_total -= self._pending.pop(key, 0)
+
+    def discard_all(self):
+        """Forget every buffered click (history was cleared)"""
+        with self._lock:
+            self._pending = {}
+            self._pending_total = 0
+
+    def flush(self):
+        """Write all buffered clicks using flush_fn"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = list(self._pending.items())
+                if self.bucket_seconds:
+                    batch = [(short_code, bucket, clicks) for (short_code, bucket), clicks in batch]
+                self._pending = {}
+                self._pending_total = 0
+
+            try:
+                self.flush_fn(batch)
+            except Exception:
+                # Put the clicks back so the next flush retries them, as far
+                # as the clicks recorded meanwhile leave room
+                with self._lock:
+                    for *key, clicks in batch:
+                        key = tuple(key) if self.bucket_seconds else key[0]
+                        kept = min(clicks, self.max_buffered - self._pending_total)
+                        if kept > 0:
+                            self._pending[key] = self._pending.get(key, 0) + kept
+                            self._pending_total += kept
+                        self.dropped_clicks += clicks - max(kept, 0)
+                    self.failed_flushes += 1
+                raise
+
+            total = sum(item[-1] for item in batch)
+            with self._lock:
+                self.flushes += 1
+                self.flushed_clicks += total
+            return total
+
+    def _start(self):
+        """Start the periodic flusher (caller holds self._lock)"""
+        self._thread = threading.Thread(target=self._run, name='click-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                # Clicks stay buffered; back off instead of retrying at once
+                if self._stop_event.wait(self.flush_interval):
+                    return
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is still buffered"""
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 1)
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def stats(self):
+        """Return counters suitable for a JSON response"""
+        with self._lock:
+            return {
+                'pending_clicks': self._pending_total,
+                'pending_codes': len(self._pending),
+                'max_pending': self.max_pending,
+                'max_buffered': self.max_buffered,
+                'flush_interval_seconds': self.flush_interval,
+                'bucket_seconds': self.bucket_seconds,
+                'flushes': self.flushes,
+                'flushed_clicks': self.flushed_clicks,
+                'failed_flushes': self.failed_flushes,
+                'dropped_clicks': self.dropped_clicks
+            }
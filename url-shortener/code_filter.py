@@ -0,0 +1,283 @@
+"""
+Counting Bloom filter over every existing short code.
+
+Most requests for a code that does not exist come from scanners trying
+random /s/<code> values. The filter answers "definitely not a code" from
+memory, so those requests get a 404 without a database query; "maybe"
+answers go to the database as before. Counters instead of bits let deletes
+take codes out again.
+
+The filter is built from a streamed scan of the codes on first use and
+then kept current by the create and delete paths of this process. Codes
+created by other worker processes are found through the id counter: the
+mapping table uses AUTOINCREMENT, so ids are never reused and the largest
+id ever assigned only moves forward, in the same transaction as the insert.
+A negative answer is only trusted while that counter still equals the last
+id the filter scanned up to. When it has moved, a catch-up scan of the rows
+with a higher id runs, at most once every `catch_up_interval` seconds; in
+between, negatives go to the database like "maybe" answers, since the code
+may be one another worker just created. Reading the counter is a lookup in
+a one-row table, which stays cached where probes of the code index for
+random codes do not.
+
+Deletes only take a code out when it is certainly in the filter: its row
+was covered by the last scan or it was added here since, and no scan ran
+while it was being deleted. Decrementing a code that only looks present (a
+false positive) would zero counters of live codes and turn their lookups
+into wrong 404s; a code left in costs at most the database query it cost
+before. So do codes deleted by other workers. A full rebuild every
+`rebuild_interval` seconds clears them out, and one also runs if the
+counter goes backwards (the database was replaced).
+"""
+import hashlib
+import math
+import threading
+import time
+
+MAX_COUNT = 255       # saturated counters are never decremented again
+MAX_UNSCANNED = 10000  # local adds remembered until the next catch-up scan
+
+# lookup() answers
+ABSENT = 0     # certainly not a code
+PRESENT = 1    # maybe a code: the filter holds it, or a false positive
+UNCERTAIN = 2  # not in the filter, but codes were created since its last scan
+
+
+def filter_size(capacity, error_rate):
+    """(counters, hash functions) for `capacity` codes at `error_rate` false positives"""
+    counters = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(1, round(counters / capacity * math.log(2)))
+    return counters, hashes
+
+
+def positions(code, size, hashes):
+    """Counter indexes of code: two 64-bit hashes combined k ways (Kirsch-Mitzenmacher)"""
+    digest = hashlib.blake2b(code.encode('utf-8'), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'little')
+    second = int.from_bytes(digest[8:], 'little') | 1
+    return [(first + i * second) % size for i in range(hashes)]
+
+
+class CodeFilter:
+    """Thread-safe counting Bloom filter of short codes
+
+    load_codes(after_id) yields (id, code) for every row with a larger id
+    (after_id is 0 for a full build); last_assigned_id() returns the largest
+    id ever assigned, or None before the first insert.
+    """
+
+    def __init__(self, load_codes, last_assigned_id, capacity=100000, error_rate=0.01,
+                 catch_up_interval=5.0, rebuild_interval=300.0):
+        self.load_codes = load_codes
+        self.last_assigned_id = last_assigned_id
+        self.min_capacity = capacity
+        self.error_rate = error_rate
+        self.catch_up_interval = catch_up_interval
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        # (counters, hash functions), swapped as a whole so lock-free readers
+        # never pair new counters with the old hash count
+        self._state = None
+        self._unscanned = set()  # codes added here that the next scan may return again
+        self.capacity = 0
+        self.count = 0
+        self.last_id = 0
+        self.generation = 0  # bumped by every scan and clear; see remove_many
+        self.built_at = 0.0
+        self.scanned_at = 0.0
+        self.positives = 0
+        self.negatives = 0
+        self.behind = 0  # UNCERTAIN answers
+        self.false_positives = 0  # PRESENT answers the database had no row for
+        self.behind_misses = 0  # UNCERTAIN answers the database had no row for
+        self.skipped_removals = 0  # deleted codes left in because they might not be held
+        self.catch_ups = 0
+        self.rebuilds = 0
+
+    # ==================== LOOKUPS ====================
+
+    def lookup(self, code):
+        """ABSENT only if code is certainly not an existing short code"""
+        if self._state is None:
+            self.build()
+        if self._contains(self._state, code):
+            self.positives += 1
+            return PRESENT
+        if (self.last_assigned_id() or 0) != self.last_id:
+            if time.monotonic() - self.scanned_at < self.catch_up_interval:
+                self.behind += 1
+                return UNCERTAIN  # may be a code another worker just created
+            self.catch_up()
+            if self._contains(self._state, code):
+                self.positives += 1
+                return PRESENT
+        self.negatives += 1
+        return ABSENT
+
+    def might_contain(self, code):
+        """False only if code is certainly not an existing short code"""
+        return self.lookup(code) != ABSENT
+
+    def missed(self, answer):
+        """Record that the database had no row for a code lookup() did not rule out"""
+        if answer == UNCERTAIN:
+            self.behind_misses += 1
+        else:
+            self.false_positives += 1
+
+    @staticmethod
+    def _contains(state, code):
+        counters, hashes = state
+        return all(counters[index] for index in positions(code, len(counters), hashes))
+
+    # ==================== UPDATES ====================
+
+    def add(self, code):
+        self.add_many([code])
+
+    def add_many(self, codes):
+        """Add created codes"""
+        with self._lock:
+            if self._state is None:
+                return  # the first build reads them from the database
+            for code in codes:
+                self._add(self._state, code)
+                self._unscanned.add(code)
+            if len(self._unscanned) > MAX_UNSCANNED:
+                self._catch_up()
+
+    def remove(self, row_id, code, generation):
+        self.remove_many([(row_id, code)], generation)
+
+    def remove_many(self, rows, generation):
+        """Take deleted codes out where the filter certainly holds them
+
+        rows are (id, code) of rows this process deleted, read in the
+        deleting transaction; generation is self.generation as read before
+        that transaction began. If a scan ran since, it may or may not have
+        seen the rows, so nothing is taken out.
+        """
+        with self._lock:
+            if self._state is None:
+                return
+            if generation != self.generation:
+                self.skipped_removals += len(rows)
+                return
+            counters, hashes = self._state
+            for row_id, code in rows:
+                if row_id > self.last_id and code not in self._unscanned:
+                    self.skipped_removals += 1  # created elsewhere since the last scan
+                    continue
+                self._unscanned.discard(code)
+                indexes = positions(code, len(counters), hashes)
+                if not all(counters[index] for index in indexes):
+                    continue
+                for index in indexes:
+                    if counters[index] < MAX_COUNT:
+                        counters[index] -= 1
+                self.count -= 1
+
+    def clear(self):
+        """Rebuild after the table was emptied
+
+        Codes created between the delete and this call must stay, so this
+        is a scan of what is left rather than zeroing the counters.
+        """
+        with self._lock:
+            if self._state is not None:
+                self._build(max(self.min_capacity, self.capacity))
+
+    def _add(self, state, code):
+        counters, hashes = state
+        for index in positions(code, len(counters), hashes):
+            if counters[index] < MAX_COUNT:
+                counters[index] += 1
+        self.count += 1
+
+    # ==================== SCANS ====================
+
+    def build(self):
+        """(Re)build from a full scan of the database"""
+        with self._lock:
+            self._build(self.min_capacity)
+
+    def catch_up(self):
+        """Add the codes other processes created since the last scan"""
+        with self._lock:
+            if time.monotonic() - self.scanned_at < self.catch_up_interval:
+                return  # another thread just did it
+            self._catch_up()
+
+    def _build(self, capacity):
+        counters, hashes = filter_size(capacity, self.error_rate)
+        state = (bytearray(counters), hashes)
+        self.capacity = capacity
+        self.count = 0
+        self.last_id = 0
+        self._unscanned.clear()
+        self._scan(state, self.last_assigned_id() or 0)
+        self._state = state
+        self.built_at = time.monotonic()
+        self.rebuilds += 1
+        if self.count > self.capacity:
+            self._build(self.count * 2)  # past capacity the error rate climbs fast
+
+    def _catch_up(self):
+        newest = self.last_assigned_id() or 0
+        if newest < self.last_id or time.monotonic() - self.built_at >= self.rebuild_interval:
+            self._build(max(self.min_capacity, self.capacity))
+            return
+        self.catch_ups += 1
+        self._scan(self._state, newest)
+        if self.count > self.capacity:
+            self._build(self.count * 2)
+
+    def _scan(self, state, newest):
+        """Add the rows after last_id; newest was read before the scan, so every id up to it is seen"""
+        for row_id, code in self.load_codes(self.last_id):
+            if code in self._unscanned:
+                self._unscanned.discard(code)  # already added when it was created here
+            else:
+                self._add(state, code)
+            self.last_id = max(self.last_id, row_id)
+        # Ids up to newest whose rows are gone were deleted, and are never reused
+        self.last_id = max(self.last_id, newest)
+        # Anything created here is now either scanned or older than last_id
+        self._unscanned.clear()
+        self.scanned_at = time.monotonic()
+        self.generation += 1
+
+    # ==================== STATS ====================
+
+    def estimated_error_rate(self):
+        """False positive rate implied by the share of counters in use"""
+        if self._state is None:
+            return 0.0
+        counters, hashes = self._state
+        return (1 - counters.count(0) / len(counters)) ** hashes
+
+    def stats(self):
+        """Return counters suitable for a JSON response"""
+        with self._lock:
+            # Lookups the filter was sure about and that turned out absent;
+            # UNCERTAIN ones were never its answer
+            absent = self.false_positives + self.negatives
+            return {
+                'built': self._state is not None,
+                'codes': self.count,
+                'capacity': self.capacity,
+                'hash_functions': self._state[1] if self._state is not None else 0,
+                'memory_bytes': len(self._state[0]) if self._state is not None else 0,
+                'target_error_rate': self.error_rate,
+                'estimated_error_rate': round(self.estimated_error_rate(), 6),
+                'positives': self.positives,
+                'negatives': self.negatives,
+                'behind': self.behind,
+                'false_positives': self.false_positives,
+                'behind_misses': self.behind_misses,
+                # Share of lookups for missing codes that still hit the database
+                'observed_error_rate': round(self.false_positives / absent, 6) if absent else 0.0,
+                'skipped_removals': self.skipped_removals,
+                'catch_ups': self.catch_ups,
+                'rebuilds': self.rebuilds
+            }
@@ -0,0 +1,82 @@
+"""
+Bounded LRU/TTL cache for short code -> original URL lookups.
+
+Sits in front of the ORM lookup in redirect_to_original so hot links are
+served from memory. Entries expire after `ttl` seconds so a code deleted
+by another worker process is never served for longer than that.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RedirectCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss/eviction counters"""
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, short_code):
+        """Return the cached URL for short_code, or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(short_code)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            original_url, expires_at = entry
+            if expires_at <= now:
+                del self._entries[short_code]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(short_code)
+            self.hits += 1
+            return original_url
+
+    def put(self, short_code, original_url):
+        """Cache a mapping, evicting the least recently used entry if full"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[short_code] = (original_url, expires_at)
+            self._entries.move_to_end(short_code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, short_code):
+        """Drop a single code (called when its mapping is deleted)"""
+        with self._lock:
+            self._entries.pop(short_code, None)
+
+    def invalidate_many(self, short_codes):
+        """Drop several codes at once"""
+        with self._lock:
+            for short_code in short_codes:
+                self._entries.pop(short_code, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return counters suitable for a JSON response"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
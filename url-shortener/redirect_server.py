@@ -0,0 +1,339 @@
+"""
+Standalone asyncio redirect server for /s/<code>.
+
+Serves only the redirect path, without Flask or the ORM, from an in-memory
+snapshot of the url_mapping table (the schema both shortener apps share).
+Every code maps to a fully pre-encoded HTTP response, so a request costs a
+dict lookup and a transport write. New mappings are picked up incrementally
+every --refresh seconds and deletions on a full reload every
+--full-refresh seconds. Clicks are batched into the database with the same
+ClickAggregator the Flask apps use. On a url_shortener_with_login database
+they are written like that app writes them: click_count, one click_event
+row per code and second, and the hourly and daily click_rollup buckets.
+Deleting expired click events is left to the app. Flushes run on the
+aggregator's thread, never on the event loop.
+
+Usage:
+    python redirect_server.py --db instance/url_shortener.db --port 8001 --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+from urllib.parse import quote
+
+from click_buffer import ClickAggregator
+
+logger = logging.getLogger('redirect_server')
+
+NOT_FOUND = (
+    b'HTTP/1.1 404 Not Found\r\n'
+    b'Content-Type: text/plain\r\n'
+    b'Content-Length: 9\r\n'
+    b'\r\n'
+    b'Not Found'
+)
+BAD_REQUEST = (
+    b'HTTP/1.1 400 Bad Request\r\n'
+    b'Content-Length: 0\r\n'
+    b'Connection: close\r\n'
+    b'\r\n'
+)
+MAX_HEADER_BYTES = 8192
+LOCATION_SAFE = ":/?#[]@!$&'()*+,;=%~"
+ROLLUP_RESOLUTIONS = (3600, 86400)  # the hourly and daily buckets of url_shortener_with_login
+
+
+def redirect_response(original_url):
+    """Pre-encode the full 302 response for one mapping"""
+    location = quote(original_url, safe=LOCATION_SAFE).encode('ascii')
+    return (
+        b'HTTP/1.1 302 Found\r\n'
+        b'Location: ' + location + b'\r\n'
+        b'Content-Length: 0\r\n'
+        b'\r\n'
+    )
+
+
+class RedirectTable:
+    """Snapshot of short code -> pre-encoded response, refreshed from SQLite"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.responses = {}
+        self.max_id = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+        conn.execute('PRAGMA query_only=ON')
+        return conn
+
+    def load_all(self):
+        """Full reload; also drops codes that were deleted"""
+        conn = self._connect()
+        try:
+            responses = {}
+            max_id = 0
+            for row_id, code, original_url in conn.execute(
+                'SELECT id, shortened_url, original_url FROM url_mapping'
+            ):
+                responses[code.encode('ascii')] = redirect_response(original_url)
+                max_id = max(max_id, row_id)
+        finally:
+            conn.close()
+        # Swap in one assignment so requests never see a half-built table
+        self.responses = responses
+        self.max_id = max_id
+
+    def load_new(self):
+        """Incremental refresh: only rows added since the last load"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT id, shortened_url, original_url FROM url_mapping WHERE id > ? ORDER BY id',
+                (self.max_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        for row_id, code, original_url in rows:
+            self.responses[code.encode('ascii')] = redirect_response(original_url)
+            self.max_id = row_id
+        return len(rows)
+
+
+def has_click_log(db_path):
+    """True for a database with click_event and click_rollup (url_shortener_with_login)"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+    return {'click_event', 'click_rollup'} <= tables
+
+
+def make_click_flusher(db_path, click_log=False):
+    """flush_fn for a ClickAggregator; with click_log it takes (code, second, clicks)"""
+    def flush_click_counts(batch):
+        conn = sqlite3.connect(db_path, timeout=5)
+        try:
+            with conn:
+                conn.executemany(
+                    'UPDATE url_mapping SET click_count = click_count + ? WHERE shortened_url = ?',
+                    [(clicks, code) for code, clicks in batch]
+                )
+        finally:
+            conn.close()
+
+    def flush_clicks(batch):
+        totals = {}
+        rollups = {}
+        for code, second, clicks in batch:
+            totals[code] = totals.get(code, 0) + clicks
+            for resolution in ROLLUP_RESOLUTIONS:
+                key = (code, resolution, second - second % resolution)
+                rollups[key] = rollups.get(key, 0) + clicks
+        conn = sqlite3.connect(db_path, timeout=5)
+        try:
+            with conn:
+                # Same statements as the app's flush_clicks: the UPDATE takes the
+                # write lock first, and links are resolved inside the write
+                conn.executemany(
+                    'UPDATE url_mapping SET click_count = click_count + ? WHERE shortened_url = ?',
+                    [(clicks, code) for code, clicks in totals.items()]
+                )
+                conn.executemany(
+                    'INSERT INTO click_event (url_id, clicked_at, clicks) '
+                    'SELECT id, ?, ? FROM url_mapping WHERE shortened_url = ?',
+                    [(second, clicks, code) for code, second, clicks in batch]
+                )
+                conn.executemany(
+                    'INSERT INTO click_rollup (url_id, resolution, bucket_start, clicks) '
+                    'SELECT id, ?, ?, ? FROM url_mapping WHERE shortened_url = ? '
+                    'ON CONFLICT (url_id, resolution, bucket_start) DO UPDATE SET clicks = clicks + excluded.clicks',
+                    [(resolution, start, clicks, code) for (code, resolution, start), clicks in rollups.items()]
+                )
+        finally:
+            conn.close()
+
+    return flush_clicks if click_log else flush_click_counts
+
+
+class RedirectProtocol(asyncio.Protocol):
+    """Minimal HTTP/1.1 handler for GET/HEAD /s/<code> with keep-alive and pipelining"""
+
+    def __init__(self, table, clicks):
+        self.table = table
+        self.clicks = clicks
+        self.transport = None
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        buffer = self.buffer + data if self.buffer else data
+        while True:
+            end = buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(buffer) > MAX_HEADER_BYTES:
+                    self.transport.write(BAD_REQUEST)
+                    self.transport.close()
+                    return
+                self.buffer = buffer
+                return
+
+            head = buffer[:end]
+            buffer = buffer[end + 4:]
+            line_end = head.find(b'\r\n')
+            request_line = head if line_end < 0 else head[:line_end]
+            parts = request_line.split(b' ')
+            if len(parts) != 3 or parts[0] not in (b'GET', b'HEAD'):
+                self.transport.write(BAD_REQUEST)
+                self.transport.close()
+                return
+
+            path = parts[1]
+            query_start = path.find(b'?')
+            if query_start >= 0:
+                path = path[:query_start]
+
+            response = None
+            if path.startswith(b'/s/'):
+                code = path[3:]
+                response = self.table.responses.get(code)
+                if response is not None and parts[0] == b'GET':
+                    self.clicks.record(code.decode('ascii'))
+            self.transport.write(response or NOT_FOUND)
+
+            if parts[2] != b'HTTP/1.1' or (b'onnection' in head and b'connection: close' in head.lower()):
+                self.transport.close()
+                return
+
+
+async def refresh_loop(table, refresh, full_refresh):
+    loop = asyncio.get_running_loop()
+    since_full = 0.0
+    while True:
+        await asyncio.sleep(refresh)
+        since_full += refresh
+        try:
+            if since_full >= full_refresh:
+                await loop.run_in_executor(None, table.load_all)
+                since_full = 0.0
+            else:
+                await loop.run_in_executor(None, table.load_new)
+        except sqlite3.Error as e:
+            logger.warning('refresh failed: %s', e)
+
+
+async def serve(args, sock):
+    table = RedirectTable(args.db)
+    table.load_all()
+    click_log = has_click_log(args.db)
+    clicks = ClickAggregator(
+        make_click_flusher(args.db, click_log),
+        flush_interval=args.click_flush_interval,
+        max_pending=args.click_max_pending,
+        max_buffered=args.click_max_buffered,
+        bucket_seconds=1 if click_log else None
+    )
+
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: RedirectProtocol(table, clicks), sock=sock)
+    logger.info('%d codes loaded, listening on http://%s:%d/s/<code>', len(table.responses), args.host, args.port)
+    refresher = asyncio.ensure_future(refresh_loop(table, args.refresh, args.full_refresh))
+
+    # Stop cleanly on SIGTERM or Ctrl+C so buffered clicks are flushed;
+    # repeats while stopping are ignored
+    stopped = loop.create_future()
+
+    def stop():
+        if not stopped.done():
+            stopped.set_result(None)
+
+    try:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop)
+    except (NotImplementedError, AttributeError):
+        pass  # Windows: only Ctrl+C stops the server
+    try:
+        async with server:
+            await stopped
+    finally:
+        refresher.cancel()
+        # The last flush writes to the database; keep it off the loop thread
+        await loop.run_in_executor(None, clicks.stop)
+
+
+def make_socket(host, port, reuse_port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def run_worker(args, reuse_port):
+    logging.basicConfig(level=logging.INFO, format='[redirect-server %(process)d] %(message)s')
+    try:
+        import uvloop  # optional, noticeably faster event loop
+        uvloop.install()
+    except ImportError:
+        pass
+    sock = make_socket(args.host, args.port, reuse_port)
+    try:
+        asyncio.run(serve(args, sock))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Redirect-only server for shortened URLs')
+    parser.add_argument('--db', default=os.path.join('instance', 'url_shortener.db'),
+                        help='SQLite file of either shortener app')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes sharing the port via SO_REUSEPORT')
+    parser.add_argument('--refresh', type=float, default=1.0,
+                        help='seconds between incremental snapshot refreshes')
+    parser.add_argument('--full-refresh', type=float, default=30.0,
+                        help='seconds between full reloads (picks up deletions)')
+    parser.add_argument('--click-flush-interval', type=float, default=2.0)
+    parser.add_argument('--click-max-pending', type=int, default=5000)
+    parser.add_argument('--click-max-buffered', type=int, default=50000,
+                        help='clicks buffered at most; more are dropped while flushes fail')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f'database not found: {args.db}')
+
+    if args.workers <= 1:
+        run_worker(args, reuse_port=False)
+        return
+
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error('--workers > 1 needs SO_REUSEPORT (Linux/BSD/macOS)')
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(args, True))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    main()
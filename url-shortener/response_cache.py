@@ -0,0 +1,193 @@
+"""
+Whole-response cache with pre-compressed variants, for pages and static files.
+
+@response_cache.cached() stores the body a view returns, keyed on the
+request path and query args, together with gzip (and brotli, when the
+brotli package is installed) compressions of it, made once when it is
+stored. Later requests are answered without running the view, with the
+variant their Accept-Encoding prefers and an ETag, so revalidations are a
+304 with no body. Only 200 responses without cookies are stored, so a
+cached view must depend on nothing but its path and query args.
+
+init_response_cache(app) also serves the static folder through the cache
+and adds an asset_url() template helper that versions static URLs by
+content hash; versioned URLs are cached by browsers for a year.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import Response, make_response, request, url_for
+
+try:
+    import brotli  # optional, smaller than gzip for HTML and CSS
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_SIZE = 512  # bytes; smaller bodies are sent as they are
+GZIP_LEVEL = 9           # compression happens once per entry, so favour size
+BROTLI_QUALITY = 5       # quality 11 is ~20x slower per miss for ~10% less
+STATIC_MAX_AGE = 365 * 24 * 3600  # seconds, for versioned static URLs
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+CachedResponse = namedtuple('CachedResponse', 'etag content_type bodies size')
+
+
+def compress(body):
+    """{encoding: bytes} with identity plus every encoding that makes body smaller"""
+    bodies = {'identity': body}
+    if len(body) < MIN_COMPRESS_SIZE:
+        return bodies
+    candidates = {'gzip': gzip.compress(body, GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        candidates['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    for encoding, compressed in candidates.items():
+        if len(compressed) < len(body):
+            bodies[encoding] = compressed
+    return bodies
+
+
+class ResponseCache:
+    """Thread-safe LRU of rendered responses, bounded by entries and bytes"""
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+
+    def cached(self, max_age=0):
+        """Decorator serving a GET view from the cache
+
+        max_age (seconds, or a callable returning them) sets Cache-Control;
+        0 means browsers keep the page but revalidate it every time.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return view(*args, **kwargs)
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                entry = self.get(key)
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    entry = self.put(key, response)
+                    if entry is None:
+                        return response
+                return self.respond(entry, max_age() if callable(max_age) else max_age)
+            return wrapper
+        return decorator
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, response):
+        """Store a response and return its entry, or None if it must not be cached"""
+        if (response.status_code != 200 or 'Set-Cookie' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            with self._lock:
+                self.uncacheable += 1
+            return None
+
+        # send_file() responses stream the file; read it into memory once
+        response.direct_passthrough = False
+        body = response.get_data()
+        response.close()
+        bodies = compress(body)
+        entry = CachedResponse(
+            etag=hashlib.sha1(body).hexdigest(),
+            content_type=response.content_type,
+            bodies=bodies,
+            size=sum(len(variant) for variant in bodies.values())
+        )
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.size
+            self._entries[key] = entry
+            self.bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.size
+                self.evictions += 1
+        return entry
+
+    @staticmethod
+    def respond(entry, max_age):
+        """The variant the client prefers, or a 304 if its copy is current"""
+        offered = [encoding for encoding in ('br', 'gzip') if encoding in entry.bodies]
+        encoding = request.accept_encodings.best_match(offered + ['identity'], default='identity')
+        response = Response(entry.bodies[encoding], content_type=entry.content_type)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # Each encoding is a different representation and gets its own tag
+        response.set_etag(entry.etag if encoding == 'identity' else f'{entry.etag}-{encoding}')
+        if max_age:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Return counters suitable for a JSON response"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_entries,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'uncacheable': self.uncacheable,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'brotli': brotli is not None
+            }
+
+
+def init_response_cache(app, max_entries=256, max_bytes=32 * 1024 * 1024):
+    """Create the cache, route static files through it and add asset_url()"""
+    cache = ResponseCache(max_entries, max_bytes)
+    versions = {}
+
+    def asset_url(filename):
+        """url_for('static') with ?v= set to a hash of the file's contents"""
+        path = os.path.join(app.static_folder, filename)
+        mtime = os.stat(path).st_mtime_ns
+        version = versions.get(filename)
+        if version is None or version[0] != mtime:
+            with open(path, 'rb') as f:
+                version = versions[filename] = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+        return url_for('static', filename=filename, v=version[1])
+
+    def static_max_age():
+        # Unversioned URLs may change under the same name; make them revalidate
+        return STATIC_MAX_AGE if 'v' in request.args else 0
+
+    app.add_template_global(asset_url)
+    if 'static' in app.view_functions:
+        app.view_functions['static'] = cache.cached(max_age=static_max_age)(app.view_functions['static'])
+    return cache
@@ -0,0 +1,81 @@
+"""
+SQLite production settings for the shortener.
+
+Every pooled connection gets the pragmas below through a connect-event
+listener: WAL lets readers run while a write is in progress,
+synchronous=NORMAL is durable under WAL across application crashes, and
+busy_timeout makes writers queue on the lock instead of failing with
+"database is locked". A second engine on the same file, with query_only
+connections, serves the redirect lookups so they never wait for a pool slot
+held by a writer.
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,        # milliseconds
+    'mmap_size': 268435456,      # 256 MiB of the file mapped into memory
+    'cache_size': -65536,        # negative = KiB, so 64 MiB page cache
+    'temp_store': 'MEMORY'
+}
+
+# Pragmas that only make sense on (or are only allowed for) a writer
+WRITER_ONLY_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+def engine_options(pool_size=5, max_overflow=10, pool_timeout=10, busy_timeout=5000):
+    """SQLALCHEMY_ENGINE_OPTIONS for a file-backed SQLite database"""
+    return {
+        'poolclass': QueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'connect_args': {
+            'check_same_thread': False,
+            'timeout': busy_timeout / 1000
+        }
+    }
+
+
+def is_file_sqlite(engine):
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:')
+
+
+def apply_pragmas(engine, pragmas):
+    """Run the given PRAGMAs on every new DBAPI connection of engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def make_read_engine(engine, pragmas, pool_size=10, max_overflow=20):
+    """Separate pool of query_only connections to the same database file
+
+    Falls back to the main engine for anything that is not a file-backed
+    SQLite database (an in-memory database is private to one connection).
+    """
+    if not is_file_sqlite(engine):
+        return engine
+
+    read_engine = create_engine(
+        engine.url,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        connect_args={'check_same_thread': False}
+    )
+    read_pragmas = {
+        name: value for name, value in pragmas.items()
+        if name not in WRITER_ONLY_PRAGMAS
+    }
+    read_pragmas['query_only'] = 'ON'
+    apply_pragmas(read_engine, read_pragmas)
+    return read_engine
@@ -1,20 +1,97 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-import string
-import random
-from urllib.parse import urlparse
+import os
+import hashlib
+import json
+import base64
+import secrets
+import time
+from urllib.parse import urlparse, urlsplit, urlunsplit
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
+from redirect_cache import RedirectCache
+from mmap_table import RedirectTable
+from code_filter import ABSENT, CodeFilter
+from click_buffer import ClickAggregator
+from chunked_deleter import ChunkedDeleter
+from code_allocator import make_code_allocator
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable
+from sqlite_tuning import DEFAULT_PRAGMAS, engine_options, apply_pragmas, make_read_engine
+from instrumentation import init_instrumentation
+from password_hasher import PasswordHasher, PoolBusy
 
 app = Flask(__name__)
 
 # Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///url_shortener_auth.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///url_shortener_auth.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
+app.config['SQLITE_PRAGMAS'] = dict(DEFAULT_PRAGMAS, foreign_keys='ON')  # ON DELETE CASCADE needs it
+app.config['READ_POOL_SIZE'] = 10  # query_only connections used by redirects
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        pool_size=5,
+        max_overflow=10,
+        busy_timeout=DEFAULT_PRAGMAS['busy_timeout']
+    )
+app.config['REDIRECT_CACHE_SIZE'] = 10000
+app.config['REDIRECT_CACHE_TTL'] = 300  # seconds
+app.config['REDIRECT_TABLE'] = True  # mmap'd code -> URL file shared by all workers, next to the database
+app.config['REDIRECT_TABLE_REBUILD_INTERVAL'] = 3600.0  # seconds before the file is rebuilt from the database
+app.config['CODE_FILTER'] = True  # Bloom filter answering 404s for unknown codes without a query
+app.config['CODE_FILTER_CAPACITY'] = 100000  # codes; grows when the table outgrows it
+app.config['CODE_FILTER_ERROR_RATE'] = 0.01
+app.config['CODE_FILTER_CATCH_UP_INTERVAL'] = 5.0  # seconds between scans for other workers' codes
+app.config['CODE_FILTER_REBUILD_INTERVAL'] = 300.0  # seconds between full rebuilds
+app.config['CLICK_FLUSH_INTERVAL'] = 2.0  # seconds
+app.config['CLICK_FLUSH_MAX_PENDING'] = 500  # buffered clicks that trigger a flush before the interval is up
+app.config['CLICK_BUFFER_MAX'] = 5000  # clicks buffered at most (all a crash can lose); more are dropped while flushes fail
+app.config['CLICK_EVENT_RETENTION_DAYS'] = 30  # raw click log; the hourly and daily rollups are kept
+app.config['DELETE_CHUNK_SIZE'] = 500  # links per transaction when clearing a history or an account
+app.config['DELETE_CHUNK_PAUSE'] = 0.02  # seconds between chunks, for other writers to take the lock
+app.config['DELETION_JOB_LEASE'] = 60.0  # seconds without progress before any worker takes a job over
+app.config['SHORT_CODE_ALLOCATOR'] = 'feistel'  # 'feistel', 'sequence' or 'random'
+app.config['SHORT_CODE_LENGTH'] = 6
+app.config['SHORT_CODE_BLOCK_SIZE'] = 1000
+app.config['SHORT_CODE_KEY'] = app.config['SECRET_KEY']
+
+# Password hashing runs on a bounded pool; logins beyond it get a 503.
+# Changing the method (e.g. 'scrypt:65536:8:1', 'pbkdf2:sha256:600000')
+# rehashes each password on its owner's next login.
+app.config['PASSWORD_HASH_METHOD'] = 'scrypt'
+app.config['PASSWORD_HASH_WORKERS'] = 2  # concurrent hashes per process
+app.config['PASSWORD_HASH_QUEUE'] = 8  # further hashes allowed to wait
+
+# Instrumentation: /metrics and slow request logging, off unless APP_METRICS=1
+app.config['METRICS_ENABLED'] = os.environ.get('APP_METRICS') == '1'
+app.config['SLOW_REQUEST_MS'] = 500
 
 db = SQLAlchemy(app)
+with app.app_context():
+    apply_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+    read_engine = make_read_engine(
+        db.engine,
+        app.config['SQLITE_PRAGMAS'],
+        pool_size=app.config['READ_POOL_SIZE']
+    )
+    database_file = db.engine.url.database if db.engine.url.get_backend_name() == 'sqlite' else None
+    if app.config['METRICS_ENABLED']:
+        init_instrumentation(
+            app,
+            engines=(db.engine, read_engine),
+            slow_request_ms=app.config['SLOW_REQUEST_MS']
+        )
+redirect_cache = RedirectCache(
+    max_size=app.config['REDIRECT_CACHE_SIZE'],
+    ttl=app.config['REDIRECT_CACHE_TTL']
+)
+password_hasher = PasswordHasher(
+    size=app.config['PASSWORD_HASH_WORKERS'],
+    max_queue=app.config['PASSWORD_HASH_QUEUE'],
+    method=app.config['PASSWORD_HASH_METHOD']
+)
 
 # ==================== DATABASE MODELS ====================
 
@@ -24,17 +101,27 @@ class User(db.Model):
     username = db.Column(db.String(9), unique=True, nullable=False, index=True)
     password = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Copied into the session at login; replacing it ends every session of the account
+    session_token = db.Column(db.String(32), default=lambda: secrets.token_hex(16))
+    
+    # Ids are never reused, so a deleted account's sessions and jobs can't
+    # point at a later signup
+    __table_args__ = {'sqlite_autoincrement': True}
     
-    # Relationship with URLMapping
-    urls = db.relationship('URLMapping', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Relationship with URLMapping; the database deletes a user's links
+    # (ON DELETE CASCADE), so deleting a user never loads them
+    urls = db.relationship('URLMapping', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password = generate_password_hash(password)
+        """Hash and set password (raises PoolBusy if the hasher is saturated)"""
+        self.password = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Verify password"""
-        return check_password_hash(self.password, password)
+        """Verify password, upgrading the stored hash if the hash settings changed"""
+        valid, new_hash = password_hasher.check(self.password, password)
+        if new_hash is not None:
+            self.password = new_hash
+        return valid
     
     def to_dict(self):
         return {
@@ -47,11 +134,20 @@ class User(db.Model):
 class URLMapping(db.Model):
     """URL mapping model (user-specific)"""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
     original_url = db.Column(db.String(2048), nullable=False)
     shortened_url = db.Column(db.String(10), unique=True, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     click_count = db.Column(db.Integer, default=0)
+    # SHA-256 of the normalized URL; per-user dedup is a probe on (user_id, url_hash)
+    url_hash = db.Column(db.String(64))
+    
+    __table_args__ = (
+        db.Index('ix_url_mapping_user_url_hash', 'user_id', 'url_hash', unique=True),
+        db.Index('ix_url_mapping_user_created_at_id', 'user_id', 'created_at', 'id'),
+        # Ids are never reused, so the code filter can catch up by id
+        {'sqlite_autoincrement': True},
+    )
     
     def to_dict(self):
         return {
@@ -62,12 +158,399 @@ class URLMapping(db.Model):
             'click_count': self.click_count
         }
 
+
+class CodeSequence(db.Model):
+    """Counter that short code blocks are reserved from"""
+    name = db.Column(db.String(32), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class ClickEvent(db.Model):
+    """Append-only click log: the clicks on one link within one second"""
+    id = db.Column(db.Integer, primary_key=True)
+    url_id = db.Column(db.Integer, db.ForeignKey('url_mapping.id', ondelete='CASCADE'), nullable=False)
+    clicked_at = db.Column(db.Integer, nullable=False)  # unix time, whole seconds
+    clicks = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_click_event_url_clicked_at', 'url_id', 'clicked_at'),
+    )
+
+
+class ClickRollup(db.Model):
+    """Clicks per link per hour and per day, incremented as clicks are flushed"""
+    url_id = db.Column(db.Integer, db.ForeignKey('url_mapping.id', ondelete='CASCADE'), primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True)  # bucket length in seconds
+    bucket_start = db.Column(db.Integer, primary_key=True)  # unix time
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DeletionJob(db.Model):
+    """A history or account deletion running in the background, with its progress"""
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key: an account job outlives the user it deletes
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    kind = db.Column(db.String(16), nullable=False)  # 'history' or 'account'
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, running, done, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    deleted = db.Column(db.Integer, nullable=False, default=0)
+    # History jobs only delete links that existed when the job was created
+    max_url_id = db.Column(db.Integer)
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every chunk; a job that stops moving is taken over by another worker
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'total': self.total,
+            'deleted': self.deleted,
+            'error': self.error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+
 # ==================== HELPER FUNCTIONS ====================
 
-def generate_short_code(length=6):
-    """Generate a random short code"""
-    characters = string.ascii_letters + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+ROLLUP_RESOLUTIONS = {'hour': 3600, 'day': 86400}
+CLICK_PRUNE_INTERVAL = 3600  # seconds between deletes of expired click events
+last_click_prune = 0.0
+
+
+def click_rows(table, columns):
+    """INSERT INTO table (url_id, columns...) SELECT id, :columns... FROM url_mapping WHERE code = :code
+
+    Links are resolved inside the write, so clicks on a link deleted since
+    they were buffered insert nothing.
+    """
+    source = db.select(
+        URLMapping.id,
+        *(db.bindparam(column, type_=db.Integer) for column in columns)
+    ).where(URLMapping.shortened_url == db.bindparam('code'))
+    return sqlite_insert(table).from_select(['url_id', *columns], source)
+
+
+def flush_clicks(batch):
+    """Apply buffered (code, second, clicks) in one transaction
+    
+    click_count gets one batched increment per code, the click log one row
+    per code and second, and the hourly and daily rollups one upsert per
+    code and bucket, so the cost depends on how many links were clicked,
+    not on how many clicks there were.
+    """
+    totals = {}
+    rollups = {}
+    for code, second, clicks in batch:
+        totals[code] = totals.get(code, 0) + clicks
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            key = (code, resolution, second - second % resolution)
+            rollups[key] = rollups.get(key, 0) + clicks
+    
+    mapping = URLMapping.__table__
+    count_stmt = (
+        mapping.update()
+        .where(mapping.c.shortened_url == db.bindparam('code'))
+        .values(click_count=mapping.c.click_count + db.bindparam('clicks'))
+    )
+    event_stmt = click_rows(ClickEvent.__table__, ['clicked_at', 'clicks'])
+    rollup_stmt = click_rows(ClickRollup.__table__, ['resolution', 'bucket_start', 'clicks'])
+    rollup_stmt = rollup_stmt.on_conflict_do_update(
+        index_elements=['url_id', 'resolution', 'bucket_start'],
+        set_={'clicks': ClickRollup.__table__.c.clicks + rollup_stmt.excluded.clicks}
+    )
+    with app.app_context():
+        # The UPDATE comes first so the write lock is held before links are resolved
+        db.session.execute(count_stmt, [{'code': code, 'clicks': clicks} for code, clicks in totals.items()])
+        db.session.execute(event_stmt, [
+            {'code': code, 'clicked_at': second, 'clicks': clicks} for code, second, clicks in batch
+        ])
+        db.session.execute(rollup_stmt, [
+            {'code': code, 'resolution': resolution, 'bucket_start': start, 'clicks': clicks}
+            for (code, resolution, start), clicks in rollups.items()
+        ])
+        db.session.commit()
+    
+    if time.monotonic() - last_click_prune >= CLICK_PRUNE_INTERVAL:
+        prune_click_events()
+
+
+def prune_click_events():
+    """Delete click events older than CLICK_EVENT_RETENTION_DAYS; the rollups stay"""
+    global last_click_prune
+    last_click_prune = time.monotonic()
+    retention = app.config['CLICK_EVENT_RETENTION_DAYS']
+    if not retention:
+        return
+    cutoff = int(time.time()) - retention * 86400
+    table = ClickEvent.__table__
+    with app.app_context():
+        # Events are appended in time order, so everything before the first
+        # event inside the window has expired; finding it reads only those
+        first_kept = db.session.execute(
+            db.select(table.c.id).where(table.c.clicked_at >= cutoff).order_by(table.c.id).limit(1)
+        ).scalar()
+        condition = table.c.id < first_kept if first_kept is not None else table.c.clicked_at < cutoff
+        db.session.execute(table.delete().where(condition))
+        db.session.commit()
+
+
+click_aggregator = ClickAggregator(
+    flush_clicks,
+    flush_interval=app.config['CLICK_FLUSH_INTERVAL'],
+    max_pending=app.config['CLICK_FLUSH_MAX_PENDING'],
+    max_buffered=app.config['CLICK_BUFFER_MAX'],
+    bucket_seconds=1
+)
+
+
+def load_redirect_rows():
+    """(code, url) for every mapping, to build the redirect table from"""
+    with read_engine.connect() as conn:
+        yield from conn.execution_options(yield_per=10000).execute(
+            db.select(URLMapping.shortened_url, URLMapping.original_url)
+        )
+
+
+def count_redirect_rows():
+    with read_engine.connect() as conn:
+        return conn.execute(db.select(db.func.count()).select_from(URLMapping)).scalar()
+
+
+# In-memory databases can't be shared between processes, so they get no table
+redirect_table = None
+if app.config['REDIRECT_TABLE'] and database_file not in (None, '', ':memory:'):
+    redirect_table = RedirectTable(
+        database_file + '.redirects',
+        load_redirect_rows,
+        count_redirect_rows,
+        rebuild_interval=app.config['REDIRECT_TABLE_REBUILD_INTERVAL']
+    )
+
+
+def load_filter_codes(after_id):
+    """(id, code) for every mapping with a larger id, to fill the code filter from"""
+    with read_engine.connect() as conn:
+        yield from conn.execution_options(yield_per=10000).execute(
+            db.select(URLMapping.id, URLMapping.shortened_url)
+            .where(URLMapping.id > after_id)
+            .order_by(URLMapping.id)
+        )
+
+
+def last_assigned_mapping_id():
+    """Largest mapping id ever assigned; url_mapping is AUTOINCREMENT, so SQLite keeps it in sqlite_sequence"""
+    with read_engine.connect() as conn:
+        return conn.execute(
+            db.text("SELECT seq FROM sqlite_sequence WHERE name = 'url_mapping'")
+        ).scalar()
+
+
+code_filter = None
+if app.config['CODE_FILTER']:
+    code_filter = CodeFilter(
+        load_filter_codes,
+        last_assigned_mapping_id,
+        capacity=app.config['CODE_FILTER_CAPACITY'],
+        error_rate=app.config['CODE_FILTER_ERROR_RATE'],
+        catch_up_interval=app.config['CODE_FILTER_CATCH_UP_INTERVAL'],
+        rebuild_interval=app.config['CODE_FILTER_REBUILD_INTERVAL']
+    )
+
+
+_not_found_page = None
+
+
+def not_found_page():
+    """404.html, rendered once; it has no per-request content"""
+    global _not_found_page
+    if _not_found_page is None:
+        _not_found_page = render_template('404.html')
+    return _not_found_page
+
+
+def forget_short_codes(rows, filter_generation):
+    """Drop deleted (id, code) rows from every in-memory structure that knows them
+    
+    filter_generation is code_filter.generation read before the deleting
+    transaction began.
+    """
+    short_codes = [row.shortened_url for row in rows]
+    if redirect_table is not None:
+        redirect_table.remove_many(short_codes)
+    if code_filter is not None:
+        code_filter.remove_many([(row.id, row.shortened_url) for row in rows], filter_generation)
+    redirect_cache.invalidate_many(short_codes)
+    click_aggregator.discard(short_codes)
+
+
+def delete_chunk(job_id):
+    """Delete the next chunk of a DeletionJob's links in one transaction
+    
+    Returns True while links remain. Click events and rollups go with their
+    links through ON DELETE CASCADE. When an account job has no links left
+    the user row is deleted in the same transaction as the last check.
+    """
+    table = URLMapping.__table__
+    filter_generation = code_filter.generation if code_filter is not None else None
+    with app.app_context():
+        # Marking the job first takes the write lock, so the links read
+        # below can't change before they are deleted
+        marked = db.session.execute(
+            db.update(DeletionJob)
+            .where(DeletionJob.id == job_id, DeletionJob.status.in_(('pending', 'running')))
+            .values(status='running', updated_at=datetime.utcnow())
+        ).rowcount
+        if not marked:
+            db.session.rollback()
+            return False  # gone, or finished by another worker that took it over
+        job = db.session.get(DeletionJob, job_id)
+        
+        chunk = db.select(table.c.id, table.c.shortened_url).where(table.c.user_id == job.user_id)
+        if job.max_url_id is not None:
+            chunk = chunk.where(table.c.id <= job.max_url_id)
+        rows = db.session.execute(chunk.order_by(table.c.id).limit(app.config['DELETE_CHUNK_SIZE'])).all()
+        
+        if rows:
+            db.session.execute(table.delete().where(table.c.id.in_([row.id for row in rows])))
+            job.deleted += len(rows)
+        else:
+            if job.kind == 'account':
+                db.session.execute(db.delete(User).where(User.id == job.user_id))
+            job.status = 'done'
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+    
+    forget_short_codes(rows, filter_generation)
+    return bool(rows)
+
+
+def fail_deletion_job(job_id, error):
+    with app.app_context():
+        db.session.rollback()
+        db.session.execute(
+            db.update(DeletionJob).where(DeletionJob.id == job_id)
+            .values(status='failed', error=str(error)[:255], finished_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+
+deleter = ChunkedDeleter(delete_chunk, fail_deletion_job, pause=app.config['DELETE_CHUNK_PAUSE'])
+
+
+def start_deletion_job(user_id, kind):
+    """Create a DeletionJob for the user's links and queue it; returns the job"""
+    max_url_id, total = db.session.execute(
+        db.select(db.func.max(URLMapping.id), db.func.count()).where(URLMapping.user_id == user_id)
+    ).one()
+    job = DeletionJob(
+        user_id=user_id,
+        kind=kind,
+        total=total,
+        max_url_id=max_url_id if kind == 'history' else None
+    )
+    db.session.add(job)
+    db.session.commit()
+    deleter.submit(job.id)
+    return job
+
+
+def account_being_deleted(user):
+    """True while deletion of this account is pending or running, and once
+    its row is gone (a login can pass the password check just before that)"""
+    return db.session.execute(db.select(db.or_(
+        db.exists().where(
+            DeletionJob.user_id == user.id,
+            DeletionJob.kind == 'account',
+            DeletionJob.status.in_(('pending', 'running'))
+        ),
+        ~db.exists().where(User.id == user.id)
+    ))).scalar()
+
+
+def resume_deletion_jobs(lease=None):
+    """Queue unfinished jobs that made no progress for `lease` seconds
+    
+    Such a job's worker died or restarted. Each job is claimed with a
+    conditional UPDATE, so only one worker takes it over; deleting chunks
+    again would be harmless anyway.
+    """
+    lease = app.config['DELETION_JOB_LEASE'] if lease is None else lease
+    table = DeletionJob.__table__
+    now = datetime.utcnow()
+    unfinished = (
+        table.c.status.in_(('pending', 'running')),
+        db.or_(table.c.updated_at.is_(None), table.c.updated_at < now - timedelta(seconds=lease))
+    )
+    with db.engine.connect() as conn:
+        job_ids = conn.execute(db.select(table.c.id).where(*unfinished).order_by(table.c.id)).scalars().all()
+        for job_id in job_ids:
+            claimed = conn.execute(
+                table.update().where(table.c.id == job_id, *unfinished).values(updated_at=now)
+            ).rowcount
+            conn.commit()
+            if claimed:
+                deleter.submit(job_id)
+
+
+next_deletion_job_check = 0.0
+
+
+@app.before_request
+def take_over_stalled_deletion_jobs():
+    """Look for jobs left by a dead worker at most once per lease, from any request"""
+    global next_deletion_job_check
+    now = time.monotonic()
+    if now < next_deletion_job_check:
+        return
+    next_deletion_job_check = now + app.config['DELETION_JOB_LEASE']
+    try:
+        resume_deletion_jobs()
+    except Exception:
+        app.logger.exception('Could not take over stalled deletion jobs')
+
+
+def reserve_code_block(size):
+    """Atomically reserve [start, start + size) from the persisted code sequence"""
+    table = CodeSequence.__table__
+    with app.app_context():
+        for _ in range(3):
+            try:
+                # The UPDATE takes SQLite's write lock, so the read below sees
+                # our own reservation and no other process can interleave
+                result = db.session.execute(
+                    table.update()
+                    .where(table.c.name == 'short_code')
+                    .values(next_value=table.c.next_value + size)
+                )
+                if result.rowcount == 0:
+                    db.session.execute(table.insert().values(name='short_code', next_value=size))
+                    start = 0
+                else:
+                    start = db.session.execute(
+                        db.select(table.c.next_value).where(table.c.name == 'short_code')
+                    ).scalar_one() - size
+                db.session.commit()
+                return start
+            except IntegrityError:
+                # Another process created the sequence row first
+                db.session.rollback()
+    raise RuntimeError('Could not reserve a block of short codes')
+
+
+code_allocator = make_code_allocator(
+    app.config['SHORT_CODE_ALLOCATOR'],
+    reserve_code_block,
+    length=app.config['SHORT_CODE_LENGTH'],
+    block_size=app.config['SHORT_CODE_BLOCK_SIZE'],
+    key=app.config['SHORT_CODE_KEY']
+)
 
 
 def is_valid_username(username):
@@ -111,11 +594,237 @@ def is_valid_url(url):
         return False, str(e)
 
 
+def normalize_url(url):
+    """Canonical form of a URL used for dedup (lowercase scheme/host, no default port)"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    try:
+        host = parts.hostname or ''
+        if ':' in host:
+            host = f'[{host}]'  # IPv6 literal
+        if parts.port and DEFAULT_PORTS.get(scheme) != parts.port:
+            host = f'{host}:{parts.port}'
+        userinfo = parts.netloc.rpartition('@')[0]
+        netloc = f'{userinfo}@{host}' if userinfo else host
+    except ValueError:
+        pass  # malformed port, keep the lowercased netloc
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, parts.fragment))
+
+
+def url_hash(url):
+    """Fixed-width digest of the normalized URL, backed by a unique index"""
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+def find_short_code(user_id, digest):
+    """Index probe for the user's existing mapping with the given url_hash"""
+    row = db.session.query(URLMapping.shortened_url).filter_by(
+        user_id=user_id,
+        url_hash=digest
+    ).first()
+    return row.shortened_url if row else None
+
+
+HISTORY_FIELDS = ('id', 'original_url', 'shortened_url', 'created_at', 'click_count')
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor for the (created_at, id) of the last row on a page"""
+    return base64.urlsafe_b64encode(f'{created_at}|{row_id}'.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return created_at, int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_history_args(args):
+    """Validate the limit, cursor and fields query arguments of /api/history"""
+    try:
+        limit = int(args.get('limit', HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= HISTORY_MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {HISTORY_MAX_LIMIT}')
+    
+    cursor = args.get('cursor')
+    cursor = decode_cursor(cursor) if cursor else None
+    
+    fields = args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = set(fields) - set(HISTORY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    else:
+        fields = list(HISTORY_FIELDS)
+    return limit, cursor, fields
+
+
+def fetch_history_page(limit, cursor, fields, *criteria):
+    """Keyset-paginated history, newest first, selecting only the requested columns
+
+    Rows come back as plain tuples, so no URLMapping objects are hydrated.
+    created_at is compared in its stored text form so the cursor matches
+    rows exactly and the (created_at, id) index serves the range scan.
+    """
+    created_raw = db.type_coerce(URLMapping.created_at, db.String)
+    columns = [URLMapping.id, created_raw.label('cursor_created_at')]
+    columns += [getattr(URLMapping, field) for field in fields if field != 'id']
+    
+    query = db.session.query(*columns).filter(*criteria)
+    if cursor:
+        query = query.filter(db.tuple_(created_raw, URLMapping.id) < cursor)
+    rows = query.order_by(created_raw.desc(), URLMapping.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].cursor_created_at, rows[-1].id)
+    
+    data = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            value = getattr(row, field)
+            if field == 'created_at' and value is not None:
+                value = value.strftime('%Y-%m-%d %H:%M:%S')
+            item[field] = value
+        data.append(item)
+    return data, next_cursor
+
+
+BATCH_MAX_URLS = 50000
+IN_QUERY_CHUNK = 900  # stays under SQLite's bound-parameter limit
+
+
+def read_batch_urls():
+    """Parse a batch body: a JSON array or NDJSON, each item a URL or {"url": ...}"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValueError('Expected a JSON array of URLs')
+    
+    if len(items) > BATCH_MAX_URLS:
+        raise ValueError(f'A batch can contain at most {BATCH_MAX_URLS} URLs')
+    return [item.get('url', '') if isinstance(item, dict) else item for item in items]
+
+
+def find_short_codes(user_id, digests):
+    """Map url_hash -> shortened_url for the user's digests that already exist"""
+    found = {}
+    for start in range(0, len(digests), IN_QUERY_CHUNK):
+        chunk = digests[start:start + IN_QUERY_CHUNK]
+        found.update(
+            db.session.query(URLMapping.url_hash, URLMapping.shortened_url)
+            .filter(URLMapping.user_id == user_id, URLMapping.url_hash.in_(chunk))
+        )
+    return found
+
+
+def shorten_many(user_id, urls):
+    """Shorten a list of URLs in a single transaction; returns one result per input
+
+    Existing mappings are resolved with IN queries, new codes come from one
+    allocator call and all new rows go in with a single executemany INSERT.
+    """
+    results = [None] * len(urls)
+    pending = {}  # url_hash -> (processed_url, [input positions])
+    for position, raw_url in enumerate(urls):
+        if not isinstance(raw_url, str):
+            results[position] = {'success': False, 'error': 'URL must be a string'}
+            continue
+        
+        original_url = raw_url.strip()
+        if not original_url:
+            results[position] = {'success': False, 'error': 'URL cannot be empty'}
+            continue
+        
+        is_valid, processed_url = is_valid_url(original_url)
+        if not is_valid:
+            results[position] = {'success': False, 'error': processed_url}
+            continue
+        
+        digest = url_hash(processed_url)
+        if digest in pending:
+            pending[digest][1].append(position)
+        else:
+            pending[digest] = (processed_url, [position])
+    
+    table = URLMapping.__table__
+    for _ in range(3):
+        existing = find_short_codes(user_id, list(pending))
+        new_digests = [digest for digest in pending if digest not in existing]
+        created = dict(zip(new_digests, code_allocator.allocate_many(len(new_digests))))
+        rows = [
+            {'user_id': user_id, 'original_url': pending[digest][0], 'shortened_url': short_code, 'url_hash': digest}
+            for digest, short_code in created.items()
+        ]
+        try:
+            if rows:
+                db.session.execute(table.insert(), rows)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # A leftover random code or a concurrent shorten of the same URL;
+            # re-resolve and retry with fresh codes
+            db.session.rollback()
+    else:
+        raise RuntimeError('Could not allocate unique short codes for the batch')
+    
+    if redirect_table is not None:
+        redirect_table.put_many((short_code, pending[digest][0]) for digest, short_code in created.items())
+    if code_filter is not None:
+        code_filter.add_many(created.values())
+    
+    for digest, (processed_url, positions) in pending.items():
+        short_code = created.get(digest) or existing[digest]
+        for number, position in enumerate(positions):
+            results[position] = {
+                'success': True,
+                'short_code': short_code,
+                'shortened_url': f"http://localhost:5000/s/{short_code}",
+                'created': digest in created and number == 0
+            }
+    
+    for position, result in enumerate(results):
+        result['url'] = urls[position]
+    return results
+
+
+def current_user_id():
+    """Id of the logged in user, or None (clearing the session) if the
+    account is gone or its sessions were ended"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    token = db.session.execute(db.select(User.session_token).where(User.id == user_id)).scalar()
+    if token is None or token != session.get('session_token'):
+        session.pop('user_id', None)
+        session.pop('username', None)
+        session.pop('session_token', None)
+        return None
+    return user_id
+
+
 def login_required(f):
     """Decorator to check if user is logged in"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if current_user_id() is None:
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
@@ -126,7 +835,7 @@ def login_required(f):
 @app.route('/')
 def index():
     """Home/Login page"""
-    if 'user_id' in session:
+    if current_user_id() is not None:
         return redirect(url_for('dashboard'))
     return render_template('auth.html')
 
@@ -169,6 +878,10 @@ def signup():
             'message': 'Account created successfully! Please login.'
         }), 201
     
+    except PoolBusy:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Server busy, please try again in a moment'}), 503
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -187,13 +900,27 @@ def login():
     # Find user
     user = User.query.filter_by(username=username).first()
     
-    if not user or not user.check_password(password):
+    try:
+        valid = user is not None and user.check_password(password)
+    except PoolBusy:
+        return jsonify({'success': False, 'error': 'Server busy, please try again in a moment'}), 503
+    
+    if not valid:
         return jsonify({'success': False, 'error': 'Invalid username or password'}), 401
     
+    if account_being_deleted(user):
+        return jsonify({'success': False, 'error': 'This account is being deleted'}), 403
+    
     try:
+        if user.session_token is None:
+            user.session_token = secrets.token_hex(16)  # created before session tokens existed
+        if db.session.is_modified(user):
+            db.session.commit()  # the password was rehashed with the current settings
+        
         # Create session
         session['user_id'] = user.id
         session['username'] = user.username
+        session['session_token'] = user.session_token
         
         return jsonify({
             'success': True,
@@ -218,7 +945,7 @@ def logout():
 @app.route('/api/check-auth', methods=['GET'])
 def check_auth():
     """Check if user is logged in"""
-    if 'user_id' in session:
+    if current_user_id() is not None:
         return jsonify({
             'logged_in': True,
             'username': session.get('username')
@@ -226,6 +953,61 @@ def check_auth():
     return jsonify({'logged_in': False}), 200
 
 
+@app.route('/api/account', methods=['DELETE'])
+@login_required
+def delete_account():
+    """Delete the logged in account and all of its URLs in the background
+    
+    Requires the password. Every session of the account ends at once;
+    GET /api/jobs/<id> keeps working for this browser until the deletion
+    is done.
+    """
+    data = request.get_json(silent=True) or {}
+    password = data.get('password', '')
+    user = db.session.get(User, session.get('user_id'))
+    if user is None:
+        session.clear()
+        return jsonify({'success': False, 'error': 'Account not found'}), 404
+    
+    try:
+        valid = user.check_password(password)
+    except PoolBusy:
+        return jsonify({'success': False, 'error': 'Server busy, please try again in a moment'}), 503
+    if not valid:
+        return jsonify({'success': False, 'error': 'Incorrect password'}), 401
+    
+    try:
+        db.session.rollback()  # discard a rehash; the account is going away
+        user.session_token = secrets.token_hex(16)  # committed with the job
+        job = start_deletion_job(user.id, 'account')
+        session.clear()
+        session['deletion_job_id'] = job.id
+        return jsonify({
+            'success': True,
+            'message': 'Account deletion started',
+            'job': job.to_dict()
+        }), 202
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def deletion_job_status(job_id):
+    """Progress of a history or account deletion started from this session"""
+    job = db.session.get(DeletionJob, job_id)
+    # Account jobs are only shown to the browser that started them: the
+    # user they belong to no longer has a session
+    allowed = job is not None and (
+        (job.kind == 'history' and job.user_id == current_user_id())
+        or job.id == session.get('deletion_job_id')
+    )
+    if not allowed:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()}), 200
+
+
 # ==================== URL SHORTENING ROUTES ====================
 
 @app.route('/dashboard')
@@ -253,34 +1035,46 @@ def shorten_url():
     
     try:
         # Check if user already shortened this URL
-        existing = URLMapping.query.filter_by(
-            user_id=user_id,
-            original_url=processed_url
-        ).first()
+        digest = url_hash(processed_url)
+        existing = find_short_code(user_id, digest)
         
         if existing:
-            shortened_url = f"http://localhost:5000/s/{existing.shortened_url}"
+            shortened_url = f"http://localhost:5000/s/{existing}"
             return jsonify({
                 'success': True,
                 'shortened_url': shortened_url,
-                'short_code': existing.shortened_url,
+                'short_code': existing,
                 'message': 'URL already shortened'
             }), 200
         
-        # Generate unique short code
-        while True:
-            short_code = generate_short_code()
-            if not URLMapping.query.filter_by(shortened_url=short_code).first():
+        # Allocate a code without probing the table. The unique index still
+        # rejects codes left over from the old random generator, so retry then.
+        is_new = True
+        for _ in range(5):
+            short_code = code_allocator.allocate()
+            new_mapping = URLMapping(
+                user_id=user_id,
+                original_url=processed_url,
+                shortened_url=short_code,
+                url_hash=digest
+            )
+            db.session.add(new_mapping)
+            try:
+                db.session.commit()
+                if redirect_table is not None:
+                    redirect_table.put(short_code, processed_url)
+                if code_filter is not None:
+                    code_filter.add(short_code)
                 break
-        
-        # Create new mapping
-        new_mapping = URLMapping(
-            user_id=user_id,
-            original_url=processed_url,
-            shortened_url=short_code
-        )
-        db.session.add(new_mapping)
-        db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                # A concurrent request may have shortened the same URL first
+                existing = find_short_code(user_id, digest)
+                if existing:
+                    short_code, is_new = existing, False
+                    break
+        else:
+            raise RuntimeError('Could not allocate a unique short code')
         
         shortened_url = f"http://localhost:5000/s/{short_code}"
         
@@ -288,7 +1082,30 @@ def shorten_url():
             'success': True,
             'shortened_url': shortened_url,
             'short_code': short_code,
-            'message': 'New shortened URL created'
+            'message': 'New shortened URL created' if is_new else 'URL already shortened'
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Error: {str(e)}'}), 500
+
+
+@app.route('/api/shorten/batch', methods=['POST'])
+@login_required
+def shorten_batch():
+    """API endpoint to shorten many URLs (JSON array or NDJSON body) at once"""
+    try:
+        urls = read_batch_urls()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        results = shorten_many(session.get('user_id'), urls)
+        return jsonify({
+            'success': True,
+            'created': sum(1 for result in results if result.get('created')),
+            'failed': sum(1 for result in results if not result['success']),
+            'results': results
         }), 200
     
     except Exception as e:
@@ -299,16 +1116,85 @@ def shorten_url():
 @app.route('/api/history', methods=['GET'])
 @login_required
 def get_history():
-    """API endpoint to get user's URLs"""
+    """API endpoint to get user's URLs, newest first, one page at a time
+    
+    Query args: limit (default 50), cursor (next_cursor of the previous page)
+    and fields (comma separated subset of HISTORY_FIELDS).
+    """
+    try:
+        limit, cursor, fields = parse_history_args(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     try:
         user_id = session.get('user_id')
-        urls = URLMapping.query.filter_by(user_id=user_id).order_by(
-            URLMapping.created_at.desc()
-        ).all()
+        data, next_cursor = fetch_history_page(limit, cursor, fields, URLMapping.user_id == user_id)
         
         return jsonify({
             'success': True,
-            'data': [url.to_dict() for url in urls]
+            'data': data,
+            'next_cursor': next_cursor
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+STATS_DEFAULT_BUCKETS = {'hour': 48, 'day': 30}
+STATS_MAX_BUCKETS = 1000
+
+
+@app.route('/api/stats/<short_code>', methods=['GET'])
+@login_required
+def link_stats(short_code):
+    """API endpoint for clicks over time on one of the user's links
+    
+    Query args: resolution (hour or day, default hour) and buckets (how
+    many, ending with the current one). Reads only the rollups; clicks from
+    the last flush interval are not in them yet. Bucket starts are unix
+    times (UTC).
+    """
+    resolution = request.args.get('resolution', 'hour')
+    if resolution not in ROLLUP_RESOLUTIONS:
+        return jsonify({'success': False, 'error': f'resolution must be one of {", ".join(ROLLUP_RESOLUTIONS)}'}), 400
+    try:
+        buckets = int(request.args.get('buckets', STATS_DEFAULT_BUCKETS[resolution]))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'buckets must be an integer'}), 400
+    if not 1 <= buckets <= STATS_MAX_BUCKETS:
+        return jsonify({'success': False, 'error': f'buckets must be between 1 and {STATS_MAX_BUCKETS}'}), 400
+    
+    try:
+        link = db.session.execute(
+            db.select(URLMapping.id, URLMapping.click_count)
+            .where(URLMapping.shortened_url == short_code, URLMapping.user_id == session.get('user_id'))
+        ).first()
+        if link is None:
+            return jsonify({'success': False, 'error': 'URL not found'}), 404
+        
+        seconds = ROLLUP_RESOLUTIONS[resolution]
+        now = int(time.time())
+        last = now - now % seconds
+        first = last - (buckets - 1) * seconds
+        counts = dict(db.session.execute(
+            db.select(ClickRollup.bucket_start, ClickRollup.clicks)
+            .where(
+                ClickRollup.url_id == link.id,
+                ClickRollup.resolution == seconds,
+                ClickRollup.bucket_start >= first
+            )
+        ).all())
+        
+        return jsonify({
+            'success': True,
+            'short_code': short_code,
+            'resolution': resolution,
+            'bucket_seconds': seconds,
+            'total_clicks': link.click_count,
+            'buckets': [
+                {'start': start, 'clicks': counts.get(start, 0)}
+                for start in range(first, last + 1, seconds)
+            ]
         }), 200
     
     except Exception as e:
@@ -321,6 +1207,8 @@ def delete_url(url_id):
     """API endpoint to delete a URL"""
     try:
         user_id = session.get('user_id')
+        # Read before the row: a scan after this point may or may not have seen it
+        filter_generation = code_filter.generation if code_filter is not None else None
         url_mapping = URLMapping.query.filter_by(
             id=url_id,
             user_id=user_id
@@ -329,8 +1217,15 @@ def delete_url(url_id):
         if not url_mapping:
             return jsonify({'success': False, 'error': 'URL not found'}), 404
         
+        row_id, short_code = url_mapping.id, url_mapping.shortened_url
         db.session.delete(url_mapping)
         db.session.commit()
+        if redirect_table is not None:
+            redirect_table.remove(short_code)
+        if code_filter is not None:
+            code_filter.remove(row_id, short_code, filter_generation)
+        redirect_cache.invalidate(short_code)
+        click_aggregator.discard([short_code])
         
         return jsonify({
             'success': True,
@@ -345,16 +1240,19 @@ def delete_url(url_id):
 @app.route('/api/clear-history', methods=['DELETE'])
 @login_required
 def clear_all_history():
-    """API endpoint to clear all user's URLs"""
+    """API endpoint to clear all user's URLs
+    
+    The URLs are deleted in the background in chunks; follow the returned
+    job with GET /api/jobs/<id>. URLs created after the request are kept.
+    """
     try:
-        user_id = session.get('user_id')
-        URLMapping.query.filter_by(user_id=user_id).delete()
-        db.session.commit()
+        job = start_deletion_job(session.get('user_id'), 'history')
         
         return jsonify({
             'success': True,
-            'message': 'All history cleared'
-        }), 200
+            'message': 'Clearing history',
+            'job': job.to_dict()
+        }), 202
     
     except Exception as e:
         db.session.rollback()
@@ -367,28 +1265,58 @@ def clear_all_history():
 def redirect_to_original(short_code):
     """Redirect to original URL"""
     try:
-        mapping = URLMapping.query.filter_by(shortened_url=short_code).first()
-        
-        if not mapping:
-            return render_template('404.html'), 404
+        # Shared table first, then this process's cache, then the database
+        original_url = redirect_table.get(short_code) if redirect_table is not None else None
+        if original_url is None:
+            original_url = redirect_cache.get(short_code)
+        if original_url is None:
+            # Codes the filter has never seen are answered without a query
+            answer = code_filter.lookup(short_code) if code_filter is not None else None
+            if answer == ABSENT:
+                return not_found_page(), 404
+            with read_engine.connect() as conn:
+                original_url = conn.execute(
+                    db.select(URLMapping.original_url).where(URLMapping.shortened_url == short_code)
+                ).scalar()
+            
+            if original_url is None:
+                if code_filter is not None:
+                    code_filter.missed(answer)
+                return not_found_page(), 404
+            
+            redirect_cache.put(short_code, original_url)
         
-        # Increment click count
-        mapping.click_count += 1
-        db.session.commit()
+        # Buffer the click; it is written to the database in the next batch
+        click_aggregator.record(short_code)
         
         from flask import redirect
-        return redirect(mapping.original_url, code=302)
+        return redirect(original_url, code=302)
     
     except Exception as e:
         return render_template('error.html', error=str(e)), 500
 
 
+@app.route('/api/cache/stats', methods=['GET'])
+@login_required
+def cache_stats():
+    """Hit/miss/eviction counters for the redirect cache and click buffer, hasher and deleter load"""
+    return jsonify({
+        'success': True,
+        'redirect_cache': redirect_cache.stats(),
+        'click_buffer': click_aggregator.stats(),
+        'redirect_table': redirect_table.stats() if redirect_table is not None else None,
+        'code_filter': code_filter.stats() if code_filter is not None else None,
+        'password_hasher': password_hasher.stats(),
+        'deleter': deleter.stats()
+    }), 200
+
+
 # ==================== ERROR HANDLERS ====================
 
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
-    return render_template('404.html'), 404
+    return not_found_page(), 404
 
 
 @app.errorhandler(500)
@@ -399,7 +1327,123 @@ def internal_error(error):
 
 # ==================== DATABASE INITIALIZATION ====================
 
+def backfill_url_hashes():
+    """Add and backfill url_hash on databases created before it existed"""
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('url_mapping')}
+    if 'url_hash' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE url_mapping ADD COLUMN url_hash VARCHAR(64)'))
+    
+    # Backfill in id order, one batch per transaction
+    table = URLMapping.__table__
+    last_id = 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                db.select(table.c.id, table.c.original_url)
+                .where(table.c.url_hash.is_(None), table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(1000)
+            ).all()
+            if not rows:
+                break
+            conn.execute(
+                table.update().where(table.c.id == db.bindparam('row_id')).values(url_hash=db.bindparam('digest')),
+                [{'row_id': row.id, 'digest': url_hash(row.original_url)} for row in rows]
+            )
+            last_id = rows[-1].id
+    
+    with db.engine.begin() as conn:
+        # Rows that only differ after normalization keep their history but
+        # only the oldest one per user stays a dedup target
+        conn.execute(db.text(
+            'UPDATE url_mapping SET url_hash = NULL WHERE url_hash IS NOT NULL AND id NOT IN '
+            '(SELECT MIN(id) FROM url_mapping WHERE url_hash IS NOT NULL GROUP BY user_id, url_hash)'
+        ))
+
+
+def has_autoincrement(table_name):
+    """Whether SQLite created the table with AUTOINCREMENT"""
+    with db.engine.connect() as conn:
+        sql = conn.execute(
+            db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': table_name}
+        ).scalar()
+    return sql is not None and 'AUTOINCREMENT' in sql.upper()
+
+
+def rebuild_table(table):
+    """Recreate a table with its current definition, keeping its rows
+    
+    SQLite can't alter a constraint or add AUTOINCREMENT, so the table is
+    rebuilt: create a copy with the current definition, move the rows over,
+    drop the old table and rename the copy. Indexes are recreated by
+    migrate_db afterwards.
+    """
+    metadata = db.MetaData()
+    for other in db.metadata.tables.values():
+        if other is not table:
+            other.to_metadata(metadata)  # so foreign keys resolve
+    rebuilt = table.to_metadata(metadata, name=f'{table.name}_rebuild')
+    columns = ', '.join(column.name for column in table.columns)
+    with db.engine.connect() as conn:
+        # With foreign keys on, dropping the table would cascade into the
+        # tables referencing it; the pragma can only change outside a transaction
+        conn.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        conn.commit()
+        try:
+            with conn.begin():
+                conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{rebuilt.name}"')  # left by an interrupted run
+                conn.execute(CreateTable(rebuilt))
+                conn.exec_driver_sql(f'INSERT INTO "{rebuilt.name}" ({columns}) SELECT {columns} FROM "{table.name}"')
+                conn.exec_driver_sql(f'DROP TABLE "{table.name}"')
+                conn.exec_driver_sql(f'ALTER TABLE "{rebuilt.name}" RENAME TO "{table.name}"')
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql('PRAGMA foreign_keys=ON')
+            conn.commit()
+
+
+def migrate_db():
+    """Bring databases created by older versions up to the current schema"""
+    existing = {index['name'] for index in db.inspect(db.engine).get_indexes('url_mapping')}
+    if 'ix_url_mapping_user_url_hash' not in existing:
+        backfill_url_hashes()
+    
+    if 'updated_at' not in {column['name'] for column in db.inspect(db.engine).get_columns('deletion_job')}:
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE deletion_job ADD COLUMN updated_at DATETIME'))
+    
+    if 'session_token' not in {column['name'] for column in db.inspect(db.engine).get_columns('user')}:
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE user ADD COLUMN session_token VARCHAR(32)'))
+    if db.engine.dialect.name == 'sqlite' and not has_autoincrement('user'):
+        rebuild_table(User.__table__)
+    
+    if db.engine.dialect.name == 'sqlite' and not (has_autoincrement('url_mapping') and any(
+        foreign_key['referred_table'] == 'user'
+        and foreign_key.get('options', {}).get('ondelete', '').upper() == 'CASCADE'
+        for foreign_key in db.inspect(db.engine).get_foreign_keys('url_mapping')
+    )):
+        rebuild_table(URLMapping.__table__)
+    
+    # Indexes are created last so the unique url_hash index sees deduplicated rows
+    for index in URLMapping.__table__.indexes | User.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+
+def init_db():
+    """Create missing tables and migrate existing ones"""
+    db.create_all()
+    migrate_db()
+
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
+        if redirect_table is not None:
+            redirect_table.open()
+        if code_filter is not None:
+            code_filter.build()
+        resume_deletion_jobs(lease=0)  # nothing else is running yet
     app.run(debug=True, port=5000)
\ No newline at end of file
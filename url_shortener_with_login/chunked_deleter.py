@@ -0,0 +1,77 @@
+"""
+Background runner for large deletes, one bounded chunk at a time.
+
+Deleting a whole history (or account) in one statement holds the SQLite
+write lock until every row, index entry and cascaded click row is gone, and
+every other write (shortens, click flushes, logins that rehash) waits
+behind it. The deleter instead calls delete_chunk(job_id) on a background
+thread; each call deletes at most one chunk in its own transaction and
+returns False once the job is finished. Between chunks it sleeps `pause`
+seconds, so writers queued on the lock get their turn.
+
+Job state (progress, status, errors) lives with the caller, in the
+database, so any worker process can report it.
+"""
+import queue
+import threading
+import time
+
+
+class ChunkedDeleter:
+    """Runs submitted deletion jobs one at a time on a daemon thread"""
+
+    def __init__(self, delete_chunk, on_error, pause=0.02):
+        # delete_chunk(job_id) -> True while rows remain; on_error(job_id, exc) records a failure
+        self.delete_chunk = delete_chunk
+        self.on_error = on_error
+        self.pause = pause
+        self._jobs = queue.Queue()
+        self._submitted = set()  # queued or running here
+        self._lock = threading.Lock()
+        self._thread = None
+        self.current_job = None
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.chunks = 0
+
+    def submit(self, job_id):
+        """Queue a job; it starts once the jobs before it are finished (no-op if already queued)"""
+        with self._lock:
+            if job_id in self._submitted:
+                return
+            self._submitted.add(job_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='chunked-deleter', daemon=True)
+                self._thread.start()
+        self._jobs.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._jobs.get()
+            self.current_job = job_id
+            try:
+                while self.delete_chunk(job_id):
+                    self.chunks += 1
+                    time.sleep(self.pause)
+                self.jobs_done += 1
+            except Exception as e:
+                self.jobs_failed += 1
+                try:
+                    self.on_error(job_id, e)
+                except Exception:
+                    pass  # the job stays unfinished and can be resubmitted
+            finally:
+                self.current_job = None
+                with self._lock:
+                    self._submitted.discard(job_id)
+
+    def stats(self):
+        """Return counters suitable for a JSON response"""
+        return {
+            'queued_jobs': self._jobs.qsize(),
+            'current_job': self.current_job,
+            'jobs_done': self.jobs_done,
+            'jobs_failed': self.jobs_failed,
+            'chunks': self.chunks,
+            'pause_seconds': self.pause
+        }
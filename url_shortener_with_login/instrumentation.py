@@ -0,0 +1,242 @@
+"""
+Opt-in request and database instrumentation for the Flask apps.
+
+init_instrumentation(app, engines) hooks before_request/after_request and
+the SQLAlchemy before_cursor_execute/after_cursor_execute events to record,
+per endpoint (the URL rule, so /s/<short_code> is one series):
+
+    http_requests_total               requests by method and status
+    http_request_duration_seconds     latency histogram
+    http_response_size_bytes          response size histogram
+    db_queries_per_request            SQL statements per request (histogram)
+    db_query_duration_seconds_total   time spent in SQL
+    db_queries_total                  SQL statements executed
+
+and serves them on /metrics in the Prometheus text format. Requests slower
+than slow_request_ms are logged with their query breakdown. Counters are
+per process; with several workers scrape each one (or sum them).
+
+Apps that talk to sqlite3 directly can call record_query() themselves.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, has_request_context, request
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+SLOW_QUERY_LINES = 5
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+    def samples(self):
+        """(le, cumulative count) pairs including +Inf"""
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield format_number(bound), running
+        yield '+Inf', self.total
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{escape_label(value)}"' for name, value in labels)
+
+
+class MetricsRegistry:
+    """Thread-safe store for the request and query metrics of one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)  # (endpoint, method, status) -> count
+        self.latency = {}                 # (endpoint, method) -> Histogram
+        self.response_size = {}           # endpoint -> Histogram
+        self.queries_per_request = {}     # endpoint -> Histogram
+        self.query_count = defaultdict(int)
+        self.query_seconds = defaultdict(float)
+
+    def observe_request(self, endpoint, method, status, seconds, size, queries, query_seconds):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            self._histogram(self.latency, (endpoint, method), LATENCY_BUCKETS).observe(seconds)
+            if size is not None:
+                self._histogram(self.response_size, endpoint, SIZE_BUCKETS).observe(size)
+            self._histogram(self.queries_per_request, endpoint, QUERY_COUNT_BUCKETS).observe(queries)
+            self.query_count[endpoint] += queries
+            self.query_seconds[endpoint] += query_seconds
+
+    def observe_background_query(self, seconds):
+        """Statements run outside a request (flush threads, startup)"""
+        with self._lock:
+            self.query_count['<background>'] += 1
+            self.query_seconds['<background>'] += seconds
+
+    @staticmethod
+    def _histogram(store, key, buckets):
+        histogram = store.get(key)
+        if histogram is None:
+            histogram = store[key] = Histogram(buckets)
+        return histogram
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_requests_total Requests handled, by endpoint, method and status.')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                labels = format_labels((('endpoint', endpoint), ('method', method), ('status', status)))
+                lines.append(f'http_requests_total{{{labels}}} {count}')
+
+            self._render_histograms(
+                lines, 'http_request_duration_seconds', 'Request latency in seconds.',
+                {(('endpoint', endpoint), ('method', method)): histogram
+                 for (endpoint, method), histogram in self.latency.items()}
+            )
+            self._render_histograms(
+                lines, 'http_response_size_bytes', 'Response body size in bytes.',
+                {(('endpoint', endpoint),): histogram for endpoint, histogram in self.response_size.items()}
+            )
+            self._render_histograms(
+                lines, 'db_queries_per_request', 'SQL statements executed per request.',
+                {(('endpoint', endpoint),): histogram for endpoint, histogram in self.queries_per_request.items()}
+            )
+
+            lines.append('# HELP db_queries_total SQL statements executed, by endpoint.')
+            lines.append('# TYPE db_queries_total counter')
+            for endpoint, count in sorted(self.query_count.items()):
+                lines.append(f'db_queries_total{{{format_labels((("endpoint", endpoint),))}}} {count}')
+            lines.append('# HELP db_query_duration_seconds_total Time spent executing SQL, by endpoint.')
+            lines.append('# TYPE db_query_duration_seconds_total counter')
+            for endpoint, seconds in sorted(self.query_seconds.items()):
+                lines.append(f'db_query_duration_seconds_total{{{format_labels((("endpoint", endpoint),))}}} '
+                             f'{seconds!r}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, histograms):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, histogram in sorted(histograms.items()):
+            for bound, count in histogram.samples():
+                lines.append(f'{name}_bucket{{{format_labels(labels + (("le", bound),))}}} {count}')
+            lines.append(f'{name}_sum{{{format_labels(labels)}}} {histogram.sum!r}')
+            lines.append(f'{name}_count{{{format_labels(labels)}}} {histogram.total}')
+
+
+def record_query(statement, seconds):
+    """Attribute one SQL statement to the current request (or to the background)"""
+    if has_request_context() and 'instrumentation_queries' in g:
+        g.instrumentation_queries.append((statement, seconds))
+    elif _registry is not None:
+        _registry.observe_background_query(seconds)
+
+
+def instrument_engine(engine):
+    """Time every statement executed through a SQLAlchemy engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('instrumentation_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['instrumentation_started'].pop()
+        record_query(statement, time.perf_counter() - started)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('instrumentation_started'):
+            started = conn.info['instrumentation_started'].pop()
+            record_query(exception_context.statement or '', time.perf_counter() - started)
+
+
+_registry = None
+
+
+def init_instrumentation(app, engines=(), slow_request_ms=500, metrics_path='/metrics'):
+    """Install the hooks on app (and engines) and add the metrics endpoint"""
+    global _registry
+    registry = _registry = MetricsRegistry()
+    # The read engine falls back to the main engine for in-memory databases
+    for engine in {id(engine): engine for engine in engines}.values():
+        instrument_engine(engine)
+
+    @app.before_request
+    def start_request_timer():
+        g.instrumentation_started = time.perf_counter()
+        g.instrumentation_queries = []
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('instrumentation_started', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        queries = g.pop('instrumentation_queries', [])
+        query_seconds = sum(duration for _, duration in queries)
+        endpoint = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        # Streamed responses have no length up front and are not sized
+        size = None if response.is_streamed else response.calculate_content_length()
+        registry.observe_request(
+            endpoint, request.method, response.status_code, seconds, size, len(queries), query_seconds
+        )
+
+        if seconds * 1000 >= slow_request_ms:
+            log_slow_request(app, endpoint, response.status_code, seconds, queries)
+        return response
+
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule(metrics_path, 'metrics', metrics)
+    return registry
+
+
+def log_slow_request(app, endpoint, status, seconds, queries):
+    """Log a slow request with its queries grouped by statement, slowest first"""
+    grouped = defaultdict(lambda: [0, 0.0])
+    for statement, duration in queries:
+        entry = grouped[' '.join(statement.split())]
+        entry[0] += 1
+        entry[1] += duration
+    breakdown = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)
+
+    lines = [
+        f'slow request: {request.method} {request.path} ({endpoint}) -> {status} '
+        f'in {seconds * 1000:.1f} ms, {len(queries)} queries '
+        f'taking {sum(duration for _, duration in queries) * 1000:.1f} ms'
+    ]
+    for statement, (count, duration) in breakdown[:SLOW_QUERY_LINES]:
+        lines.append(f'    {count}x {duration * 1000:.1f} ms  {statement[:200]}')
+    if len(breakdown) > SLOW_QUERY_LINES:
+        lines.append(f'    ... {len(breakdown) - SLOW_QUERY_LINES} more distinct statements')
+    app.logger.warning('\n'.join(lines))
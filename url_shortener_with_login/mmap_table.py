@@ -0,0 +1,406 @@
+"""
+Memory-mapped short code -> URL table shared by all worker processes.
+
+The table is one file with a fixed layout: a header, an open-addressing
+hash table of (hash, offset) slots with linear probing, and a heap of
+(code, URL) records. Every worker maps the same file, so the data lives
+once in the OS page cache instead of once per process, and a lookup is a
+few struct reads with no lock, no query and no syscall.
+
+The file is built from the database the first time it is opened (or when
+its entry count no longer matches the database) and then kept current
+incrementally: creates append a record and fill a slot, deletes turn the
+slot into a tombstone. Changes that never reach the file (made while no
+worker had it open, or lost when a worker died between its commit and its
+update) can leave the count matching anyway, so the file also records when
+it was built and is rebuilt once it is older than `rebuild_interval`; like
+the RedirectCache TTL, that bounds how long it can stay wrong. Writers serialize on an flock'd lock file (only a
+thread lock where fcntl is unavailable). When the slots or the heap run
+out, the writer rebuilds a larger file from the live entries, swaps it in
+with os.replace and marks the old file retired; other processes notice the
+flag on their next lookup and map the new file.
+
+Readers never block and validate the record they land on, so anything
+unexpected is a miss and the caller falls back to the database.
+"""
+import hashlib
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl  # Unix only; without it the table is shared by threads of one process
+except ImportError:
+    fcntl = None
+
+MAGIC = b'RDTB'
+FORMAT_VERSION = 2
+# magic, version, retired flag, built at (unix seconds), slot count, live entries, tombstones, heap end
+HEADER = struct.Struct('<4sIIIQQQQ')
+HEADER_SIZE = 64
+SLOT = struct.Struct('<QQ')  # key hash, record offset
+RECORD = struct.Struct('<BH')  # code length, URL length; the bytes follow
+RETIRED_OFFSET = 8
+STATE = struct.Struct('<II')  # retired flag, built at
+
+EMPTY = 0
+TOMBSTONE = 1
+MAX_LOAD = 0.7  # (live + tombstones) / slots before the table is rebuilt larger
+MIN_SLOTS = 1024
+MIN_HEAP = 1024 * 1024
+
+
+def key_hash(code):
+    """64-bit hash of an encoded code that is stable across processes; never EMPTY or TOMBSTONE"""
+    value = int.from_bytes(hashlib.blake2b(code, digest_size=8).digest(), 'little')
+    return value if value > TOMBSTONE else value + 2
+
+
+def slot_count(entries):
+    """Power of two keeping `entries` at or below half load"""
+    count = MIN_SLOTS
+    while count < entries * 2:
+        count *= 2
+    return count
+
+
+class RedirectTable:
+    """Shared read-mostly code -> URL map in a memory-mapped file
+
+    load_rows() yields (code, url) pairs from the database and count_rows()
+    returns how many there are; both are only called to (re)build the file.
+    """
+
+    def __init__(self, path, load_rows, count_rows, rebuild_interval=3600.0):
+        self.path = path
+        self.load_rows = load_rows
+        self.count_rows = count_rows
+        self.rebuild_interval = rebuild_interval
+        self._view = None  # (mmap, slot count) of the current file
+        self._file = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    # ==================== READS ====================
+
+    def get(self, code):
+        """The URL for code, or None if the table does not have it"""
+        view = self._view
+        if view is None:
+            view = self.open()
+        mm, slots = view
+        retired, built_at = STATE.unpack_from(mm, RETIRED_OFFSET)
+        if retired:
+            mm, slots = self._reopen(view)
+        elif time.time() - built_at >= self.rebuild_interval:
+            mm, slots = self.refresh()
+
+        encoded = code.encode('utf-8')
+        wanted = key_hash(encoded)
+        mask = slots - 1
+        index = wanted & mask
+        for _ in range(slots):
+            stored, offset = SLOT.unpack_from(mm, HEADER_SIZE + index * SLOT.size)
+            if stored == EMPTY:
+                break
+            if stored == wanted:
+                code_length, url_length = RECORD.unpack_from(mm, offset)
+                start = offset + RECORD.size
+                if mm[start:start + code_length] == encoded:
+                    self.hits += 1
+                    return mm[start + code_length:start + code_length + url_length].decode('utf-8')
+            index = (index + 1) & mask
+        self.misses += 1
+        return None
+
+    # ==================== WRITES ====================
+
+    def put(self, code, url):
+        self.put_many([(code, url)])
+
+    def put_many(self, items):
+        """Add mappings (created codes); codes already present are left alone"""
+        records = []
+        for code, url in items:
+            encoded_code, encoded_url = code.encode('utf-8'), url.encode('utf-8')
+            if len(encoded_code) <= 0xFF and len(encoded_url) <= 0xFFFF:
+                records.append((encoded_code, encoded_url))  # anything longer stays database-only
+        if not records:
+            return
+        with self._writing() as mm:
+            for encoded_code, encoded_url in records:
+                mm = self._insert(mm, encoded_code, encoded_url)
+
+    def remove(self, code):
+        self.remove_many([code])
+
+    def remove_many(self, codes):
+        """Tombstone the slots of deleted codes"""
+        with self._writing() as mm:
+            _, slots, live, tombstones, _ = self._header(mm)
+            for code in codes:
+                index = self._find(mm, slots, code.encode('utf-8'))
+                if index is not None:
+                    SLOT.pack_into(mm, HEADER_SIZE + index * SLOT.size, TOMBSTONE, 0)
+                    live -= 1
+                    tombstones += 1
+            self._set_counts(mm, live, tombstones)
+
+    def clear(self):
+        """Replace the table with an empty one"""
+        with self._writing():
+            self._replace([], 0)
+
+    def rebuild(self):
+        """Rebuild the table from the database"""
+        with self._writing():
+            self._build_from_database()
+
+    def refresh(self):
+        """Rebuild the table if it is older than rebuild_interval; returns the current view"""
+        with self._writing() as mm:
+            # Another thread or process may have rebuilt it while this one waited
+            if self._age(mm) >= self.rebuild_interval:
+                self._build_from_database()
+            return self._view
+
+    # ==================== FILE MANAGEMENT ====================
+
+    def open(self):
+        """Map the table, building it from the database if it is missing or stale"""
+        with self._lock:
+            if self._view is not None:
+                return self._view
+            with self._file_lock():
+                view = self._map_file()
+                if (view is None or self._header(view[0])[2] != self.count_rows()
+                        or self._age(view[0]) >= self.rebuild_interval):
+                    self._build_from_database()
+                else:
+                    self._view = view
+            return self._view
+
+    def _reopen(self, stale_view):
+        with self._lock:
+            if self._view is stale_view:
+                self._view = self._map_file()
+            view = self._view
+        return view if view is not None else self.open()
+
+    def _map_file(self, include_retired=False):
+        """(mmap, slot count) of the file at self.path, or None if it is missing or invalid"""
+        import mmap
+        try:
+            with open(self.path, 'r+b') as f:
+                mm = mmap.mmap(f.fileno(), 0)
+        except (FileNotFoundError, ValueError):
+            return None
+        magic, version, retired, _, slots, _, _, _ = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or (retired and not include_retired):
+            return None
+        return mm, slots
+
+    def _build_from_database(self):
+        rows = [
+            (code.encode('utf-8'), url.encode('utf-8'))
+            for code, url in self.load_rows()
+        ]
+        self._replace(rows, len(rows))
+
+    def _replace(self, records, expected):
+        """Write records to a new file, swap it in and retire the old one"""
+        records = [(code, url) for code, url in records if len(code) <= 0xFF and len(url) <= 0xFFFF]
+        slots = slot_count(max(expected, len(records)))
+        heap = sum(RECORD.size + len(code) + len(url) for code, url in records)
+        size = HEADER_SIZE + slots * SLOT.size + max(MIN_HEAP, heap * 2)
+
+        import mmap
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'w+b') as f:
+            f.truncate(size)
+            mm = mmap.mmap(f.fileno(), size)
+        heap_end = HEADER_SIZE + slots * SLOT.size
+        mask = slots - 1
+        for code, url in records:
+            index = key_hash(code) & mask
+            while SLOT.unpack_from(mm, HEADER_SIZE + index * SLOT.size)[0] != EMPTY:
+                index = (index + 1) & mask
+            SLOT.pack_into(mm, HEADER_SIZE + index * SLOT.size, key_hash(code), heap_end)
+            heap_end = self._write_record(mm, heap_end, code, url)
+        HEADER.pack_into(mm, 0, MAGIC, FORMAT_VERSION, 0, int(time.time()), slots, len(records), 0, heap_end)
+        mm.flush()
+
+        # Other processes may have the current file mapped even if this one
+        # never did (a rebuild on open), so retire whatever is at the path
+        previous = self._map_file(include_retired=True)
+        os.replace(temporary, self.path)
+        if previous is not None:
+            struct.pack_into('<I', previous[0], RETIRED_OFFSET, 1)
+        self._view = (mm, slots)
+        self.rebuilds += 1
+
+    def _writing(self):
+        return _Writer(self)
+
+    def _file_lock(self):
+        return _FileLock(self.path + '.lock')
+
+    # ==================== INTERNALS ====================
+
+    @staticmethod
+    def _header(mm):
+        _, _, retired, _, slots, live, tombstones, heap_end = HEADER.unpack_from(mm, 0)
+        return retired, slots, live, tombstones, heap_end
+
+    @staticmethod
+    def _age(mm):
+        """Seconds since the file was built"""
+        return time.time() - STATE.unpack_from(mm, RETIRED_OFFSET)[1]
+
+    @staticmethod
+    def _set_counts(mm, live, tombstones, heap_end=None):
+        struct.pack_into('<QQ', mm, 24, live, tombstones)
+        if heap_end is not None:
+            struct.pack_into('<Q', mm, 40, heap_end)
+
+    @staticmethod
+    def _write_record(mm, offset, code, url):
+        RECORD.pack_into(mm, offset, len(code), len(url))
+        start = offset + RECORD.size
+        mm[start:start + len(code)] = code
+        mm[start + len(code):start + len(code) + len(url)] = url
+        return start + len(code) + len(url)
+
+    @staticmethod
+    def _find(mm, slots, code):
+        """Slot index holding code, or None"""
+        wanted = key_hash(code)
+        mask = slots - 1
+        index = wanted & mask
+        while True:
+            stored, offset = SLOT.unpack_from(mm, HEADER_SIZE + index * SLOT.size)
+            if stored == EMPTY:
+                return None
+            if stored == wanted:
+                code_length = RECORD.unpack_from(mm, offset)[0]
+                start = offset + RECORD.size
+                if mm[start:start + code_length] == code:
+                    return index
+            index = (index + 1) & mask
+
+    def _insert(self, mm, code, url):
+        """Add one record, growing the file first if needed; returns the current mmap"""
+        _, slots, live, tombstones, heap_end = self._header(mm)
+        if self._find(mm, slots, code) is not None:
+            return mm
+        needed = RECORD.size + len(code) + len(url)
+        if live + tombstones + 1 > slots * MAX_LOAD or heap_end + needed > len(mm):
+            self._replace(self._live_records(mm, slots) + [(code, url)], (live + 1) * 2)
+            return self._view[0]
+
+        # Record first, then the slot's offset, then its hash: a reader that
+        # sees the hash finds a complete record behind it
+        mask = slots - 1
+        wanted = key_hash(code)
+        index = wanted & mask
+        while SLOT.unpack_from(mm, HEADER_SIZE + index * SLOT.size)[0] > TOMBSTONE:
+            index = (index + 1) & mask
+        reused = SLOT.unpack_from(mm, HEADER_SIZE + index * SLOT.size)[0] == TOMBSTONE
+        new_end = self._write_record(mm, heap_end, code, url)
+        struct.pack_into('<Q', mm, HEADER_SIZE + index * SLOT.size + 8, heap_end)
+        struct.pack_into('<Q', mm, HEADER_SIZE + index * SLOT.size, wanted)
+        self._set_counts(mm, live + 1, tombstones - reused, new_end)
+        return mm
+
+    @staticmethod
+    def _live_records(mm, slots):
+        records = []
+        for index in range(slots):
+            stored, offset = SLOT.unpack_from(mm, HEADER_SIZE + index * SLOT.size)
+            if stored > TOMBSTONE:
+                code_length, url_length = RECORD.unpack_from(mm, offset)
+                start = offset + RECORD.size
+                records.append((bytes(mm[start:start + code_length]),
+                                bytes(mm[start + code_length:start + code_length + url_length])))
+        return records
+
+    def close(self):
+        self._view = None
+
+    def stats(self):
+        view = self._view
+        lookups = self.hits + self.misses
+        stats = {
+            'path': self.path,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'rebuilds': self.rebuilds,
+            'rebuild_interval_seconds': self.rebuild_interval
+        }
+        if view is not None:
+            _, slots, live, tombstones, heap_end = self._header(view[0])
+            stats.update({
+                'entries': live,
+                'tombstones': tombstones,
+                'slots': slots,
+                'file_bytes': len(view[0]),
+                'age_seconds': round(self._age(view[0]), 1),
+                'heap_used_bytes': heap_end - HEADER_SIZE - slots * SLOT.size
+            })
+        return stats
+
+
+class _FileLock:
+    """Exclusive flock on a side file, so writers in different processes take turns"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        return False
+
+
+class _Writer:
+    """Thread lock + file lock, remapping first if another process swapped the file"""
+
+    def __init__(self, table):
+        self.table = table
+        self.file_lock = table._file_lock()
+
+    def __enter__(self):
+        table = self.table
+        if table._view is None:
+            table.open()
+        table._lock.acquire()
+        try:
+            self.file_lock.__enter__()
+            mm = table._view[0]
+            if struct.unpack_from('<I', mm, RETIRED_OFFSET)[0]:
+                table._view = table._map_file()
+                if table._view is None:
+                    table._build_from_database()
+            return table._view[0]
+        except BaseException:
+            self.file_lock.__exit__(None, None, None)
+            table._lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.file_lock.__exit__(exc_type, exc, traceback)
+        self.table._lock.release()
+        return False
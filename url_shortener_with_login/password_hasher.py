@@ -0,0 +1,117 @@
+"""
+Bounded pool for password hashing.
+
+generate_password_hash and check_password_hash are deliberately slow
+(scrypt takes ~100 ms of CPU). Run inline, a burst of logins occupies every
+request worker and every core, and redirects queue behind them. The hasher
+runs them on a fixed number of threads (hashlib's KDFs release the GIL, so
+they run in parallel with request threads) and admits at most `max_queue`
+further jobs; beyond that a login or signup fails at once with PoolBusy,
+which the app turns into a 503, instead of waiting in line.
+
+The threads are started on first use, and a forked child starts its own:
+it inherits the parent's executor object but none of its threads, so a
+job submitted there would never run.
+
+The hash method comes from configuration. A successful check of a hash
+made with different parameters also returns a new hash with the current
+ones, so stored hashes are upgraded as users log in.
+"""
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PoolBusy(Exception):
+    """Every hashing thread is busy and the queue is full"""
+
+
+def _reset_after_fork(hasher_ref):
+    hasher = hasher_ref()
+    if hasher is not None:
+        hasher._reset()
+
+
+class PasswordHasher:
+    """Runs password hashing on `size` threads with at most `max_queue` waiting"""
+
+    def __init__(self, size=2, max_queue=8, method='scrypt'):
+        self.size = size
+        self.max_queue = max_queue
+        self.method = method
+        self._reset()
+        self._method_prefix = None
+        self.jobs = 0
+        self.rejected = 0
+        self.rehashed = 0
+        if hasattr(os, 'register_at_fork'):  # not on Windows, which never forks
+            os.register_at_fork(after_in_child=functools.partial(_reset_after_fork, weakref.ref(self)))
+
+    def _reset(self):
+        """Fresh locks and no executor (at start, and in a forked child)"""
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(self.size + self.max_queue)
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='password-hash')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def hash(self, password):
+        """A new hash of password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, password_hash, password):
+        """Returns (valid, new_hash); new_hash is set when password_hash is outdated"""
+        return self._run(self._check, password_hash, password)
+
+    def _check(self, password_hash, password):
+        if not check_password_hash(password_hash, password):
+            return False, None
+        if not self.needs_rehash(password_hash):
+            return True, None
+        with self._lock:
+            self.rehashed += 1
+        return True, generate_password_hash(password, self.method)
+
+    def needs_rehash(self, password_hash):
+        """True if password_hash was not made with the configured method and cost"""
+        if self._method_prefix is None:
+            # 'scrypt' expands to 'scrypt:32768:8:1'; hash once to learn the full form
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy(f'{self.size + self.max_queue} password checks already in progress')
+        try:
+            with self._lock:
+                self.jobs += 1
+            return self._get_executor().submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def close(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'max_queue': self.max_queue,
+                'method': self.method,
+                'jobs': self.jobs,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed
+            }